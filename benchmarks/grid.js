@@ -0,0 +1,149 @@
+// grid.js
+//
+// Measures the windowed image grid of functionality.js on the images listed in a JSON
+// file, as written by grid.py: renders the grid and scrolls through all of it in
+// 120px steps. The DOM is a stub with a fixed layout (1600px wide list, 200px columns,
+// 192px wide images and 38px of margin and caption per cell), so this measures the
+// script work and the number of nodes, not rendering or memory in a browser.
+//
+// Usage:
+//     node benchmarks/grid.js images.json src/staticgallerybuilder/templates/functionality.js
+
+const fs = require("fs");
+
+const [itemsPath, scriptPath] = process.argv.slice(2);
+const LIST_WIDTH = 1600;
+const COLUMN_WIDTH = 200;
+const IMAGE_WIDTH = 192;
+const CHROME = 38;
+const VIEWPORT = 1000;
+const STEP = 120;
+
+let created = 0;
+let scrollTop = 0;
+
+function element(tag) {
+  created++;
+  return {
+    tag: tag,
+    children: [],
+    dataset: new Proxy(
+      {},
+      {
+        set(target, key, value) {
+          target[key] = String(value);
+          return true;
+        },
+      },
+    ),
+    style: {},
+    classList: { add() {}, remove() {} },
+    hidden: false,
+    appendChild(child) {
+      this.children.push(child);
+      child.parent = this;
+      return child;
+    },
+    remove() {
+      this.parent.children.splice(this.parent.children.indexOf(this), 1);
+    },
+    set innerHTML(value) {
+      this.children = [];
+      if (value.startsWith("<figure")) {
+        const figure = this.appendChild(element("figure"));
+        figure.appendChild(element("img"));
+        figure.appendChild(element("figcaption"));
+      }
+    },
+    get firstChild() {
+      return this.children[0];
+    },
+    get lastChild() {
+      return this.children.at(-1);
+    },
+    get clientWidth() {
+      return LIST_WIDTH;
+    },
+    get offsetWidth() {
+      return COLUMN_WIDTH;
+    },
+    getBoundingClientRect() {
+      if (this.tag === "img") return { width: IMAGE_WIDTH, height: IMAGE_WIDTH };
+      return { width: COLUMN_WIDTH, height: IMAGE_WIDTH + CHROME };
+    },
+  };
+}
+
+const imagelist = element("div");
+imagelist.getBoundingClientRect = () => ({ top: -scrollTop });
+global.window = { innerHeight: VIEWPORT, addEventListener() {}, matchMedia: () => ({ matches: false, addEventListener() {} }) };
+global.document = { querySelector: () => null, getElementById: (id) => (id === "imagelist" ? imagelist : null), createElement: element };
+global.requestAnimationFrame = (callback) => callback();
+global.localStorage = { getItem: () => null };
+
+const source = fs.readFileSync(scriptPath, "utf8").replace(/new PhotoGallery\(\);?\s*$/, "");
+const PhotoGallery = new Function(`${source}\nreturn PhotoGallery;`)();
+PhotoGallery.prototype.init = () => {};
+PhotoGallery.prototype.sortShown = () => {};
+
+const gallery = new PhotoGallery();
+gallery.shown = JSON.parse(fs.readFileSync(itemsPath, "utf8"));
+const count = gallery.shown.length;
+const nodesBefore = created;
+
+let start = process.hrtime.bigint();
+gallery.updateImageList(true);
+const initial = Number(process.hrtime.bigint() - start) / 1e6;
+if (!gallery.virtual) throw new Error(`${count} images do not exceed the threshold of the windowed grid`);
+
+// the expected layout, computed independently from the image dimensions
+const columns = LIST_WIDTH / COLUMN_WIDTH;
+const tops = [0];
+for (let index = 0; index < count; index += columns) {
+  const row = gallery.shown.slice(index, index + columns);
+  const ratio = Math.max(...row.map((item) => (item.w && item.h ? item.h / item.w : 1)));
+  tops.push(tops.at(-1) + CHROME + IMAGE_WIDTH * ratio);
+}
+const height = tops.at(-1);
+let errors = 0;
+if (Math.abs(parseFloat(imagelist.style.height) - height) > 0.01) errors++;
+
+let rewrites = 0;
+const columnContent = gallery.columnContent;
+gallery.columnContent = (...args) => {
+  rewrites++;
+  return columnContent(...args);
+};
+let steps = 0;
+start = process.hrtime.bigint();
+for (scrollTop = 0; scrollTop < height; scrollTop += STEP) {
+  gallery.virtualFrame = null;
+  gallery.scheduleWindow();
+  steps++;
+}
+const scrolling = Number(process.hrtime.bigint() - start) / 1e6;
+
+// after the last step, the rendered rows must cover the viewport with the right images
+const visible = gallery.virtual.pool
+  .filter((column) => !column.hidden)
+  .map((column) => ({ order: Number(column.style.order), img: column.firstChild.firstChild }))
+  .sort((a, b) => a.order - b.order);
+const first = Number(visible[0].img.dataset.index);
+visible.forEach((column, position) => {
+  const item = gallery.shown[first + position];
+  if (Number(column.img.dataset.index) !== first + position || column.img.src !== item.msrc) errors++;
+  if (item.w && item.h && column.img.style.aspectRatio !== `${item.w} / ${item.h}`) errors++;
+});
+const firstRow = first / columns;
+if (Math.abs(parseFloat(gallery.virtual.container.style.transform.slice("translateY(".length)) - tops[firstRow]) > 0.01) errors++;
+if (tops[firstRow] > scrollTop - STEP || tops[firstRow + visible.length / columns] < Math.min(height, scrollTop - STEP + VIEWPORT)) errors++;
+
+const rowHeights = new Set(tops.slice(1).map((top, row) => Math.round(top - tops[row])));
+console.log(`${count} images in ${tops.length - 1} rows of ${rowHeights.size} different heights, grid ${Math.round(height)}px tall`);
+console.log(`initial render     ${initial.toFixed(1)} ms`);
+console.log(`scrolling          ${steps} steps of ${STEP}px in ${scrolling.toFixed(1)} ms`);
+console.log(`cells rewritten    ${rewrites}`);
+console.log(`pooled columns     ${gallery.virtual.pool.length}`);
+console.log(`nodes created      ${created - nodesBefore} (a full render creates ${4 * count})`);
+console.log(`layout errors      ${errors}`);
+process.exit(errors ? 1 : 0);
@@ -0,0 +1,57 @@
+"""
+grid.py
+
+Benchmarks the windowed image grid of the gallery page on a synthetic folder: generates
+the folder, reads the image dimensions as a build does and runs grid.js with Node.js,
+which renders the grid with a stubbed DOM, scrolls through it and checks that the rows are
+sized from the aspect ratios of their images.
+
+Usage:
+    python benchmarks/grid.py --images 50000
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from make_gallery import make_gallery
+
+from staticgallerybuilder.modules.dirindex import DirectoryScanner
+from staticgallerybuilder.modules.generate_html import BuildState, get_image_info
+from staticgallerybuilder.modules.metrics import Metrics
+from staticgallerybuilder.modules.quarantine import Quarantine
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(BENCHMARKS, "..", "src", "staticgallerybuilder", "templates", "functionality.js")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the windowed image grid.")
+    parser.add_argument("--images", type=int, default=50000, help="number of images in the folder (default 50000)")
+    args = parser.parse_args()
+    node = shutil.which("node")
+    if node is None:
+        sys.exit("Node.js is required to run the grid script")
+
+    with tempfile.TemporaryDirectory() as root:
+        folder = os.path.join(root, "folder")
+        make_gallery(folder, args.images)
+        metrics = Metrics()
+        state = BuildState(metrics=metrics, quarantine=Quarantine(root + "/", counters=metrics.counters), scanner=DirectoryScanner(metrics.operations))
+        items = []
+        for item in sorted(os.listdir(folder)):
+            info = get_image_info(state, item, folder, False)
+            if info is not None:
+                items.append({"name": item, "msrc": f"/.thumbnails/folder/{item}", "w": info.w, "h": info.h, "tagtitle": ""})
+        path = os.path.join(root, "images.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(items, f)
+        sys.exit(subprocess.run([node, os.path.join(BENCHMARKS, "grid.js"), path, SCRIPT], check=False).returncode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+make_gallery.py
+
+Generates a synthetic gallery for the benchmarks: small JPEG files with EXIF data and the
+aspect ratios of common camera, phone and panorama formats, optionally with RAW siblings
+and XMP sidecars. The images are tiny, so generating tens of thousands takes seconds.
+
+Usage:
+    python benchmarks/make_gallery.py /tmp/bench --images 10000
+    python benchmarks/make_gallery.py /tmp/bench --images 50000 --folders 50 --raw-share 0.2 --sidecar-share 0.1
+"""
+
+import argparse
+import io
+import os
+import random
+import shutil
+
+from PIL import Image
+
+# width:height of the generated images
+ASPECT_RATIOS = [(3, 2), (2, 3), (4, 3), (3, 4), (16, 9), (9, 16), (1, 1), (3, 1), (5, 4)]
+# long side of the generated images in pixels
+LONG_SIDE = 60
+SIDECAR = """<x:xmpmeta xmlns:x="adobe:ns:meta/">
+ <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
+  <rdf:Description xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:lr="http://ns.adobe.com/lightroom/1.0/">
+   <dc:subject><rdf:Bag><rdf:li>{tag}</rdf:li></rdf:Bag></dc:subject>
+   <lr:hierarchicalSubject><rdf:Bag><rdf:li>places|{tag}</rdf:li></rdf:Bag></lr:hierarchicalSubject>
+  </rdf:Description>
+ </rdf:RDF>
+</x:xmpmeta>
+"""
+
+
+def encode(width: int, height: int, color: tuple[int, int, int]) -> bytes:
+    """
+    Encodes a plain JPEG image with camera EXIF data.
+    """
+    img = Image.new("RGB", (width, height), color)
+    exif = Image.Exif()
+    exif[0x010F] = "SONY"  # Make
+    exif[0x0110] = "ILCE-7M3"  # Model
+    exif[0x0132] = "2024:06:01 12:00:00"  # DateTime
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=80, exif=exif)
+    return buffer.getvalue()
+
+
+def make_gallery(root: str, images: int, folders: int = 1, raw_share: float = 0.0, sidecar_share: float = 0.0, seed: int = 0) -> list[str]:
+    """
+    Writes a synthetic gallery, replacing an existing one at root.
+
+    Args:
+        root (str): The root directory of the gallery.
+        images (int): The number of images.
+        folders (int): The number of folders the images are spread over. With one folder
+            all images are written to root itself.
+        raw_share (float): Share of the images with an (empty) .NEF sibling.
+        sidecar_share (float): Share of the images with an XMP sidecar.
+        seed (int): Seed of the random choices, so runs are reproducible.
+
+    Returns:
+        list[str]: The folders that were written.
+    """
+    rng = random.Random(seed)
+    blobs = []
+    for w, h in ASPECT_RATIOS:
+        scale = LONG_SIDE / max(w, h)
+        blobs.append(encode(round(w * scale), round(h * scale), (rng.randrange(256), rng.randrange(256), rng.randrange(256))))
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    paths = [root] if folders <= 1 else [os.path.join(root, f"folder-{number:04d}") for number in range(folders)]
+    for path in paths:
+        os.makedirs(path, exist_ok=True)
+    for number in range(images):
+        folder = paths[number % len(paths)]
+        name = f"IMG_{number:06d}"
+        with open(os.path.join(folder, f"{name}.jpg"), "wb") as f:
+            f.write(rng.choice(blobs))
+        if rng.random() < raw_share:
+            open(os.path.join(folder, f"{name}.NEF"), "wb").close()
+        if rng.random() < sidecar_share:
+            with open(os.path.join(folder, f"{name}.jpg.xmp"), "w", encoding="utf-8") as f:
+                f.write(SIDECAR.format(tag=f"place-{rng.randrange(50)}"))
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic gallery for the benchmarks.")
+    parser.add_argument("root", help="root directory of the gallery, replaced if it exists")
+    parser.add_argument("--images", type=int, default=10000, help="number of images (default 10000)")
+    parser.add_argument("--folders", type=int, default=1, help="number of folders the images are spread over (default 1)")
+    parser.add_argument("--raw-share", type=float, default=0.0, help="share of images with a RAW sibling")
+    parser.add_argument("--sidecar-share", type=float, default=0.0, help="share of images with an XMP sidecar")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random choices")
+    args = parser.parse_args()
+    paths = make_gallery(args.root, args.images, args.folders, args.raw_share, args.sidecar_share, args.seed)
+    print(f"Wrote {args.images} images in {len(paths)} folders to {args.root}")
+
+
+if __name__ == "__main__":
+    main()
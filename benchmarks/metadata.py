@@ -0,0 +1,91 @@
+"""
+metadata.py
+
+Benchmarks reading and writing the metadata of a folder of images: loading a file in the
+old unversioned format (migration and per-field validation), loading a versioned file (the
+trusted fast path) and serialising it, with the standard library codec and with orjson if
+it is installed. Also checks that both codecs write identical files.
+
+Usage:
+    python benchmarks/metadata.py --images 10000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from make_gallery import make_gallery
+
+from staticgallerybuilder.modules import jsonutil
+from staticgallerybuilder.modules.dirindex import DirectoryScanner
+from staticgallerybuilder.modules.generate_html import BuildState, get_image_info, initialize_metadata
+from staticgallerybuilder.modules.metrics import Metrics
+from staticgallerybuilder.modules.quarantine import Quarantine
+
+
+def best_of(func, repeat: int) -> float:
+    """
+    Returns the fastest of repeat runs of func in milliseconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark loading and writing folder metadata.")
+    parser.add_argument("--images", type=int, default=10000, help="number of images in the folder (default 10000)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement, the fastest is reported (default 5)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        folder = os.path.join(root, "folder")
+        make_gallery(folder, args.images)
+        metrics = Metrics()
+        state = BuildState(metrics=metrics, quarantine=Quarantine(root + "/", counters=metrics.counters), scanner=DirectoryScanner(metrics.operations))
+
+        metadata = initialize_metadata(folder)
+        start = time.perf_counter()
+        for item in sorted(os.listdir(folder)):
+            if item.endswith(".jpg"):
+                info = get_image_info(state, item, folder, False)
+                if info is not None:
+                    info.name = info.title = item
+                    metadata.images[item] = info
+        extraction = (time.perf_counter() - start) * 1000
+        print(f"{len(metadata.images)} images, metadata extracted from the image files in {extraction:.0f} ms")
+
+        content = metadata.to_dict()
+        legacy = dict(content)
+        legacy.pop("version")
+        codecs = [False, True] if jsonutil.ORJSON else [False]
+        outputs = {}
+        print(f"{'codec':<8} {'legacy load':>12} {'versioned load':>15} {'serialise':>10}")
+        for use_orjson in codecs:
+            jsonutil.ORJSON = use_orjson
+            path = os.path.join(folder, ".metadata.json")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(jsonutil.dumps(legacy))
+            legacy_load = best_of(lambda: initialize_metadata(folder), args.repeat)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(jsonutil.dumps(content))
+            versioned_load = best_of(lambda: initialize_metadata(folder), args.repeat)
+            serialise = best_of(lambda: jsonutil.dumps(metadata.to_dict()), args.repeat)
+            outputs[use_orjson] = (jsonutil.dumps(content), jsonutil.dumps(content, indent=False))
+            print(f"{'orjson' if use_orjson else 'json':<8} {legacy_load:>10.1f}ms {versioned_load:>13.1f}ms {serialise:>8.1f}ms")
+        if len(outputs) == 2:
+            identical = outputs[False] == outputs[True]
+            print(f"identical output of both codecs: {'yes' if identical else 'NO'}")
+            if not identical:
+                sys.exit(1)
+        else:
+            print("orjson is not installed, only the standard library codec was measured")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+scan.py
+
+Benchmarks scanning the folders of a gallery: builds a synthetic gallery with RAW siblings
+and XMP sidecars twice, once from scratch and once without changes, and prints per build
+the wall time, the directory operations the builder counted (scandir calls, entries listed,
+lookups answered from the directory index and folders prefetched) and the filesystem calls
+the main process actually made. With --latency, every filesystem call of the main process
+is delayed to simulate a network filesystem.
+
+Usage:
+    python benchmarks/scan.py --images 10000 --folders 100 --latency 1
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable
+from typing import Any
+
+from make_gallery import make_gallery
+
+from staticgallerybuilder.main import Builder, __version__
+from staticgallerybuilder.modules.argumentparser import parse_arguments
+
+# filesystem calls counted in the main process; os.path.exists, isfile and isdir call os.stat
+CALLS = ["stat", "lstat", "scandir", "listdir"]
+OPERATIONS = ["scandir", "entries", "lookups", "prefetched"]
+
+
+def counting(name: str, func: Callable, calls: Counter[str], lock: threading.Lock, latency: float) -> Callable:
+    """
+    Wraps an os function to count its calls and delay each by latency seconds.
+    """
+
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with lock:
+            calls[name] += 1
+        if latency:
+            time.sleep(latency)
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark scanning the folders of a gallery.")
+    parser.add_argument("--images", type=int, default=10000, help="number of images (default 10000)")
+    parser.add_argument("--folders", type=int, default=100, help="number of folders the images are spread over (default 100)")
+    parser.add_argument("--raw-share", type=float, default=0.2, help="share of images with a RAW sibling (default 0.2)")
+    parser.add_argument("--sidecar-share", type=float, default=0.2, help="share of images with an XMP sidecar (default 0.2)")
+    parser.add_argument("--latency", type=float, default=0.0, help="delay of every filesystem call of the main process in milliseconds")
+    parser.add_argument("--theme-path", help="CSS theme of the gallery, passed on to the builder", metavar="PATH")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        make_gallery(root, args.images, args.folders, args.raw_share, args.sidecar_share)
+        argv = ["-p", root, "-w", f"file://{root}", "-t", "Benchmark", "-n"]
+        if args.theme_path:
+            argv += ["--theme-path", args.theme_path]
+        options = parse_arguments(__version__, argv)
+        calls: Counter[str] = Counter()
+        lock = threading.Lock()
+        originals = {name: getattr(os, name) for name in CALLS}
+        rows = []
+        with Builder(options, logo="<svg xmlns='http://www.w3.org/2000/svg'/>") as builder:
+            for label in ["cold", "unchanged"]:
+                calls.clear()
+                for name in CALLS:
+                    setattr(os, name, counting(name, originals[name], calls, lock, args.latency / 1000))
+                try:
+                    result = builder.build()
+                finally:
+                    for name, func in originals.items():
+                        setattr(os, name, func)
+                if not result.success:
+                    raise SystemExit(f"build failed: {result.error}")
+                operations = result.metrics.operations
+                rows.append(
+                    f"{label:<10} {result.duration:>7.2f}s " + " ".join(f"{operations[name]:>10}" for name in OPERATIONS) + " " + " ".join(f"{calls[name]:>8}" for name in CALLS)
+                )
+        print(f"{args.images} images in {args.folders} folders, {args.latency:g} ms per filesystem call")
+        print(f"{'build':<10} {'time':>8} " + " ".join(f"{name:>10}" for name in OPERATIONS) + " " + " ".join(f"{name:>8}" for name in CALLS))
+        print("\n".join(rows))
+
+
+if __name__ == "__main__":
+    main()
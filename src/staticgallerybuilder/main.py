@@ -1,25 +1,45 @@
 #!/usr/bin/env python3
+import hashlib
+import json
 import logging
 import os
 import re
 import shutil
+import signal
 import sys
+import threading
+import time
 import urllib.error
 import urllib.parse
 import urllib.request
+from dataclasses import dataclass, field
+from functools import partial
 from importlib.metadata import version
 from multiprocessing import Pool, freeze_support
 from pathlib import Path
 
 from jsmin import jsmin
-from PIL import Image, ImageOps
+from PIL import Image
 from tqdm.auto import tqdm
 
+from .modules import generate_html
 from .modules.argumentparser import Args, parse_arguments
-from .modules.generate_html import list_folder
-from .modules.logger import rotate_log_file, setup_logger
-from .modules.svg_handling import extract_colorscheme, icons, webmanifest
-from .modules.util import resource_path
+from .modules.benchmark import benchmark_presets
+from .modules.colorprofile import downscale
+from .modules.compression import BROTLI, precompress_file, remove_precompressed, static_files
+from .modules.daemon import serve
+from .modules.dirindex import DirectoryScanner
+from .modules.encoder import PRESETS, make_thumbnail, save_thumbnail
+from .modules.generate_html import BuildState, list_folder
+from .modules.lockfile import acquire_lock, holds_lock, release_lock
+from .modules.logger import init_worker_logger, rotate_log_file, setup_logger, worker_logger_args
+from .modules.metrics import Metrics, measured, write_metrics
+from .modules.placeholder import make_placeholder, thumbnail_placeholder
+from .modules.quarantine import Failure, Quarantine
+from .modules.rawpreview import open_image
+from .modules.scheduler import default_budget, estimate, schedule
+from .modules.svg_handling import extract_colorscheme, icons, service_worker, webmanifest
+from .modules.util import copy_if_changed, resource_path, write_if_changed
 
 # fmt: off
 # Constants
@@ -31,10 +51,20 @@ RAW_EXTENSIONS = [
     ".rw2", ".rwz", ".sr2", ".srf", ".srw", ".tif", ".tiff", ".x3f"
 ]
 IMG_EXTENSIONS = [".jpg", ".jpeg", ".png"]
+FINGERPRINTED_FILES = [
+    "functionality.min.js", "global.css", "theme.css", "theme-dark.css", "pswp/photoswipe.css",
+    "pswp/default-skin/default-skin.css", "pswp/photoswipe.min.js", "pswp/photoswipe-ui-default.min.js"
+]
 NOT_LIST = ["*/Galleries/*", "Archives"]
 # fmt: on
+# days fingerprinted files are kept after a build stopped referencing them, so pages cached
+# by browsers and CDNs before a deploy keep working
+FINGERPRINT_RETENTION_DAYS = 30
+# static files that icons() renders in the theme colours instead
+RENDERED_STATIC_FILES = [os.path.join("icons", "icon.svg")]
 
 logger = logging.getLogger("defaultlogger")
+thumbnail_logger = logging.getLogger("defaultlogger.thumbnails")
 
 __version__ = version("StaticGalleryBuilder")
 
@@ -89,7 +119,7 @@ def handle_theme_icon(themepath: str, dest: str) -> None:
 
     if "url" in foldericon:
         logger.info("foldericon in theme file, using it")
-        shutil.copyfile(themepath, dest)
+        write_if_changed(dest, theme)
     else:
         with open(os.path.join(Path(themepath).parent, foldericon), encoding="utf-8") as f:
             logger.info("Reading foldericon svg")
@@ -103,14 +133,98 @@ def handle_theme_icon(themepath: str, dest: str) -> None:
             logger.info("replaced colors in svg")
 
         svg = urllib.parse.quote(svg)
-        with open(dest, "x", encoding="utf-8") as f:
-            logger.info("writing theme file")
-            f.write(themehead + '\n.foldericon {\n  content: url("data:image/svg+xml,' + svg + '");\n}\n' + themetail)
+        if write_if_changed(dest, themehead + '\n.foldericon {\n  content: url("data:image/svg+xml,' + svg + '");\n}\n' + themetail):
+            logger.info("wrote theme file", extra={"path": dest})
+
+
+def fingerprinted_name(name: str, digest: str) -> str:
+    base, ext = os.path.splitext(name)
+    if base.endswith(".min"):
+        base, ext = base.removesuffix(".min"), ".min" + ext
+    return f"{base}.{digest}{ext}"
+
+
+def prune_fingerprinted_files(static_dir: str, assets: dict[str, str]) -> None:
+    """
+    Removes fingerprinted files that no build has referenced for FINGERPRINT_RETENTION_DAYS.
+    The time a file stopped being referenced is kept in .superseded.json.
+
+    Parameters:
+    -----------
+    static_dir : str
+        Path to the .static directory.
+    assets : dict[str, str]
+        The fingerprinted files of this build.
+    """
+    superseded_path = os.path.join(static_dir, ".superseded.json")
+    try:
+        with open(superseded_path, encoding="utf-8") as f:
+            superseded: dict[str, float] = json.load(f)
+    except (OSError, ValueError):
+        superseded = {}
+    current = set(assets.values())
+    now = time.time()
+    found = {}
+    for name in FINGERPRINTED_FILES:
+        pattern = re.compile(re.escape(fingerprinted_name(os.path.basename(name), "@")).replace("@", "[0-9a-f]{10}") + "$")
+        folder = os.path.dirname(name)
+        try:
+            candidates = os.listdir(os.path.join(static_dir, folder))
+        except FileNotFoundError:
+            continue
+        for candidate in candidates:
+            path = os.path.join(folder, candidate)
+            if pattern.match(candidate) and path not in current:
+                found[path] = superseded.get(path, now)
+    for path, since in list(found.items()):
+        if now - since > FINGERPRINT_RETENTION_DAYS * 86400:
+            logger.info("removing superseded static file", extra={"file": path, "since": since})
+            os.remove(os.path.join(static_dir, path))
+            remove_precompressed(os.path.join(static_dir, path))
+            del found[path]
+    if found:
+        write_if_changed(superseded_path, json.dumps(found, indent=4, sort_keys=True))
+    elif os.path.exists(superseded_path):
+        os.remove(superseded_path)
+
+
+def fingerprint_static_files(static_dir: str) -> dict[str, str]:
+    """
+    Create content-hashed copies of the static files referenced by the HTML templates
+    and write an asset manifest mapping the plain names to the hashed ones. Copies of
+    earlier builds are kept for a while, since cached pages may still reference them.
+
+    Parameters:
+    -----------
+    static_dir : str
+        Path to the .static directory.
+
+    Returns:
+    --------
+    dict[str, str]
+        Mapping of plain file names to fingerprinted file names, relative to static_dir.
+    """
+    assets = {}
+    for name in FINGERPRINTED_FILES:
+        path = os.path.join(static_dir, name)
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:10]
+        hashed = fingerprinted_name(name, digest)
+        copy_if_changed(path, os.path.join(static_dir, hashed))
+        assets[name] = hashed
+    if write_if_changed(os.path.join(static_dir, "assets.json"), json.dumps(assets, indent=4)):
+        logger.info("wrote asset manifest", extra={"assets": assets})
+    prune_fingerprinted_files(static_dir, assets)
+    return assets
 
 
 def copy_static_files(_args: Args) -> bool:
     """
-    Copy static files to the root directory.
+    Copy static files to the root directory and fingerprint them. Only files whose content
+    changed are written, so the others keep their modification time and their
+    precompressed siblings stay valid.
 
     Parameters:
     -----------
@@ -119,40 +233,56 @@ def copy_static_files(_args: Args) -> bool:
     """
     static_dir = os.path.join(_args.root_directory, ".static")
     darktheme = False
-    if os.path.exists(static_dir):
-        print("Removing existing .static folder...")
-        logger.info("removing existing .static folder")
-        shutil.rmtree(static_dir)
 
     print("Copying static files...")
     logger.info("copying static files")
-    shutil.copytree(STATIC_FILES_DIR, static_dir, dirs_exist_ok=True)
+    for dirpath, _, filenames in os.walk(STATIC_FILES_DIR):
+        dest = os.path.join(static_dir, os.path.relpath(dirpath, STATIC_FILES_DIR))
+        os.makedirs(dest, exist_ok=True)
+        for name in filenames:
+            if os.path.relpath(os.path.join(dirpath, name), STATIC_FILES_DIR) not in RENDERED_STATIC_FILES:
+                copy_if_changed(os.path.join(dirpath, name), os.path.join(dest, name))
 
     theme = os.path.splitext(os.path.abspath(_args.theme_path))[0]
     darktheme_path = f"{theme}-dark.css"
+    darktheme_dest = os.path.join(static_dir, "theme-dark.css")
     if os.path.exists(darktheme_path):
-        handle_theme_icon(darktheme_path, os.path.join(static_dir, "theme-dark.css"))
+        handle_theme_icon(darktheme_path, darktheme_dest)
         darktheme = True
+    elif os.path.exists(darktheme_dest):
+        logger.info("removing dark theme of the previous theme")
+        os.remove(darktheme_dest)
+        remove_precompressed(darktheme_dest)
     handle_theme_icon(_args.theme_path, os.path.join(static_dir, "theme.css"))
 
     logger.info("minifying javascript")
     with open(resource_path("templates", "functionality.js"), encoding="utf-8") as js_file:
-        with open(os.path.join(static_dir, "functionality.min.js"), "w+", encoding="utf-8") as min_file:
-            min_file.write(jsmin(js_file.read()))
+        write_if_changed(os.path.join(static_dir, "functionality.min.js"), jsmin(js_file.read()))
+
+    _args.assets = fingerprint_static_files(static_dir)
 
     return darktheme
 
 
-def generate_thumbnail(arguments: tuple[str, str, str]) -> None:
+def generate_thumbnail(arguments: tuple[str, str, str, int], preset: str = "default") -> tuple[str, str, str, str, int] | Failure | None:
     """
-    Generate a thumbnail for a given image.
+    Generate a thumbnail for a given image, along with its low-quality placeholder.
 
     Parameters:
     -----------
-    arguments : tuple[str, str, str, bool]
-        A tuple containing the folder, item, root directory, and regenerate thumbnails flag.
+    arguments : tuple[str, str, str, int]
+        A tuple containing the folder, item, root directory and pixel count of the image.
+    preset : str
+        The name of the encoder preset.
+
+    Returns:
+    --------
+    tuple[str, str, str, str, int] | Failure | None
+        The folder, item, placeholder data URI, average colour and bytes written (0 if the
+        thumbnail already existed), a Failure if the image could not be read, or None if the
+        existing thumbnail could not be read.
     """
-    folder, item, root_directory = arguments
+    folder, item, root_directory, _ = arguments
     image = os.path.join(folder, item)
     path = os.path.join(root_directory, ".thumbnails", folder.removeprefix(root_directory), item) + ".jpg"
     oldpath = os.path.join(root_directory, ".thumbnails", folder.removeprefix(root_directory), os.path.splitext(item)[0]) + ".jpg"
@@ -162,114 +292,557 @@ def generate_thumbnail(arguments: tuple[str, str, str]) -> None:
         except FileNotFoundError:
             pass
     if not os.path.exists(path):
-        logger.info("generating thumbnail for %s", item, extra={"path": image})
+        thumbnail_logger.info("generating thumbnail for %s", item, extra={"path": image})
         try:
-            with Image.open(image) as imgfile:
-                imgrgb = imgfile.convert("RGB")
-                img = ImageOps.exif_transpose(imgrgb)
-                img.thumbnail((512, 512))
-                img.save(path, "JPEG", quality=50, optimize=True, mode="RGB", subsampling=2)
-        except OSError:
-            logger.error("Failed to generate thumbnail for %s", item, extra={"path": image})
-            print(f"Failed to generate thumbnail for {image}")
-            return
-    else:
-        logger.debug("thumbnail already exists for %s", item, extra={"path": image})
+            with open_image(image, 512) as imgfile:
+                img = make_thumbnail(imgfile, PRESETS[preset])
+                # written under a temporary name, so an interrupted build leaves no truncated thumbnail
+                save_thumbnail(img, f"{path}.tmp", PRESETS[preset])
+                os.replace(f"{path}.tmp", path)
+                return folder, item, *make_placeholder(img), os.path.getsize(path)
+        except OSError as e:
+            thumbnail_logger.error("Failed to generate thumbnail for %s", item, extra={"path": image, "error": str(e)})
+            return Failure(image, str(e))
+    thumbnail_logger.debug("thumbnail already exists for %s", item, extra={"path": image})
+    try:
+        return folder, item, *thumbnail_placeholder(path), 0
+    except OSError:
+        thumbnail_logger.error("Failed to read thumbnail for %s", item, extra={"path": path})
+        return None
 
 
-def builder(args) -> None:
-    """
-    Main function to process images and generate a static image hosting website.
+def generate_display_images(arguments: tuple[str, list[tuple[int, str]], int]) -> int | Failure:
     """
-    thumbnails: list[tuple[str, str, str]] = []
+    Generate the downscaled copies of an image shown in the viewer, decoding the original once.
 
-    args, raw = init_globals(args, RAW_EXTENSIONS)
-    thumbdir = os.path.join(args.root_directory, ".thumbnails")
-    ERROR = False
+    Parameters:
+    -----------
+    arguments : tuple[str, list[tuple[int, str]], int]
+        The image path, the (long edge, output path) pairs to produce and the pixel count of the image.
 
+    Returns:
+    --------
+    int | Failure
+        The bytes written, or the failure.
+    """
+    image, sizes, _ = arguments
+    sizes = sorted(sizes, reverse=True)
+    thumbnail_logger.info("generating display images for %s", image, extra={"sizes": [size for size, _ in sizes]})
     try:
-        Path(LOCKFILE).touch()
-        logger.info("starting builder", extra={"version": __version__, "arguments": args})
+        with open_image(image, sizes[0][0]) as imgfile:
+            # JPEGs are decoded at a reduced scale that still covers the largest copy
+            imgfile.draft("RGB", (sizes[0][0], sizes[0][0]))
+            # RGB images keep their profile, so wide-gamut originals are shown as such
+            img, icc_profile = downscale(imgfile, sizes[0][0], Image.Resampling.LANCZOS, None, keep_rgb_profile=True)
+            written = 0
+            for size, path in sizes:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                img.thumbnail((size, size), Image.Resampling.LANCZOS)
+                img.save(f"{path}.tmp", "JPEG", quality=85, optimize=True, progressive=True, icc_profile=icc_profile)
+                os.replace(f"{path}.tmp", path)
+                written += os.path.getsize(path)
+            return written
+    except OSError as e:
+        thumbnail_logger.error("Failed to generate display images for %s", image, extra={"path": image, "error": str(e)})
+        return Failure(image, str(e))
+
+
+def precompress(state: BuildState, pool, _args: Args):
+    """
+    Queue precompression of all generated and static text files on the worker pool.
 
-        logger.info("getting logo from sorogon.eu")
-        req = urllib.request.Request("https://files.sorogon.eu/logo.svg")
-        try:
-            with urllib.request.urlopen(req, timeout=10) as res:
-                logo = res.read().decode()
-
-            if logo.startswith("<?xml"):
-                logo = re.sub(r"<\?xml.+\?>", "", logo).strip()
-            if logo.startswith("<!--"):
-                logo = re.sub(r"<!--.+-->", "", logo).strip()
-            logo = logo.replace("\n", " ")
-            logo = " ".join(logo.split())
-        except urllib.error.URLError:
-            logo = "&lt;/srgn&gt;"
-
-        if args.reread_metadata:
-            logger.warning("reread metadata flag is set to true, all image metadata will be reread")
-        if args.regenerate_thumbnails:
-            logger.warning("regenerate thumbnails flag is set to true, all thumbnails will be regenerated")
-            if os.path.exists(thumbdir):
-                logger.info("removing old thumbnails folder")
-                shutil.rmtree(thumbdir)
-        os.makedirs(thumbdir, exist_ok=True)
-
-        args.darktheme = copy_static_files(args)
-        icons(args)
-
-        if args.generate_webmanifest:
-            print("Generating webmanifest...")
-            webmanifest(args)
-
-        if args.non_interactive_mode:
-            logger.info("generating HTML files")
-            print("Generating HTML files...")
-            thumbnails = list_folder(args.root_directory, args.site_title, args, raw, __version__, logo)
-            with Pool(os.cpu_count()) as pool:
-                logger.info("generating thumbnails")
-                print("Generating thumbnails...")
-                pool.map(generate_thumbnail, thumbnails)
+    Parameters:
+    -----------
+    state : BuildState
+        The state of the build.
+    pool : multiprocessing.pool.Pool
+        The worker pool.
+    _args : Args
+        Parsed command-line arguments.
+
+    Returns:
+    --------
+    multiprocessing.pool.AsyncResult | None
+        The pending result, or None if precompression is disabled.
+    """
+    if not _args.precompress:
+        return None
+    files = state.outputs + static_files(os.path.join(_args.root_directory, ".static"))
+    logger.info("precompressing files", extra={"count": len(files), "brotli": BROTLI})
+    if not BROTLI:
+        logger.warning("brotli module not available, only writing gzip files")
+    return pool.map_async(precompress_file, files, chunksize=16)
+
+
+def store_placeholders(state: BuildState, pool, results: list[tuple[str, str, str, str, int] | Failure | None], _args: Args) -> None:
+    """
+    Write the folders that waited for the placeholders returned by the thumbnail jobs and
+    precompress the files written for them.
+
+    Parameters:
+    -----------
+    state : BuildState
+        The state of the build.
+    pool : multiprocessing.pool.Pool
+        The worker pool.
+    results : list[tuple[str, str, str, str, int] | Failure | None]
+        The results of generate_thumbnail.
+    _args : Args
+        Parsed command-line arguments.
+    """
+    written = len(state.outputs)
+    folders = len(state.pending)
+    generate_html.finish_pending(state, results)
+    changed = state.outputs[written:]
+    logger.info("stored placeholders", extra={"folders": folders})
+    if changed and _args.precompress:
+        state.metrics.counters["bytes_written"] += sum(pool.map(precompress_file, changed))
+
+
+def record_results(state: BuildState, results: list[tuple[str, str, str, str, int] | Failure | None], display: list[int | Failure], compressed: list[int]) -> None:
+    """
+    Add the outcome of the jobs that ran on the worker pool to the build metrics and
+    quarantine the images that failed.
+
+    Parameters:
+    -----------
+    state : BuildState
+        The state of the build.
+    results : list[tuple[str, str, str, str, int] | Failure | None]
+        The results of generate_thumbnail.
+    display : list[int | Failure]
+        The results of generate_display_images.
+    compressed : list[int]
+        The results of precompress_file.
+    """
+    counters = state.metrics.counters
+    for result in results:
+        if isinstance(result, Failure):
+            state.quarantine.add(result.path, "thumbnails", result.error)
+        if not isinstance(result, tuple):
+            counters["thumbnails_failed"] += 1
+        elif result[4]:
+            counters["thumbnails_generated"] += 1
+            counters["bytes_written"] += result[4]
+    counters["thumbnails_skipped"] += max(counters["images"] - counters["thumbnails_generated"] - counters["thumbnails_failed"], 0)
+    for written in display:
+        if isinstance(written, Failure):
+            state.quarantine.add(written.path, "display", written.error)
+            counters["display_images_failed"] += 1
         else:
-            thumbnails = list_folder(args.root_directory, args.site_title, args, raw, __version__, logo)
-
-            with Pool(os.cpu_count()) as pool:
-                logger.info("generating thumbnails")
-                for _ in tqdm(
-                    pool.imap_unordered(generate_thumbnail, thumbnails),
-                    total=len(thumbnails),
-                    desc="Generating thumbnails",
-                    unit="files",
-                    ascii=True,
-                    dynamic_ncols=True,
-                ):
-                    pass
-    except Exception as e:
-        logger.critical("an unhandled exception occurred: %s", str(e), exc_info=True)
-        print(f"An unhandled exception occurred: {str(e)}")
-        ERROR = True
-    finally:
-        os.remove(LOCKFILE)
-        if ERROR:
-            logger.critical("finished builder", extra={"version": __version__}, exc_info=True)
+            counters["display_images_generated"] += 1
+            counters["bytes_written"] += written
+    counters["bytes_written"] += sum(compressed)
+
+
+def scheduled(collected: Metrics, pool, func, jobs: list, budget: int | None, slots: int):
+    """
+    Run image jobs on the worker pool largest first within the memory budget. The last
+    element of each job is the pixel count of its image. The workers report their peak
+    memory with every result.
+
+    Parameters:
+    -----------
+    collected : Metrics
+        The metrics of the build, receiving the peak memory of the workers.
+    pool : multiprocessing.pool.Pool
+        The worker pool.
+    func : Callable
+        The job function.
+    jobs : list
+        The job arguments.
+    budget : int | None
+        The memory budget in bytes, None for no limit.
+    slots : int
+        The number of worker processes.
+
+    Yields:
+    -------
+    Any
+        The results in the order the jobs complete.
+    """
+    for result, rss in schedule(pool, partial(measured, func), jobs, [estimate(job[-1]) for job in jobs], budget, slots):
+        collected.worker_rss = max(collected.worker_rss, rss)
+        yield result
+
+
+def fetch_logo() -> str:
+    """
+    Fetches the logo from sorogon.eu as inline SVG markup.
+    """
+    logger.info("getting logo from sorogon.eu")
+    req = urllib.request.Request("https://files.sorogon.eu/logo.svg")
+    try:
+        with urllib.request.urlopen(req, timeout=10) as res:
+            logo = res.read().decode()
+
+        if logo.startswith("<?xml"):
+            logo = re.sub(r"<\?xml.+\?>", "", logo).strip()
+        if logo.startswith("<!--"):
+            logo = re.sub(r"<!--.+-->", "", logo).strip()
+        logo = logo.replace("\n", " ")
+        logo = " ".join(logo.split())
+    except urllib.error.URLError:
+        logo = "&lt;/srgn&gt;"
+    return logo
+
+
+@dataclass
+class BuildResult:
+    """
+    The outcome of a build.
+
+    Attributes:
+    -----------
+    success : bool
+        Whether the build finished without an unhandled exception.
+    subtree : str | None
+        The folder that was built relative to the root directory, None for the whole gallery.
+    duration : float
+        Wall time of the build in seconds.
+    metrics : Metrics
+        The counts, stage durations and directory operations of the build.
+    outputs : list[str]
+        The pages and metadata files that were generated.
+    quarantined : dict[str, dict]
+        The images that failed in this or an earlier build, by path relative to the root directory.
+    error : str | None
+        Why the build failed.
+    """
+
+    success: bool
+    subtree: str | None
+    duration: float = 0.0
+    metrics: Metrics = field(default_factory=Metrics)
+    outputs: list[str] = field(default_factory=list)
+    quarantined: dict[str, dict] = field(default_factory=dict)
+    error: str | None = None
+
+    @property
+    def counters(self) -> dict[str, int]:
+        """
+        The counts of the build, see metrics.COUNTERS.
+        """
+        return dict(self.metrics.counters)
+
+    @property
+    def durations(self) -> dict[str, float]:
+        """
+        Wall time of each build stage in seconds.
+        """
+        return dict(self.metrics.durations)
+
+    def to_dict(self) -> dict:
+        return {
+            "success": self.success,
+            "subtree": self.subtree,
+            "duration": self.duration,
+            "counters": self.counters,
+            "durations": self.durations,
+            "operations": dict(self.metrics.operations),
+            "outputs": self.outputs,
+            "quarantined": self.quarantined,
+            "error": self.error,
+        }
+
+
+class Builder:
+    """
+    Builds a gallery in-process, for programs that rebuild it repeatedly, e.g. after uploads.
+    The static files, icons and logo are set up by the first build and the worker pool is
+    kept until close(). Every build collects into its own BuildState, so Builders of different
+    root directories can build at the same time; the builds of one Builder run one at a time.
+
+    Example:
+    --------
+        with Builder(args) as builder:
+            result = builder.build("2024/holidays")
+    """
+
+    def __init__(self, args: Args, logo: str | None = None):
+        """
+        Parameters:
+        -----------
+        args : Args
+            The configuration, as returned by parse_arguments.
+        logo : str | None
+            SVG markup of the logo, fetched from sorogon.eu if None.
+        """
+        self.args, self.raw = init_globals(args, RAW_EXTENSIONS)
+        self.logo = logo
+        self.prepared = False
+        self.lockfile = os.path.join(self.args.root_directory, ".lock")
+        self.processes = os.cpu_count() or 1
+        self.budget = self.args.memory_budget * 1024 * 1024 if self.args.memory_budget else default_budget()
+        self.pool = None
+        self.lock = threading.Lock()
+        # the service worker is rendered once, but precompressed with the outputs of every build
+        self.service_worker: str | None = None
+
+    def __enter__(self) -> "Builder":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is None:
+            self.close()
         else:
-            logger.info("finished builder", extra={"version": __version__})
+            # workers stopped by the same signal may have left the job queue locked
+            self.discard_pool()
+
+    def close(self) -> None:
+        """
+        Stops the worker pool.
+        """
+        if self.pool is not None:
+            # let the workers exit on their own, so the records they queued are delivered
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def discard_pool(self) -> None:
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def start_pool(self):
+        if self.pool is None:
+            self.pool = Pool(self.processes, initializer=init_worker, initargs=worker_logger_args(), maxtasksperchild=self.args.max_tasks_per_child or None)
+        return self.pool
+
+    def subtree_folder(self, subtree: str) -> str:
+        """
+        Resolves a folder relative to the root directory, or an absolute path inside it.
+
+        Raises:
+        -------
+        ValueError
+            If the folder is not part of the gallery.
+        """
+        root = self.args.root_directory
+        folder = os.path.normpath(os.path.join(root, subtree))
+        relative = os.path.relpath(folder, root)
+        if relative == ".":
+            return root
+        if relative.startswith("..") or not os.path.isdir(folder):
+            raise ValueError(f"not a folder of the gallery: {subtree}")
+        parent = root
+        for part in relative.split(os.sep):
+            if part.startswith(".") or generate_html.is_excluded(parent, part, self.args):
+                raise ValueError(f"folder is hidden or excluded: {subtree}")
+            parent = os.path.join(parent, part)
+        return folder
+
+    def progress(self, iterable, total: int, desc: str):
+        if self.args.non_interactive_mode:
+            print(f"{desc}...")
+            return iterable
+        return tqdm(iterable, total=total, desc=desc, unit="files", ascii=True, dynamic_ncols=True)
+
+    def prepare(self, state: BuildState) -> None:
+        """
+        Fetches the logo and writes the static files and icons, once per Builder.
+        """
+        if self.logo is None:
+            self.logo = fetch_logo()
+        if self.prepared:
+            return
+        with state.metrics.stage("setup"):
+            self.args.darktheme = copy_static_files(self.args)
+            icons(self.args)
+
+            if self.args.generate_webmanifest:
+                print("Generating webmanifest...")
+                webmanifest(self.args)
+                self.service_worker = service_worker(self.args, __version__)
+        self.prepared = True
+
+    def build(self, subtree: str | None = None) -> BuildResult:
+        """
+        Builds the gallery, or only one folder and its subfolders. The pages of the folders
+        above a subtree are not updated, so a new folder only appears in its parent after
+        the parent is built.
+
+        Parameters:
+        -----------
+        subtree : str | None
+            The folder to build, relative to the root directory or absolute.
+
+        Returns:
+        --------
+        BuildResult
+            The outcome of the build.
+
+        Raises:
+        -------
+        ValueError
+            If subtree is not a folder of the gallery.
+        """
+        folder = self.args.root_directory if subtree is None else self.subtree_folder(subtree)
+        with self.lock:
+            locked = not holds_lock(self.lockfile)
+            if locked:
+                acquired, owner, _ = acquire_lock(self.lockfile)
+                if not acquired:
+                    error = f"another build is running (PID {owner.pid} on {owner.host})" if owner else "another build is running"
+                    logger.warning("build skipped, root directory is locked", extra={"owner": owner.to_dict() if owner else None})
+                    return BuildResult(success=False, subtree=folder.removeprefix(self.args.root_directory) or None, error=error)
+            try:
+                return self.run(folder)
+            finally:
+                if locked:
+                    release_lock(self.lockfile)
+
+    def run(self, folder: str) -> BuildResult:
+        args = self.args
+        start = time.perf_counter()
+        full = folder == args.root_directory
+        subtree = None if full else folder.removeprefix(args.root_directory)
+        thumbdir = os.path.join(args.root_directory, ".thumbnails")
+        displaydir = os.path.join(args.root_directory, generate_html.DISPLAY_DIR)
+        ERROR = False
+        error = None
+
+        collected = Metrics()
+        state = BuildState(metrics=collected, quarantine=Quarantine(args.root_directory, args.retry_failed, collected.counters), scanner=DirectoryScanner(collected.operations))
+        try:
+            logger.info("starting builder", extra={"version": __version__, "arguments": args, "subtree": subtree})
+
+            if args.reread_metadata:
+                logger.warning("reread metadata flag is set to true, all image metadata will be reread")
+            if args.regenerate_thumbnails:
+                logger.warning("regenerate thumbnails flag is set to true, all thumbnails will be regenerated")
+                # a subtree build regenerates the thumbnails of its images one by one instead
+                if full and os.path.exists(thumbdir):
+                    logger.info("removing old thumbnails folder")
+                    shutil.rmtree(thumbdir)
+                if full and os.path.exists(displaydir):
+                    logger.info("removing old display images folder")
+                    shutil.rmtree(displaydir)
+            os.makedirs(thumbdir, exist_ok=True)
+            self.prepare(state)
+            if self.service_worker:
+                state.outputs.append(self.service_worker)
+
+            if args.non_interactive_mode:
+                logger.info("generating HTML files")
+                print("Generating HTML files...")
+            with collected.stage("html"):
+                thumbnails = list_folder(state, folder, args.site_title if full else subtree, args, self.raw, __version__, self.logo)
+            state.scanner.log_stats()
+
+            pool = self.start_pool()
+            compressed = precompress(state, pool, args)
+            logger.info("generating thumbnails")
+            thumbnail = partial(generate_thumbnail, preset=args.thumbnail_preset)
+            with collected.stage("thumbnails"):
+                results = list(self.progress(scheduled(collected, pool, thumbnail, thumbnails, self.budget, self.processes), len(thumbnails), "Generating thumbnails"))
+            display = []
+            derivatives = state.derivatives
+            if derivatives:
+                logger.info("generating display images")
+                with collected.stage("display_images"):
+                    display = list(
+                        self.progress(scheduled(collected, pool, generate_display_images, derivatives, self.budget, self.processes), len(derivatives), "Generating display images")
+                    )
+            with collected.stage("precompress"):
+                compressed_sizes = compressed.get() if compressed else []
+            with collected.stage("placeholders"):
+                store_placeholders(state, pool, results, args)
+            record_results(state, results, display, compressed_sizes)
+            state.quarantine.report()
+        except Exception as e:
+            logger.critical("an unhandled exception occurred: %s", str(e), exc_info=True)
+            print(f"An unhandled exception occurred: {str(e)}")
+            ERROR = True
+            error = str(e)
+            self.discard_pool()
+            if state.pending:
+                # the pages of folders still waiting for placeholders are written without them
+                try:
+                    generate_html.finish_pending(state, [])
+                except Exception as e:
+                    logger.error("failed to write pending folders", extra={"error": str(e)})
+        except (KeyboardInterrupt, SystemExit):
+            logger.warning("build interrupted, the next run continues from the last checkpoint")
+            ERROR = True
+            self.discard_pool()
+            raise
+        finally:
+            collected.durations["total"] = time.perf_counter() - start
+            try:
+                # entries of images outside a subtree were not looked at, so they are kept
+                state.quarantine.save(not ERROR and full)
+            except OSError as e:
+                logger.error("failed to write quarantine file", extra={"error": str(e)})
+            if args.metrics_file:
+                try:
+                    write_metrics(args.metrics_file, collected, not ERROR)
+                except OSError as e:
+                    logger.error("failed to write metrics file", extra={"path": args.metrics_file, "error": str(e)})
+            if ERROR:
+                logger.critical("finished builder", extra={"version": __version__}, exc_info=True)
+            else:
+                logger.info("finished builder", extra={"version": __version__})
+
+        return BuildResult(
+            success=not ERROR,
+            subtree=subtree,
+            duration=collected.durations["total"],
+            metrics=collected,
+            outputs=state.outputs,
+            quarantined=state.quarantine.quarantined(),
+            error=error,
+        )
+
+
+def init_worker(log_queue, levels: dict[str, str]) -> None:
+    """
+    Pool initializer: SIGTERM raises in workers too, so an idle worker releases the lock of
+    the job queue it waits on. A worker killed while holding it blocks the pool's shutdown,
+    which happens when the whole process group is stopped, e.g. by systemd.
+    """
+    signal.signal(signal.SIGTERM, terminate)
+    init_worker_logger(log_queue, levels)
+
+
+def terminate(signum, frame) -> None:
+    # raising lets the builder write its checkpoint and release the lock
+    sys.exit(128 + signum)
 
 
 def main() -> None:
-    global LOCKFILE
     freeze_support()
     args = parse_arguments(__version__)
-    LOCKFILE = os.path.join(args.root_directory, ".lock")
-
-    if os.path.exists(LOCKFILE):
-        print("Another instance of this program is running.")
+    if args.benchmark_presets:
+        args, _ = init_globals(args, RAW_EXTENSIONS)
+        benchmark_presets(args.root_directory, args.file_extensions, args.benchmark_presets)
+        return
+    lockfile = os.path.join(args.root_directory, ".lock")
+
+    acquired, owner, replaced = acquire_lock(lockfile)
+    if not acquired:
+        if owner:
+            print(f"Another instance of this program is running (PID {owner.pid} on {owner.host}).")
+        else:
+            print("Another instance of this program is running.")
         sys.exit()
 
-    rotate_log_file(compress=True)
-    setup_logger()
-
-    builder(args)
+    try:
+        rotate_log_file(compress=True)
+        setup_logger(levels=args.log_levels)
+        if replaced:
+            logger.warning("replaced stale lock file", extra={"path": lockfile, "owner": owner.to_dict() if owner else None})
+            print("Replaced the lock file of an interrupted build.")
+        signal.signal(signal.SIGTERM, terminate)
+
+        with Builder(args) as builder:
+            if args.serve:
+                serve(builder, args.serve, __version__, args.serve_token_file)
+            else:
+                builder.build()
+    finally:
+        release_lock(lockfile)
 
 
 if __name__ == "__main__":
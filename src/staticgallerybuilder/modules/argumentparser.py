@@ -1,8 +1,13 @@
+import argparse
+import logging
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 import configargparse
 
+from ..modules.daemon import parse_address
+from ..modules.encoder import PRESETS
+from ..modules.logger import STAGES
 from ..modules.util import resource_path
 
 try:
@@ -34,6 +39,10 @@ class Args:
     -----------
     author_name : str
         The name of the author of the images.
+    benchmark_presets : int
+        Number of sample images to benchmark the thumbnail presets on instead of building (0 builds).
+    display_sizes : list[int]
+        Long edges in pixels of the downscaled copies shown in the viewer.
     exclude_folders : list[str]
         A list of folders to exclude from processing.
     file_extensions : list[str]
@@ -46,25 +55,55 @@ class Args:
         Whether to ignore files that do not match the specified extensions.
     license_type : Optional[str]
         The type of license for the images.
+    log_levels : dict[str, str]
+        Log levels of the whole log ("") and of single stages (metadata, thumbnails, ...).
+    max_tasks_per_child : int
+        Number of jobs after which a worker process is replaced (0 keeps workers for the whole run).
+    memory_budget : int
+        Memory in MB the running image jobs may use together (0 uses half of the physical memory).
+    metrics_file : str | None
+        Path of a Prometheus textfile collector file to write build metrics to.
     non_interactive_mode : bool
         Whether to run in non-interactive mode.
+    page_size : int
+        Maximum number of images per page, 0 disables pagination.
+    precompress : bool
+        Whether to write gzip/brotli compressed siblings of generated text files.
+    prerender_grid : bool
+        Whether to render the initial image grid into the HTML.
     regenerate_thumbnails : bool
         Whether to regenerate thumbnails even if they already exist.
+    retry_failed : bool
+        Whether to process images again that failed in an earlier run and have not changed since.
     root_directory : str
         The root directory containing the images.
+    scan_threads : int
+        Number of threads listing upcoming folders ahead of processing them.
+    serve : str | None
+        Address ([HOST:]PORT or Unix socket path) to serve the rebuild API on instead of building once.
+    serve_token_file : str | None
+        File containing the token that requests to the rebuild API must send.
     site_title : str
         The title of the image hosting site.
+    split_exif : bool
+        Whether to write EXIF data to a separate, lazily loaded file.
     theme_path : str
         The path to the CSS theme file.
+    thumbnail_preset : str
+        Name of the encoder preset for thumbnails.
     use_fancy_folders : bool
         Whether to enable fancy folder view.
     web_root_url : str
         The base URL of the web root for the image hosting site.
     darktheme : bool
         Whether a dark theme is present.
+    assets : dict[str, str]
+        Mapping of static file names to their fingerprinted names.
     """
 
     author_name: str
+    benchmark_presets: int
+    display_sizes: list[int]
     exclude_folders: list[str]
     file_extensions: list[str]
     folder_thumbs: bool
@@ -72,21 +111,37 @@ class Args:
     ignore_extensions: list[str]
     ignore_other_files: bool
     license_type: str | None
+    log_levels: dict[str, str]
+    max_tasks_per_child: int
+    memory_budget: int
+    metrics_file: str | None
     non_interactive_mode: bool
+    page_size: int
+    precompress: bool
+    prerender_grid: bool
     regenerate_thumbnails: bool
     reread_metadata: bool
     reread_sidecar: bool
+    retry_failed: bool
     reverse_sort: bool
     root_directory: str
+    scan_threads: int
+    serve: str | None
+    serve_token_file: str | None
     site_title: str
+    split_exif: bool
     theme_path: str
+    thumbnail_preset: str
     use_fancy_folders: bool
     web_root_url: str
     darktheme: bool = False
+    assets: dict[str, str] = field(default_factory=dict)
 
     def to_dict(self) -> dict:
         result: dict = {}
         result["author_name"] = self.author_name
+        result["benchmark_presets"] = self.benchmark_presets
+        result["display_sizes"] = self.display_sizes
         result["exclude_folders"] = self.exclude_folders
         result["file_extensions"] = self.file_extensions
         result["folder_thumbs"] = self.folder_thumbs
@@ -95,21 +150,63 @@ class Args:
         result["ignore_other_files"] = self.ignore_other_files
         if self.license_type is not None:
             result["license_type"] = self.license_type
+        result["log_levels"] = self.log_levels
+        result["max_tasks_per_child"] = self.max_tasks_per_child
+        result["memory_budget"] = self.memory_budget
+        if self.metrics_file is not None:
+            result["metrics_file"] = self.metrics_file
         result["non_interactive_mode"] = self.non_interactive_mode
+        result["page_size"] = self.page_size
+        result["precompress"] = self.precompress
+        result["prerender_grid"] = self.prerender_grid
         result["regenerate_thumbnails"] = self.regenerate_thumbnails
         result["reread_metadata"] = self.reread_metadata
         result["reread_sidecar"] = self.reread_sidecar
+        result["retry_failed"] = self.retry_failed
         result["reverse_sort"] = self.reverse_sort
         result["root_directory"] = self.root_directory
+        result["scan_threads"] = self.scan_threads
+        if self.serve is not None:
+            result["serve"] = self.serve
+        if self.serve_token_file is not None:
+            result["serve_token_file"] = self.serve_token_file
         result["site_title"] = self.site_title
+        result["split_exif"] = self.split_exif
         result["theme_path"] = self.theme_path
+        result["thumbnail_preset"] = self.thumbnail_preset
         result["use_fancy_folders"] = self.use_fancy_folders
         result["web_root_url"] = self.web_root_url
         result["darktheme"] = self.darktheme
+        result["assets"] = self.assets
         return result
 
 
-def parse_arguments(version: str) -> Args:
+def log_level(value: str) -> str:
+    """
+    Validates a --log-level value of the form LEVEL or STAGE=LEVEL. The value is kept as a
+    string so --write-config can store it.
+    """
+    stage, _, level = value.rpartition("=")
+    level = level.upper()
+    if stage and stage not in STAGES:
+        raise argparse.ArgumentTypeError(f"unknown stage {stage!r}, choose from {', '.join(STAGES)}")
+    if not isinstance(logging.getLevelName(level), int):
+        raise argparse.ArgumentTypeError(f"unknown log level {level!r}")
+    return f"{stage}={level}" if stage else level
+
+
+def serve_address(value: str) -> str:
+    """
+    Validates a --serve value of the form [HOST:]PORT or a Unix socket path.
+    """
+    try:
+        parse_address(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid address {value!r}, use [HOST:]PORT or a socket path") from None
+    return value
+
+
+def parse_arguments(version: str, argv: list[str] | None = None) -> Args:
     """
     Parse command-line arguments.
 
@@ -117,6 +214,8 @@ def parse_arguments(version: str) -> Args:
     -----------
     version : str
         The version of the program.
+    argv : list[str] | None
+        The arguments to parse instead of those of the command line.
 
     Returns:
     --------
@@ -137,21 +236,36 @@ def parse_arguments(version: str) -> Args:
     parser.add_argument("-t", "--site-title", help="title of the image hosting site", required=True, type=str, dest="site_title", metavar="TITLE")
     parser.add_argument("-w", "--web-root-url", help="base URL of the web root for the image hosting site", required=True, type=str, dest="web_root_url", metavar="URL")
     parser.add_argument('-c', '--config-file', is_config_file=True, help='config file path', metavar="CONFIG_FILE")
+    parser.add_argument("--benchmark-presets", help="encode this many sample images with every thumbnail preset, print encode time, size and SSIM, and exit without building", default=0, type=int, dest="benchmark_presets", metavar="IMAGES")
+    parser.add_argument("--display-size", help="long edge in pixels of a downscaled copy of each image for the viewer, the smallest one covering the screen is shown (can be specified multiple times)", action="append", default=[], type=int, dest="display_sizes", metavar="PIXELS")
     parser.add_argument("--exclude-folder", help="folders to exclude from processing, globs supported (can be specified multiple times)", action="append", dest="exclude_folders", metavar="FOLDER")
     parser.add_argument("--folderthumbnails", help="generate subfolder thumbnails (first image in folder will be shown)", action="store_true", default=False, dest="folder_thumbs")
     if RICH:
         parser.add_argument("--generate-help-preview", action=HelpPreviewAction, path="help.svg") # pyright: ignore[reportPossiblyUnboundVariable]
     parser.add_argument("--ignore-other-files", help="ignore files that do not match the specified extensions", action="store_true", default=False, dest="ignore_other_files")
     parser.add_argument("--ignore-extension", help="file extensions to ignore (can be specified multiple times)", action="append", default=[], dest="ignore_extensions", metavar="EXTENSION")
+    parser.add_argument("--log-level", help=f"log level of the whole log or, as STAGE=LEVEL, of one stage ({', '.join(STAGES)}) (can be specified multiple times)", action="append", default=[], type=log_level, dest="log_levels", metavar="[STAGE=]LEVEL")
+    parser.add_argument("--max-tasks-per-child", help="replace each worker process after this many jobs to return fragmented memory (0 never replaces workers)", default=200, type=int, dest="max_tasks_per_child", metavar="JOBS")
+    parser.add_argument("--memory-budget", help="memory in MB that the images decoded at the same time may use (0 uses half of the physical memory)", default=0, type=int, dest="memory_budget", metavar="MB")
+    parser.add_argument("--metrics-file", help="write build metrics (counts, stage durations, peak memory) in the Prometheus textfile format to this file", default=None, type=str, dest="metrics_file", metavar="PATH")
+    parser.add_argument("--page-size", help="split folders with more images than this into numbered pages (0 disables pagination)", default=0, type=int, dest="page_size", metavar="IMAGES")
+    parser.add_argument("--precompress", help="write .gz (and .br if brotli is installed) siblings of generated text files", action="store_true", default=False, dest="precompress")
+    parser.add_argument("--prerender-grid", help="render the initial image grid into the HTML instead of building it after the metadata was loaded", action="store_true", default=False, dest="prerender_grid")
     parser.add_argument("--regenerate-thumbnails", help="regenerate thumbnails even if they already exist", action="store_true", default=False, dest="regenerate_thumbnails")
     parser.add_argument("--reread-metadata", help="reread image metadata", action="store_true", default=False, dest="reread_metadata")
     parser.add_argument("--reread-sidecar", help="reread sidecar files", action="store_true", default=False, dest="reread_sidecar")
+    parser.add_argument("--retry-failed", help="process images again that failed in an earlier run, even if they have not changed", action="store_true", default=False, dest="retry_failed")
     parser.add_argument("--reverse-sort", help="sort images in reverse order", action="store_true", default=False, dest="reverse_sort")
+    parser.add_argument("--scan-threads", help="number of threads listing upcoming folders in the background, useful on network filesystems (0 disables prefetching)", default=4, type=int, dest="scan_threads", metavar="THREADS")
+    parser.add_argument("--serve", help="keep running and rebuild on requests to an HTTP API on [HOST:]PORT (localhost by default) or a Unix socket path", default=None, type=serve_address, dest="serve", metavar="ADDRESS")
+    parser.add_argument("--serve-token-file", help="require requests to the rebuild API to send the token in this file as 'Authorization: Bearer TOKEN'", default=None, type=str, dest="serve_token_file", metavar="FILE")
+    parser.add_argument("--split-exif", help="write EXIF data to a separate file that is only loaded when an image's info panel is opened", action="store_true", default=False, dest="split_exif")
     parser.add_argument("--theme-path", help="path to the CSS theme file", default=DEFAULT_THEME_PATH, type=str, dest="theme_path", metavar="PATH")
+    parser.add_argument("--thumbnail-preset", help=f"encoder preset for thumbnails ({', '.join(PRESETS)})", choices=list(PRESETS), default="default", type=str, dest="thumbnail_preset", metavar="PRESET")
     parser.add_argument("--use-fancy-folders", help="enable fancy folder view instead of the default Apache directory listing", action="store_true", default=False, dest="use_fancy_folders")
     parser.add_argument("-V", "--version", action="version", version="%(prog)s-" + version)
     parser.add_argument("--write-config", type=str, required=False, help="write current command line args to config file", metavar="CONFIG_FILE")
-    parsed_args = parser.parse_args()
+    parsed_args = parser.parse_args(argv)
     if parsed_args.write_config:
         config_path = parsed_args.write_config
         del parsed_args.write_config
@@ -159,6 +273,8 @@ def parse_arguments(version: str) -> Args:
     # fmt: on
     _args = Args(
         author_name=parsed_args.author_name,
+        benchmark_presets=max(parsed_args.benchmark_presets, 0),
+        display_sizes=sorted(set(parsed_args.display_sizes)),
         exclude_folders=parsed_args.exclude_folders,
         file_extensions=parsed_args.file_extensions,
         folder_thumbs=parsed_args.folder_thumbs,
@@ -166,14 +282,27 @@ def parse_arguments(version: str) -> Args:
         ignore_other_files=parsed_args.ignore_other_files,
         ignore_extensions=parsed_args.ignore_extensions,
         license_type=parsed_args.license_type,
+        log_levels={stage: level for stage, _, level in (value.rpartition("=") for value in parsed_args.log_levels)},
+        max_tasks_per_child=max(parsed_args.max_tasks_per_child, 0),
+        memory_budget=max(parsed_args.memory_budget, 0),
+        metrics_file=parsed_args.metrics_file,
         non_interactive_mode=parsed_args.non_interactive_mode,
+        page_size=parsed_args.page_size,
+        precompress=parsed_args.precompress,
+        prerender_grid=parsed_args.prerender_grid,
         regenerate_thumbnails=parsed_args.regenerate_thumbnails,
         reread_metadata=parsed_args.reread_metadata,
         reread_sidecar=parsed_args.reread_sidecar,
+        retry_failed=parsed_args.retry_failed,
         reverse_sort=parsed_args.reverse_sort,
         root_directory=parsed_args.root_directory,
+        scan_threads=max(parsed_args.scan_threads, 0),
+        serve=parsed_args.serve,
+        serve_token_file=parsed_args.serve_token_file,
         site_title=parsed_args.site_title,
+        split_exif=parsed_args.split_exif,
         theme_path=parsed_args.theme_path,
+        thumbnail_preset=parsed_args.thumbnail_preset,
         use_fancy_folders=parsed_args.use_fancy_folders,
         web_root_url=parsed_args.web_root_url,
         darktheme=False,
@@ -0,0 +1,138 @@
+"""
+benchmark.py
+
+Compares the thumbnail encoder presets on a sample of the gallery's images. Every image
+is decoded once; each preset then downscales, colour converts and encodes it, and the
+result is compared with a reference downscaled with Lanczos and kept uncompressed. The score is the mean
+SSIM of the luminance over 8x8 pixel windows with a stride of 4 pixels, computed with
+Pillow alone.
+"""
+
+import os
+import time
+from io import BytesIO
+
+from PIL import Image, ImageMath
+
+from ..modules.colorprofile import downscale
+from ..modules.encoder import PRESETS, THUMBNAIL_SIZE, make_thumbnail, save_thumbnail
+from ..modules.rawpreview import open_image
+
+WINDOW = 8
+C1 = (0.01 * 255) ** 2
+C2 = (0.03 * 255) ** 2
+
+
+def ssim(reference: Image.Image, image: Image.Image) -> float:
+    """
+    Computes the mean structural similarity of two images of the same size in luminance.
+    """
+    x = reference.convert("L").convert("F")
+    y = image.convert("L").convert("F")
+    # windows aligned with the JPEG blocks would not see the edges between blocks, so the
+    # windows are also shifted by half their size
+    step = WINDOW // 2
+    offsets = [(0, 0), (step, 0), (0, step), (step, step)]
+    scores = [window_ssim(x.crop((dx, dy, x.width, x.height)), y.crop((dx, dy, y.width, y.height))) for dx, dy in offsets]
+    return sum(scores) / len(scores)
+
+
+def window_ssim(x: Image.Image, y: Image.Image) -> float:
+    """
+    Computes the mean SSIM of two float images over non-overlapping windows.
+    """
+    size = (max(x.width // WINDOW, 1), max(x.height // WINDOW, 1))
+
+    def local(img: Image.Image) -> Image.Image:
+        return img.resize(size, Image.Resampling.BOX)
+
+    def product(a: Image.Image, b: Image.Image) -> Image.Image:
+        return ImageMath.lambda_eval(lambda v: v["a"] * v["b"], a=a, b=b)  # type: ignore
+
+    mx, my = local(x), local(y)
+    xx, yy, xy = local(product(x, x)), local(product(y, y)), local(product(x, y))
+    scores = ImageMath.lambda_eval(
+        lambda v: (
+            ((v["mx"] * v["my"] * 2 + C1) * ((v["xy"] - v["mx"] * v["my"]) * 2 + C2))
+            / ((v["mx"] * v["mx"] + v["my"] * v["my"] + C1) * (v["xx"] - v["mx"] * v["mx"] + v["yy"] - v["my"] * v["my"] + C2))
+        ),
+        mx=mx,
+        my=my,
+        xx=xx,
+        yy=yy,
+        xy=xy,
+    )
+    # ImageStat bins float images into a histogram, a box resize averages them exactly
+    return scores.resize((1, 1), Image.Resampling.BOX).getpixel((0, 0))  # type: ignore
+
+
+def sample_images(root: str, extensions: list[str], count: int) -> list[str]:
+    """
+    Picks up to count images spread evenly over the sorted image paths below root, skipping
+    hidden folders such as the thumbnails.
+    """
+    paths = []
+    for folder, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        paths.extend(os.path.join(folder, f) for f in sorted(files) if os.path.splitext(f)[1].lower() in extensions)
+    if len(paths) <= count:
+        return paths
+    return [paths[i * len(paths) // count] for i in range(count)]
+
+
+def run_benchmark(paths: list[str]) -> dict[str, dict[str, float]]:
+    """
+    Encodes every image with every preset.
+
+    Args:
+        paths (list[str]): The sample images.
+
+    Returns:
+        dict[str, dict[str, float]]: Per preset the images encoded, the mean downscale and
+        encode time in milliseconds, the mean output bytes and the mean and lowest SSIM.
+    """
+    results = {name: {"images": 0, "time": 0.0, "bytes": 0.0, "ssim": 0.0, "min_ssim": 1.0} for name in PRESETS}
+    for path in paths:
+        try:
+            with open_image(path, THUMBNAIL_SIZE) as imgfile:
+                imgfile.load()
+                original = imgfile.copy()
+        except OSError as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        references: dict[tuple[int, int], Image.Image] = {}
+        for name, preset in PRESETS.items():
+            img = original.copy()
+            buffer = BytesIO()
+            start = time.perf_counter()
+            img = make_thumbnail(img, preset)
+            save_thumbnail(img, buffer, preset)
+            elapsed = time.perf_counter() - start
+            if img.size not in references:
+                reference = downscale(original.copy(), THUMBNAIL_SIZE, Image.Resampling.LANCZOS, None)[0]
+                references[img.size] = reference if reference.size == img.size else reference.resize(img.size, Image.Resampling.LANCZOS)
+            score = ssim(references[img.size], Image.open(buffer))
+            result = results[name]
+            result["images"] += 1
+            result["time"] += elapsed * 1000
+            result["bytes"] += buffer.tell()
+            result["ssim"] += score
+            result["min_ssim"] = min(result["min_ssim"], score)
+    for result in results.values():
+        if result["images"]:
+            for key in ("time", "bytes", "ssim"):
+                result[key] /= result["images"]
+    return results
+
+
+def benchmark_presets(root: str, extensions: list[str], count: int) -> dict[str, dict[str, float]]:
+    """
+    Benchmarks the presets on a sample of the gallery and prints a table of the results.
+    """
+    paths = sample_images(root, extensions, count)
+    print(f"Encoding {len(paths)} images with {len(PRESETS)} presets...")
+    results = run_benchmark(paths)
+    print(f"{'preset':<10} {'ms/image':>9} {'KiB/image':>10} {'SSIM':>7} {'min SSIM':>9}  description")
+    for name, result in results.items():
+        print(f"{name:<10} {result['time']:>9.1f} {result['bytes'] / 1024:>10.1f} {result['ssim']:>7.4f} {result['min_ssim']:>9.4f}  {PRESETS[name].description}")
+    return results
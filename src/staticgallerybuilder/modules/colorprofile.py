@@ -0,0 +1,104 @@
+"""
+colorprofile.py
+
+Downscales images in the mode they were decoded in and converts only the small result to
+8-bit sRGB. Converting CMYK, 16-bit or palette images at full size is much slower than
+resampling them, and a plain convert("RGB") ignores the embedded ICC profile, which
+shifts the colours of CMYK and wide-gamut images. Colour transforms are built once per
+profile and worker process.
+"""
+
+import logging
+from io import BytesIO
+
+from PIL import Image, ImageCms, ImageOps
+
+# modes Pillow only resamples with the nearest neighbour filter or cannot reduce, and the
+# modes they are converted to before resampling
+RESAMPLE_MODES = {"1": "L", "P": "RGB", "PA": "RGBA", "I;16": "I", "I;16L": "I", "I;16B": "I", "I;16N": "I"}
+# modes with more than 8 bits per channel, scaled down after resampling
+HIGH_BIT_DEPTH_MODES = ("I", "F")
+# modes that need a transform from their own colour space to sRGB
+TRANSFORM_MODES = ("RGB", "CMYK", "L")
+
+SRGB = ImageCms.createProfile("sRGB")
+
+logger = logging.getLogger(name="defaultlogger.thumbnails")
+
+# transforms by embedded profile and image mode, None for profiles that cannot be used
+transforms: dict[tuple[bytes, str], ImageCms.ImageCmsTransform | None] = {}
+
+
+def srgb_transform(profile: bytes, mode: str) -> ImageCms.ImageCmsTransform | None:
+    """
+    Returns the cached transform from an embedded profile to sRGB for images of this mode.
+    """
+    key = (profile, mode)
+    if key not in transforms:
+        try:
+            transforms[key] = ImageCms.buildTransform(ImageCms.ImageCmsProfile(BytesIO(profile)), SRGB, mode, "RGB", ImageCms.Intent.PERCEPTUAL)
+        except (ImageCms.PyCMSError, OSError, ValueError, TypeError) as e:
+            logger.warning("ignoring unusable ICC profile", extra={"mode": mode, "error": str(e)})
+            transforms[key] = None
+    return transforms[key]
+
+
+def to_8bit(img: Image.Image, source_mode: str) -> Image.Image:
+    """
+    Scales greyscale images with more than 8 bits to 8 bits instead of clipping them at 255.
+    32-bit images are scaled by their maximum if it exceeds the 16-bit range, float images
+    are taken to range from 0 to 1 if they do not exceed it.
+    """
+    high = img.getextrema()[1]
+    if not isinstance(high, (int, float)):
+        return img.convert("L")
+    if source_mode.startswith("I;16"):
+        scale = 255 / 65535
+    elif img.mode == "I" and high > 255:
+        scale = 255 / max(high, 65535)
+    elif img.mode == "F" and high <= 1:
+        scale = 255.0
+    else:
+        return img.convert("L")
+    return img.point(lambda value: value * scale).convert("L")
+
+
+def downscale(img: Image.Image, size: int, resample: Image.Resampling, reducing_gap: float | None, keep_rgb_profile: bool = False) -> tuple[Image.Image, bytes | None]:
+    """
+    Downscales an opened image to fit a square, applies its EXIF orientation and converts
+    it to RGB. JPEGs are decoded at a reduced scale where the reducing gap allows it.
+
+    Args:
+        img (Image.Image): The opened image. It is modified.
+        size (int): The long edge of the result.
+        resample (Image.Resampling): The resampling filter.
+        reducing_gap (float | None): See Image.thumbnail.
+        keep_rgb_profile (bool): Keep the colours of RGB images and return their profile for
+            embedding instead of converting them to sRGB, so wide-gamut images stay so.
+
+    Returns:
+        tuple[Image.Image, bytes | None]: The RGB image and the ICC profile to embed, if any.
+    """
+    profile = img.info.get("icc_profile")
+    source_mode = img.mode
+    if img.mode in RESAMPLE_MODES:
+        mode = RESAMPLE_MODES[img.mode]
+        if img.mode == "P" and "transparency" in img.info:
+            mode = "RGBA"
+        img = img.convert(mode)
+    img.thumbnail((size, size), resample, reducing_gap)
+    img = ImageOps.exif_transpose(img)
+    if img.mode in HIGH_BIT_DEPTH_MODES:
+        img = to_8bit(img, source_mode)
+    elif img.mode in ("LA", "La"):
+        img = img.convert("L")
+    elif img.mode in ("RGBA", "RGBa", "RGBX"):
+        img = img.convert("RGB")
+
+    if profile and img.mode == "RGB" and keep_rgb_profile:
+        return img, profile
+    if profile and img.mode in TRANSFORM_MODES:
+        transform = srgb_transform(profile, img.mode)
+        if transform is not None:
+            return ImageCms.applyTransform(img, transform), None  # type: ignore
+    return img.convert("RGB"), None
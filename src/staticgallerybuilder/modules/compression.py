@@ -0,0 +1,106 @@
+"""
+compression.py
+
+Writes precompressed `.gz` and, if a brotli module is installed, `.br` siblings of the
+generated text files, so web servers can serve them directly (e.g. nginx `gzip_static`
+and `brotli_static`) instead of compressing on every request.
+"""
+
+import gzip
+import logging
+import os
+
+try:
+    import brotli
+
+    BROTLI = True
+except ImportError:
+    try:
+        import brotlicffi as brotli
+
+        BROTLI = True
+    except ImportError:
+        BROTLI = False
+
+COMPRESSIBLE_EXTENSIONS = (".html", ".json", ".js", ".css", ".svg", ".webmanifest")
+MIN_SIZE = 256
+
+logger = logging.getLogger(name="defaultlogger.compression")
+
+
+def compressors() -> dict[str, object]:
+    """
+    Returns the available compressors keyed by the file suffix they produce.
+    """
+    result: dict[str, object] = {".gz": lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    if BROTLI:
+        result[".br"] = lambda data: brotli.compress(data, quality=11)  # pyright: ignore[reportPossiblyUnboundVariable]
+    return result
+
+
+def precompress_file(path: str) -> int:
+    """
+    Writes compressed siblings of a file. A sibling is only regenerated if its
+    modification time differs from that of the source file.
+
+    Args:
+        path (str): The file to compress.
+
+    Returns:
+        int: The number of bytes written.
+    """
+    written = 0
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return written
+    if stat.st_size < MIN_SIZE:
+        remove_precompressed(path)
+        return written
+    data = None
+    for suffix, compress in compressors().items():
+        dest = path + suffix
+        try:
+            if os.stat(dest).st_mtime_ns == stat.st_mtime_ns:
+                continue
+        except FileNotFoundError:
+            pass
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        logger.debug("precompressing file", extra={"file": path, "suffix": suffix})
+        tmp = f"{dest}.tmp"
+        with open(tmp, "wb") as f:
+            written += f.write(compress(data))  # type: ignore
+        os.utime(tmp, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(tmp, dest)
+    return written
+
+
+def remove_precompressed(path: str) -> None:
+    """
+    Removes compressed siblings of a file, e.g. after the file itself was deleted.
+
+    Args:
+        path (str): The source file path.
+    """
+    for suffix in (".gz", ".br"):
+        if os.path.exists(path + suffix):
+            logger.info("removing precompressed file", extra={"file": path + suffix})
+            os.remove(path + suffix)
+
+
+def static_files(static_dir: str) -> list[str]:
+    """
+    Lists all compressible files in the static directory.
+
+    Args:
+        static_dir (str): The static files directory.
+
+    Returns:
+        list[str]: Paths of compressible files.
+    """
+    result = []
+    for dirpath, _, filenames in os.walk(static_dir):
+        result.extend(os.path.join(dirpath, f) for f in filenames if f.endswith(COMPRESSIBLE_EXTENSIONS))
+    return result
@@ -0,0 +1,359 @@
+"""
+daemon.py
+
+Keeps a Builder running and rebuilds folders on request, so an upload pipeline does not
+pay for interpreter start-up, imports, static files, icons, the logo and the worker pool
+after every batch. The API is served over HTTP on a local port or a Unix socket:
+
+    POST /rebuild  {"paths": [...], "wait": true}  rebuild the folders of these files or
+                   folders, relative to the root directory; without paths the whole gallery
+    GET  /status   the state of the daemon and the result of the last build
+    GET  /metrics  the metrics of the last build in the Prometheus text format
+
+Builds run one at a time on the main thread, so a SIGTERM interrupts them like a CLI
+build. Requests that arrive during a build are merged into the next one.
+
+Browsers can send simple requests to local ports, so POST requests must be JSON, which
+needs a CORS preflight the API never answers, and requests on a loopback address must name
+a loopback host, which pages of rebound domains do not. With a token, every request must
+send it as a bearer token.
+"""
+
+import hmac
+import logging
+import os
+import queue
+import socketserver
+import stat
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Any
+
+from ..modules import jsonutil, metrics
+
+if TYPE_CHECKING:
+    from ..main import Builder
+
+DEFAULT_HOST = "127.0.0.1"
+LOOPBACK_HOSTS = {"localhost", "127.0.0.1", "::1"}
+# group access for the uploading user, umask-independent
+SOCKET_UMASK = 0o117
+# largest request body accepted, a list of a few thousand paths
+MAX_BODY = 1024 * 1024
+
+logger = logging.getLogger(name="defaultlogger")
+
+
+def parse_address(address: str) -> tuple[str, int] | str:
+    """
+    Parses a listen address: a Unix socket path containing a "/", or [HOST:]PORT with the
+    host defaulting to the loopback interface.
+
+    Raises:
+        ValueError: If the port is not a number.
+    """
+    if "/" in address:
+        return address
+    host, _, port = address.rpartition(":")
+    return (host.strip("[]") or DEFAULT_HOST, int(port))
+
+
+def host_name(header: str) -> str:
+    """
+    Returns the host of a Host header without the port.
+    """
+    if header.startswith("["):
+        return header[1:].partition("]")[0]
+    return header.rpartition(":")[0] if ":" in header else header
+
+
+def read_token(path: str) -> str:
+    """
+    Reads the API token from a file.
+
+    Raises:
+        ValueError: If the file is empty.
+    """
+    with open(path, encoding="utf-8") as f:
+        token = f.read().strip()
+    if not token:
+        raise ValueError(f"token file {path} is empty")
+    return token
+
+
+@dataclass
+class Job:
+    # absolute folders to build, the root directory for the whole gallery
+    folders: list[str]
+    done: threading.Event = field(default_factory=threading.Event)
+    results: list[dict] = field(default_factory=list)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Daemon:
+    """
+    Runs the builds requested through the API.
+    """
+
+    def __init__(self, builder: "Builder", version: str):
+        self.builder = builder
+        self.version = version
+        self.root = builder.args.root_directory
+        self.jobs: queue.Queue[Job] = queue.Queue()
+        self.started = time.time()
+        self.building: list[str] = []
+        self.builds = 0
+        self.failures = 0
+        self.last: dict | None = None
+        self.last_metrics = ""
+
+    def folder(self, path: str) -> str:
+        """
+        Returns the folder to rebuild for a changed path. Files, deleted folders and folders
+        without a page yet are rebuilt from the closest folder above them that has a page,
+        so new and removed entries are linked or unlinked there.
+
+        Raises:
+            ValueError: If the path is outside the gallery or in a hidden or excluded folder.
+        """
+        folder = os.path.normpath(os.path.join(self.root, path))
+        existing = folder
+        while not os.path.isdir(existing) and os.path.dirname(existing) != existing:
+            existing = os.path.dirname(existing)
+        # validates the path, the folders above a valid one are valid as well
+        folder = self.builder.subtree_folder(existing)
+        while folder != self.root and not os.path.isfile(os.path.join(folder, "index.html")):
+            parent = os.path.dirname(folder.rstrip("/"))
+            folder = self.root if parent + "/" == self.root else parent
+        return folder
+
+    def submit(self, paths: list[str] | None) -> Job:
+        """
+        Queues a build of the folders of these paths, or of the whole gallery.
+
+        Raises:
+            ValueError: If a path is not part of the gallery.
+        """
+        folders = [self.root] if paths is None else sorted({self.folder(path) for path in paths})
+        job = Job(folders)
+        self.jobs.put(job)
+        return job
+
+    def merge(self, jobs: list[Job]) -> list[str]:
+        """
+        Returns the folders to build for these jobs, leaving out folders inside others.
+        """
+        folders = sorted({folder for job in jobs for folder in job.folders})
+        if self.root in folders:
+            return [self.root]
+        merged: list[str] = []
+        for folder in folders:
+            if not merged or not folder.startswith(merged[-1] + "/"):
+                merged.append(folder)
+        return merged
+
+    def build(self, folder: str) -> dict:
+        subtree = None if folder == self.root else folder
+        try:
+            build = self.builder.build(subtree)
+        except ValueError as e:
+            # the folder was removed since the request
+            build = None
+            result = {"success": False, "subtree": folder.removeprefix(self.root), "error": str(e)}
+        else:
+            result = build.to_dict()
+        self.builds += 1
+        if not result["success"]:
+            self.failures += 1
+        self.last = result
+        if build is not None and build.metrics.counters:
+            self.last_metrics = metrics.render(build.metrics, result["success"])
+        return result
+
+    def run(self) -> None:
+        """
+        Builds the queued jobs until the process is stopped.
+        """
+        while True:
+            jobs = [self.jobs.get()]
+            while not self.jobs.empty():
+                jobs.append(self.jobs.get_nowait())
+            self.building = self.merge(jobs)
+            logger.info("rebuilding", extra={"folders": self.building, "requests": len(jobs)})
+            try:
+                results = [self.build(folder) for folder in self.building]
+            finally:
+                self.building = []
+            for job in jobs:
+                job.results = results
+                job.done.set()
+
+    def stop(self) -> None:
+        """
+        Answers the requests that are still waiting for a build.
+        """
+        while not self.jobs.empty():
+            job = self.jobs.get_nowait()
+            job.results = [{"success": False, "subtree": None, "error": "daemon stopped"}]
+            job.done.set()
+
+    def status(self) -> dict:
+        return {
+            "version": self.version,
+            "root_directory": self.root,
+            "state": "building" if self.building else "idle",
+            "building": [folder.removeprefix(self.root) or "/" for folder in self.building],
+            "queued": self.jobs.qsize(),
+            "started": self.started,
+            "builds": self.builds,
+            "failures": self.failures,
+            "last": self.last,
+        }
+
+    def render_metrics(self) -> str:
+        lines = [self.last_metrics.rstrip("\n")] if self.last_metrics else []
+        for name, kind, text, value in (
+            ("daemon_builds_total", "counter", "Builds run by the daemon.", self.builds),
+            ("daemon_build_failures_total", "counter", "Builds of the daemon that failed.", self.failures),
+            ("daemon_queued_requests", "gauge", "Rebuild requests waiting for a build.", self.jobs.qsize()),
+            ("daemon_start_time_seconds", "gauge", "Time the daemon started.", round(self.started, 3)),
+        ):
+            lines.append(f"# HELP {metrics.PREFIX}_{name} {text}")
+            lines.append(f"# TYPE {metrics.PREFIX}_{name} {kind}")
+            lines.append(f"{metrics.PREFIX}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def make_handler(daemon: Daemon, token: str | None = None, hosts: set[str] | None = None) -> type[BaseHTTPRequestHandler]:
+    """
+    Returns the request handler of the API.
+
+    Args:
+        daemon (Daemon): The daemon running the builds.
+        token (str | None): The token requests must send, None to accept all.
+        hosts (set[str] | None): The hosts requests may name, None to accept all.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        server_version = f"StaticGalleryBuilder/{daemon.version}"
+
+        def send(self, status: int, body: str, content_type: str = "application/json") -> None:
+            data = body.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_json(self, status: int, obj: Any) -> None:
+            self.send(status, jsonutil.dumps(obj, indent=False))
+
+        def allowed(self) -> bool:
+            if hosts is not None and host_name(self.headers.get("Host", "")).lower() not in hosts:
+                self.send_json(403, {"error": "unknown host"})
+                return False
+            if token is not None:
+                scheme, _, value = self.headers.get("Authorization", "").partition(" ")
+                if scheme.lower() != "bearer" or not hmac.compare_digest(value.strip().encode(), token.encode()):
+                    self.send_json(401, {"error": "missing or wrong token"})
+                    return False
+            return True
+
+        def do_GET(self) -> None:
+            if not self.allowed():
+                return
+            if self.path == "/status":
+                self.send_json(200, daemon.status())
+            elif self.path == "/metrics":
+                self.send(200, daemon.render_metrics(), "text/plain; version=0.0.4")
+            else:
+                self.send_json(404, {"error": f"unknown endpoint {self.path}"})
+
+        def do_POST(self) -> None:
+            if not self.allowed():
+                return
+            if self.path != "/rebuild":
+                self.send_json(404, {"error": f"unknown endpoint {self.path}"})
+                return
+            if self.headers.get_content_type() != "application/json":
+                self.send_json(415, {"error": "requests must have the content type application/json"})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY:
+                self.send_json(413, {"error": "request body too large"})
+                return
+            try:
+                request = jsonutil.loads(self.rfile.read(length)) if length else {}
+                paths = request.get("paths")
+                if paths is not None and (not isinstance(paths, list) or not all(isinstance(path, str) for path in paths)):
+                    raise ValueError("paths must be a list of strings")
+                job = daemon.submit(paths)
+            except (jsonutil.JSONDecodeError, AttributeError, ValueError) as e:
+                self.send_json(400, {"error": str(e)})
+                return
+            if not request.get("wait", True):
+                self.send_json(202, {"queued": [folder.removeprefix(daemon.root) or "/" for folder in job.folders]})
+                return
+            job.done.wait()
+            success = all(result["success"] for result in job.results)
+            self.send_json(200 if success else 500, {"success": success, "results": job.results})
+
+        def address_string(self) -> str:
+            # Unix socket clients have no address
+            return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+        def log_message(self, format: str, *args) -> None:
+            logger.debug("api request", extra={"client": self.address_string(), "request": format % args})
+
+    return Handler
+
+
+def serve(builder: "Builder", address: str, version: str, token_file: str | None = None) -> None:
+    """
+    Builds the whole gallery, then serves the API on address and runs the requested
+    builds until the process is stopped.
+
+    Args:
+        builder (Builder): The builder, holding the lock of the root directory.
+        address (str): [HOST:]PORT or the path of a Unix socket.
+        version (str): The version of the program.
+        token_file (str | None): File containing the token requests must send.
+    """
+    token = read_token(token_file) if token_file else None
+    daemon = Daemon(builder, version)
+    daemon.build(daemon.root)
+
+    listen = parse_address(address)
+    if isinstance(listen, str):
+        handler = make_handler(daemon, token)
+        if os.path.exists(listen) and stat.S_ISSOCK(os.stat(listen).st_mode):
+            # a socket left behind by a daemon that was killed
+            os.remove(listen)
+        # bind creates the socket file with the mode of the umask
+        umask = os.umask(SOCKET_UMASK)
+        try:
+            server: socketserver.BaseServer = UnixHTTPServer(listen, handler)
+        finally:
+            os.umask(umask)
+    else:
+        # on a wildcard address the gallery host names are not known
+        hosts = LOOPBACK_HOSTS | {listen[0].lower()} if listen[0] not in ("", "0.0.0.0", "::") else None
+        server = ThreadingHTTPServer(listen, make_handler(daemon, token, hosts))
+    thread = threading.Thread(target=server.serve_forever, name="api", daemon=True)
+    thread.start()
+    logger.info("daemon listening", extra={"address": address})
+    print(f"Listening on {address}")
+    try:
+        daemon.run()
+    finally:
+        server.shutdown()
+        server.server_close()
+        daemon.stop()
+        if isinstance(listen, str) and os.path.exists(listen):
+            os.remove(listen)
+        logger.info("daemon stopped")
@@ -4,6 +4,10 @@ from typing import Any, TypeVar, cast
 
 T = TypeVar("T")
 
+# Bumped whenever the on-disk layout of .metadata.json changes. Files carrying the
+# current version are trusted and loaded without migration or validation.
+METADATA_VERSION = 1
+
 
 def from_int(x: Any) -> int:
     assert isinstance(x, int) and not isinstance(x, bool)
@@ -49,6 +53,25 @@ def from_native_dict[T](f: Callable[[Any], T], x: Any) -> dict[Any, T]:
     return x
 
 
+@dataclass
+class DisplaySize:
+    w: int
+    h: int
+    src: str
+
+    @staticmethod
+    def from_dict(obj: Any) -> "DisplaySize":
+        assert isinstance(obj, dict)
+        return DisplaySize(from_int(obj.get("w")), from_int(obj.get("h")), from_str(obj.get("src")))
+
+    @staticmethod
+    def from_trusted_dict(obj: dict) -> "DisplaySize":
+        return DisplaySize(obj["w"], obj["h"], obj["src"])
+
+    def to_dict(self) -> dict:
+        return {"w": self.w, "h": self.h, "src": self.src}
+
+
 @dataclass
 class ImageMetadata:
     w: int
@@ -62,6 +85,9 @@ class ImageMetadata:
     title: str
     tiff: str | None = None
     raw: str | None = None
+    placeholder: str | None = None
+    color: str | None = None
+    sizes: list[DisplaySize] | None = None
 
     @staticmethod
     def from_dict(obj: Any) -> "ImageMetadata":
@@ -77,26 +103,63 @@ class ImageMetadata:
         title = from_str(obj.get("title"))
         tiff = from_union([from_str, from_none], obj.get("tiff"))
         raw = from_union([from_str, from_none], obj.get("raw"))
-        return ImageMetadata(w, h, tags, exifdata, xmp, src, msrc, name, title, tiff, raw)
+        placeholder = from_union([from_str, from_none], obj.get("placeholder"))
+        color = from_union([from_str, from_none], obj.get("color"))
+        sizes = from_union([lambda x: from_list(DisplaySize.from_dict, x), from_none], obj.get("sizes"))
+        return ImageMetadata(w, h, tags, exifdata, xmp, src, msrc, name, title, tiff, raw, placeholder, color, sizes)
 
-    def to_dict(self) -> dict:
-        result: dict = {}
-        result["w"] = from_int(self.w)
-        result["h"] = from_int(self.h)
+    @staticmethod
+    def from_trusted_dict(obj: dict) -> "ImageMetadata":
+        get = obj.get
+        sizes = get("sizes")
+        if sizes is not None:
+            sizes = [DisplaySize.from_trusted_dict(x) for x in sizes]
+        return ImageMetadata(
+            obj["w"],
+            obj["h"],
+            # tags may be edited by hand
+            from_union([lambda x: from_list(from_str, x), from_none], get("tags")),
+            get("exifdata"),
+            get("xmp"),
+            obj["src"],
+            obj["msrc"],
+            obj["name"],
+            obj["title"],
+            get("tiff"),
+            get("raw"),
+            get("placeholder"),
+            get("color"),
+            sizes,
+        )
+
+    def to_dict(self, include_exif: bool = True) -> dict:
+        result: dict = {"w": self.w, "h": self.h}
         if self.tags is not None:
-            result["tags"] = from_union([lambda x: from_list(from_str, x), from_none], self.tags)
-        result["src"] = from_str(self.src)
-        result["msrc"] = from_str(self.msrc)
-        result["name"] = from_str(self.name)
-        result["title"] = from_str(self.title)
+            result["tags"] = self.tags
+        result["src"] = self.src
+        result["msrc"] = self.msrc
+        result["name"] = self.name
+        result["title"] = self.title
         if self.tiff is not None:
-            result["tiff"] = from_union([from_str, from_none], self.tiff)
+            result["tiff"] = self.tiff
         if self.raw is not None:
-            result["raw"] = from_union([from_str, from_none], self.raw)
+            result["raw"] = self.raw
+        if self.placeholder is not None:
+            result["placeholder"] = self.placeholder
+        if self.color is not None:
+            result["color"] = self.color
+        if self.sizes is not None:
+            result["sizes"] = [x.to_dict() for x in self.sizes]
+        if include_exif:
+            result.update(self.exif_to_dict())
+        return result
+
+    def exif_to_dict(self) -> dict:
+        result: dict = {}
         if self.exifdata is not None:
-            result["exifdata"] = from_union([lambda x: from_native_dict(dict, x), from_none], self.exifdata)
+            result["exifdata"] = self.exifdata
         if self.xmp is not None:
-            result["xmp"] = from_union([lambda x: from_native_dict(dict, x), from_none], self.xmp)
+            result["xmp"] = self.xmp
         return result
 
 
@@ -116,13 +179,12 @@ class SubfolderMetadata:
         thumb = from_union([from_none, from_str], obj.get("thumb"))
         return SubfolderMetadata(url, name, metadata, thumb)
 
+    @staticmethod
+    def from_trusted_dict(obj: dict) -> "SubfolderMetadata":
+        return SubfolderMetadata(obj["url"], obj["name"], obj.get("metadata"), obj.get("thumb"))
+
     def to_dict(self) -> dict:
-        result: dict = {}
-        result["url"] = from_str(self.url)
-        result["name"] = from_str(self.name)
-        result["metadata"] = from_union([from_none, from_str], self.metadata)
-        result["thumb"] = from_union([from_none, from_str], self.thumb)
-        return result
+        return {"url": self.url, "name": self.name, "metadata": self.metadata, "thumb": self.thumb}
 
 
 @dataclass
@@ -137,13 +199,37 @@ class Metadata:
         subfolders = from_union([lambda x: from_list(SubfolderMetadata.from_dict, x), from_none], obj.get("subfolders"))
         return Metadata(images, subfolders)
 
-    def to_dict(self) -> dict:
-        result: dict = {}
-        result["images"] = from_dict(lambda x: to_class(ImageMetadata, x), self.images)
+    @staticmethod
+    def from_trusted_dict(obj: dict) -> "Metadata":
+        """
+        Builds Metadata from a dict previously written by to_dict() at the current
+        METADATA_VERSION, skipping per-field validation.
+        """
+        images = {k: ImageMetadata.from_trusted_dict(v) for k, v in obj["images"].items()}
+        subfolders = obj.get("subfolders")
+        if subfolders is not None:
+            subfolders = [SubfolderMetadata.from_trusted_dict(x) for x in subfolders]
+        return Metadata(images, subfolders)
+
+    def to_dict(self, include_exif: bool = True) -> dict:
+        result: dict = {"version": METADATA_VERSION}
+        result["images"] = {k: v.to_dict(include_exif) for k, v in self.images.items()}
         if self.subfolders is not None:
-            result["subfolders"] = from_union([lambda x: from_list(lambda x: to_class(SubfolderMetadata, x), x), from_none], self.subfolders)
+            result["subfolders"] = [x.to_dict() for x in self.subfolders]
         return result
 
+    def exif_to_dict(self) -> dict:
+        """
+        Returns the EXIF and XMP data of all images, keyed by image name, for the
+        separately served EXIF file.
+        """
+        images = {}
+        for k, v in self.images.items():
+            exif = v.exif_to_dict()
+            if exif:
+                images[k] = exif
+        return {"version": METADATA_VERSION, "images": images}
+
     def sort(self, reverse=False) -> "Metadata":
         self.images = {key: self.images[key] for key in sorted(self.images, reverse=reverse)}
         return self
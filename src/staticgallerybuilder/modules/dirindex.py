@@ -0,0 +1,134 @@
+"""
+dirindex.py
+
+Enumerates each directory once with os.scandir and answers existence and type lookups
+from memory, instead of probing the filesystem per image. On network filesystems every
+probe is a round trip, so a folder of images otherwise costs hundreds of metadata calls.
+
+Listings of folders that will be processed soon can be prefetched on a small thread
+pool, so the latency of scanning them overlaps with processing the current folder. Each
+build uses its own DirectoryScanner, which keeps the prefetched listings and the counts.
+"""
+
+import logging
+import os
+import threading
+from collections import Counter
+from collections.abc import Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(name="defaultlogger.scan")
+
+
+@dataclass
+class DirectoryIndex:
+    path: str
+    names: list[str] = field(default_factory=list)
+    dirs: set[str] = field(default_factory=set)
+    files: set[str] = field(default_factory=set)
+    # counts the lookups, shared with the scanner that listed the directory
+    stats: Counter[str] = field(default_factory=Counter, repr=False, compare=False)
+
+    @staticmethod
+    def scan(path: str, stats: Counter[str] | None = None) -> "DirectoryIndex":
+        """
+        Lists a directory with a single scandir pass. A missing directory yields an empty index.
+        """
+        index = DirectoryIndex(path, stats=Counter() if stats is None else stats)
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    (index.dirs if is_dir else index.files).add(entry.name)
+        except FileNotFoundError:
+            pass
+        index.names = sorted(index.dirs | index.files)
+        return index
+
+    def exists(self, name: str) -> bool:
+        self.stats["lookups"] += 1
+        return name in self.files or name in self.dirs
+
+    def is_dir(self, name: str) -> bool:
+        self.stats["lookups"] += 1
+        return name in self.dirs
+
+
+class DirectoryScanner:
+    """
+    Lists the directories of one build, prefetching the ones it will need soon.
+    """
+
+    def __init__(self, stats: Counter[str] | None = None):
+        """
+        Args:
+            stats (Counter[str] | None): Receives the scandir calls, directory entries read,
+                lookups answered from memory and listings taken over from a prefetch.
+        """
+        self.stats: Counter[str] = Counter() if stats is None else stats
+        self.lock = threading.Lock()
+        # directories scanned ahead of the folder that consumes them
+        self.cache: dict[str, DirectoryIndex | Future[DirectoryIndex]] = {}
+        self.executor: ThreadPoolExecutor | None = None
+
+    def list_directory(self, path: str) -> DirectoryIndex:
+        index = DirectoryIndex.scan(path, self.stats)
+        with self.lock:
+            self.stats["scandir"] += 1
+            self.stats["entries"] += len(index.names)
+        return index
+
+    def resolve(self, value: "DirectoryIndex | Future[DirectoryIndex]") -> DirectoryIndex:
+        if isinstance(value, Future):
+            with self.lock:
+                self.stats["prefetched"] += 1
+            return value.result()
+        return value
+
+    def scan_directory(self, path: str) -> DirectoryIndex:
+        """
+        Returns the index of a directory, taking it over from the cache if it was scanned ahead.
+        """
+        index = self.cache.pop(path, None)
+        return self.resolve(index) if index is not None else self.list_directory(path)
+
+    def peek_directory(self, path: str) -> DirectoryIndex:
+        """
+        Returns the index of a directory and keeps it cached for the later scan_directory call.
+        """
+        index = self.cache.get(path)
+        if index is None:
+            index = self.list_directory(path)
+        index = self.cache[path] = self.resolve(index)
+        return index
+
+    def start_prefetch(self, threads: int) -> None:
+        """
+        Starts the prefetch thread pool. With fewer than one thread every folder is scanned
+        when it is needed.
+        """
+        if threads > 0:
+            self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="scan")
+
+    def stop_prefetch(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        self.cache.clear()
+
+    def prefetch_directories(self, paths: Iterable[str]) -> None:
+        """
+        Queues listings of directories that will be needed soon. Does nothing if prefetching is off.
+        """
+        if self.executor is None:
+            return
+        for path in paths:
+            if path not in self.cache:
+                self.cache[path] = self.executor.submit(self.list_directory, path)
+
+    def log_stats(self) -> None:
+        logger.info("directory scan statistics", extra=dict(self.stats))
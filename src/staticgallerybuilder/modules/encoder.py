@@ -0,0 +1,57 @@
+"""
+encoder.py
+
+Encoder presets for thumbnails, trading encode time against file size and quality. The
+settings are those Pillow exposes for JPEG; if Pillow is linked against mozjpeg, its
+trellis quantization applies on top of every preset.
+"""
+
+from dataclasses import dataclass
+
+from PIL import Image
+
+from ..modules.colorprofile import downscale
+
+THUMBNAIL_SIZE = 512
+
+
+@dataclass(frozen=True)
+class Preset:
+    description: str
+    resample: Image.Resampling
+    # downscale by an integer factor first when the image is this many times larger; None
+    # resamples the full image with the filter
+    reducing_gap: float | None
+    quality: int
+    optimize: bool
+    progressive: bool
+    # 0 = 4:4:4, 1 = 4:2:2, 2 = 4:2:0
+    subsampling: int
+
+    def save_options(self) -> dict:
+        return {"quality": self.quality, "optimize": self.optimize, "progressive": self.progressive, "subsampling": self.subsampling}
+
+
+# fmt: off
+PRESETS = {
+    "default": Preset("the settings of earlier versions", Image.Resampling.BICUBIC, 2.0, 50, True, False, 2),
+    "fast": Preset("cheaper filter and no Huffman table optimization, for slow CPUs", Image.Resampling.BILINEAR, 1.5, 50, False, False, 2),
+    "small": Preset("lower quality, for slow connections", Image.Resampling.BICUBIC, 2.0, 40, True, False, 2),
+    "progressive": Preset("progressive like mozjpeg's defaults, smaller than baseline only with mozjpeg", Image.Resampling.LANCZOS, 3.0, 50, True, True, 2),
+    "quality": Preset("sharper filter and higher quality, for fast connections", Image.Resampling.LANCZOS, None, 70, True, True, 2),
+}
+# fmt: on
+
+
+def make_thumbnail(img: Image.Image, preset: Preset) -> Image.Image:
+    """
+    Downscales an opened image to the thumbnail size and converts it to sRGB.
+    """
+    return downscale(img, THUMBNAIL_SIZE, preset.resample, preset.reducing_gap)[0]
+
+
+def save_thumbnail(img: Image.Image, fp, preset: Preset) -> None:
+    """
+    Encodes a thumbnail as JPEG to a path or file object.
+    """
+    img.save(fp, "JPEG", **preset.save_options())
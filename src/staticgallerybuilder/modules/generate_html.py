@@ -1,39 +1,110 @@
 import fnmatch
 import html
-import json
 import logging
 import os
 import re
+import time
 import urllib.parse
 from collections import defaultdict
+from collections.abc import Callable
+from dataclasses import dataclass, field
 from datetime import datetime
+from functools import partial
 from typing import Any
 
 from bs4 import BeautifulSoup
 from defusedxml import ElementTree
 from jinja2 import Environment, FileSystemLoader
-from PIL import ExifTags, Image, TiffImagePlugin, UnidentifiedImageError
+from PIL import ExifTags, Image, TiffImagePlugin
 from tqdm.auto import tqdm
 
-from ..modules import cclicense
+from ..modules import cclicense, jsonutil
 from ..modules.argumentparser import Args
-from ..modules.datatypes.metadata import ImageMetadata, Metadata, SubfolderMetadata
-from ..modules.util import resource_path
+from ..modules.compression import remove_precompressed
+from ..modules.datatypes.metadata import METADATA_VERSION, DisplaySize, ImageMetadata, Metadata, SubfolderMetadata
+from ..modules.dirindex import DirectoryIndex, DirectoryScanner
+from ..modules.metrics import Metrics
+from ..modules.placeholder import thumbnail_placeholder
+from ..modules.quarantine import Failure, Quarantine
+from ..modules.rawpreview import WEB_EXTENSIONS, open_metadata
+from ..modules.svg_handling import SERVICE_WORKER_FILE
+from ..modules.util import resource_path, write_if_changed
 
 # Constants for file paths and exclusions
 FAVICON_PATH = ".static/favicon.ico"
-GLOBAL_CSS_PATH = ".static/global.css"
-EXCLUDES = ["index.html", "manifest.json", "robots.txt"]
+DISPLAY_DIR = ".display"
+EXIF_FILE = ".exif.json"
+# seconds between metadata checkpoints while a folder is processed
+CHECKPOINT_INTERVAL = 60
+TAGINDEX_FILE = ".tagindex.json"
+PAGE_HTML_RE = re.compile(r"^index-(\d+)\.html$")
+PAGE_METADATA_RE = re.compile(r"^\.metadata-(\d+)\.json$")
+EXCLUDES = ["index.html", "index.html.gz", "index.html.br", "manifest.json", "robots.txt", SERVICE_WORKER_FILE, f"{SERVICE_WORKER_FILE}.gz", f"{SERVICE_WORKER_FILE}.br"]
 
 # Set the maximum image pixels
 Image.MAX_IMAGE_PIXELS = 933120000
 
 # Initialize Jinja2 environment for template rendering
 env = Environment(loader=FileSystemLoader(resource_path("templates")))
-thumbnails: list[tuple[str, str, str]] = []
-info: dict[str, str] = {}
-folder_licenses: dict[str, str] = {}
 logger = logging.getLogger(name="defaultlogger")
+image_logger = logging.getLogger(name="defaultlogger.metadata")
+
+
+@dataclass
+class FolderScan:
+    files: DirectoryIndex
+    thumbnails: DirectoryIndex
+    display: DirectoryIndex
+
+
+@dataclass
+class PendingFolder:
+    """
+    A folder whose metadata and pages wait for the placeholders of its new thumbnails.
+    """
+
+    metadata: Metadata
+    finish: Callable[[], None]
+
+
+@dataclass
+class BuildState:
+    """
+    What a build collects while walking the folders. The Builder creates one per build and
+    passes it down, so builds in one process never share it.
+    """
+
+    metrics: Metrics
+    quarantine: Quarantine
+    scanner: DirectoryScanner
+    # job arguments for the worker pool; the last element is the pixel count of the image to decode
+    thumbnails: list[tuple[str, str, str, int]] = field(default_factory=list)
+    derivatives: list[tuple[str, list[tuple[int, str]], int]] = field(default_factory=list)
+    # info and LICENSE texts by quoted folder path
+    info: dict[str, str] = field(default_factory=dict)
+    folder_licenses: dict[str, str] = field(default_factory=dict)
+    # generated text files, for precompression
+    outputs: list[str] = field(default_factory=list)
+    # folders written once their thumbnails are generated, by folder path
+    pending: dict[str, PendingFolder] = field(default_factory=dict)
+
+    def write(self, path: str, content: str) -> int:
+        """
+        Writes a generated file with write_if_changed and counts the bytes written.
+        """
+        written = write_if_changed(path, content)
+        self.metrics.counters["bytes_written"] += written
+        return written
+
+
+@dataclass
+class Page:
+    number: int
+    count: int
+    metadata: str
+    tagindex: str
+    prev: str | None = None
+    next: str | None = None
 
 
 def getxmp(strbuffer: str) -> dict[str, Any]:
@@ -90,20 +161,29 @@ def initialize_metadata(folder: str) -> Metadata:
     with open(metadata_path, "r+", encoding="utf-8") as metadatafile:
         logger.info("reading metadata file", extra={"file": metadata_path})
         try:
-            metadata = json.loads(metadatafile.read())
-        except json.decoder.JSONDecodeError:
+            metadata = jsonutil.loads(metadatafile.read())
+        except jsonutil.JSONDecodeError:
             logger.warning("invalid JSON in metadata file", extra={"file": metadata_path})
             metadata = {}
+    merge_exif_file(metadata, folder)
+
+    # files written by this version are already in the current format
+    if isinstance(metadata, dict) and metadata.get("version") == METADATA_VERSION:
+        try:
+            return Metadata.from_trusted_dict(metadata)
+        except (AssertionError, KeyError, AttributeError, TypeError):
+            logger.warning("malformed metadata file, falling back to validation", extra={"file": metadata_path})
 
     # remove old sizelist if it exists
     sizelist_path = os.path.join(folder, ".sizelist.json")
     if os.path.exists(sizelist_path):
         with open(sizelist_path) as sizelist:
-            metadata = json.loads(sizelist.read())
+            metadata = jsonutil.loads(sizelist.read())
         logger.warning("found old .sizelist.json, removing it...", extra={"path": sizelist_path})
         os.remove(sizelist_path)
 
     # convert from old metadata format
+    metadata.pop("version", None)
     if "images" not in metadata and "subfolders" not in metadata:
         images = metadata.copy()
         metadata = {}
@@ -126,51 +206,131 @@ def initialize_metadata(folder: str) -> Metadata:
         if "title" not in v:
             metadata["images"][k]["title"] = v["name"]
 
-    return Metadata.from_dict(metadata)
+    try:
+        return Metadata.from_dict(metadata)
+    except AssertionError as e:
+        raise ValueError(f"malformed metadata file {metadata_path}, e.g. tags that are not a list of strings") from e
 
 
-def update_metadata(metadata: Metadata, folder: str) -> None:
+def merge_exif_file(metadata: dict[str, Any], folder: str) -> None:
+    """
+    Merges the EXIF data from a split-off EXIF file back into the raw metadata dictionary.
+
+    Args:
+        metadata (dict[str, Any]): The raw metadata dictionary as read from .metadata.json.
+        folder (str): The folder in which the metadata file is located.
+    """
+    exif_path = os.path.join(folder, EXIF_FILE)
+    if not isinstance(metadata, dict) or not isinstance(metadata.get("images"), dict) or not os.path.exists(exif_path):
+        return
+    with open(exif_path, encoding="utf-8") as exiffile:
+        logger.info("reading exif file", extra={"file": exif_path})
+        try:
+            exif = jsonutil.loads(exiffile.read())
+        except jsonutil.JSONDecodeError:
+            logger.warning("invalid JSON in exif file", extra={"file": exif_path})
+            return
+    images = metadata["images"]
+    for k, v in exif.get("images", {}).items():
+        if k in images:
+            images[k].update(v)
+
+
+def metadata_content(state: BuildState, metadata: Metadata, folder: str, exif_url: str | None) -> dict[str, Any]:
+    """
+    Builds the content of the metadata file and writes or removes the separate EXIF file.
+
+    Args:
+        state (BuildState): The state of the build.
+        metadata (Metadata): The metadata of the folder.
+        folder (str): The folder in which the metadata file is located.
+        exif_url (str | None): If set, EXIF data is written to a separate file served at this URL
+            and left out of the metadata file.
+
+    Returns:
+        dict[str, Any]: The content of the metadata file.
+    """
+    exif_path = os.path.join(folder, EXIF_FILE)
+    content = metadata.to_dict(include_exif=exif_url is None)
+    add_tag_index(content, list(metadata.images.values()))
+    if exif_url is not None:
+        content["exif"] = exif_url
+        if state.write(exif_path, jsonutil.dumps(metadata.exif_to_dict(), indent=False)):
+            logger.info("wrote exif file", extra={"file": exif_path})
+    elif os.path.exists(exif_path):
+        logger.info("removing exif file", extra={"file": exif_path})
+        os.remove(exif_path)
+        remove_precompressed(exif_path)
+    return content
+
+
+def checkpoint_metadata(state: BuildState, metadata: Metadata, folder: str, exif_url: str | None = None) -> None:
+    """
+    Saves the metadata of a folder that is still being processed, so an interrupted build
+    does not extract it again. update_metadata replaces it once the folder is done.
+
+    Args:
+        state (BuildState): The state of the build.
+        metadata (Metadata): The metadata collected so far.
+        folder (str): The folder in which the metadata file is located.
+        exif_url (str | None): If set, EXIF data is written to a separate file served at this URL
+            and left out of the metadata file.
+    """
+    if metadata.images:
+        metadata_path = os.path.join(folder, ".metadata.json")
+        content = metadata_content(state, metadata, folder, exif_url)
+        if state.write(metadata_path, jsonutil.dumps(content)):
+            logger.info("wrote metadata checkpoint", extra={"file": metadata_path, "images": len(metadata.images)})
+
+
+def update_metadata(state: BuildState, metadata: Metadata, folder: str, exif_url: str | None = None) -> None:
     """
     Updates the metadata JSON file.
 
     Args:
+        state (BuildState): The state of the build.
         metadata (dict[str, dict[str, int]]): The metadata dictionary to be written to the file.
         folder (str): The folder in which the metadata file is located.
+        exif_url (str | None): If set, EXIF data is written to a separate file served at this URL
+            and left out of the metadata file.
     """
     metadata_path = os.path.join(folder, ".metadata.json")
     if metadata:
-        if os.path.exists(metadata_path):
-            logger.info("updating metadata file", extra={"file": metadata_path})
-            with open(metadata_path, "w", encoding="utf-8") as metadatafile:
-                metadatafile.write(json.dumps(metadata.to_dict(), indent=4))
-        else:
-            logger.info("creating metadata file", extra={"file": metadata_path})
-            with open(metadata_path, "x", encoding="utf-8") as metadatafile:
-                metadatafile.write(json.dumps(metadata.to_dict(), indent=4))
+        content = metadata_content(state, metadata, folder, exif_url)
+        if exif_url is not None:
+            state.outputs.append(os.path.join(folder, EXIF_FILE))
+        if state.write(metadata_path, jsonutil.dumps(content)):
+            logger.info("updated metadata file", extra={"file": metadata_path})
+        state.outputs.append(metadata_path)
     else:
         if os.path.exists(metadata_path):
             logger.info("deleting empty metadata file", extra={"file": metadata_path})
             os.remove(metadata_path)
+            remove_precompressed(metadata_path)
 
 
-def get_image_info(item: str, folder: str) -> ImageMetadata | None:
+def get_image_info(state: BuildState, item: str, folder: str, sidecar: bool) -> ImageMetadata | None:
     """
     Extracts image information and EXIF data.
 
     Args:
+        state (BuildState): The state of the build, quarantining unreadable images.
         item (str): The image file name.
         folder (str): The folder containing the image.
+        sidecar (bool): Whether the image has an XMP sidecar file, as found in the folder listing.
 
     Returns:
         dict[str, Any]: A dictionary containing image width, height, and EXIF data.
     """
     file = os.path.join(folder, item)
     try:
-        with Image.open(file) as img:
-            logger.info("extracting image information", extra={"file": file})
-            width, height = img.size
+        img, (width, height) = open_metadata(file)
+        with img:
+            image_logger.info("extracting image information", extra={"file": file})
             try:
                 exif = img.getexif()
+                # TIFF files read the Exif IFD from the open file
+                exififd = exif.get_ifd(ExifTags.IFD.Exif) if exif else {}
             except Exception:
                 exif = None
             try:
@@ -178,14 +338,14 @@ def get_image_info(item: str, folder: str) -> ImageMetadata | None:
             except Exception:
                 xmpdata = None
 
-    except UnidentifiedImageError:
-        logger.error("cannot identify image file", extra={"file": file})
-        print(f"cannot identify image file: {file}")
+    except OSError as e:
+        # unidentified formats as well as truncated or unreadable files
+        image_logger.error("cannot read image file", extra={"file": file, "error": str(e)})
+        state.quarantine.add(file, "metadata", str(e))
         return None
     if exif:
-        logger.info("extracting EXIF data", extra={"file": file})
-        ifd = exif.get_ifd(ExifTags.IFD.Exif)
-        exifdatas = dict(exif.items()) | ifd
+        image_logger.info("extracting EXIF data", extra={"file": file})
+        exifdatas = dict(exif.items()) | exififd
         exifdata = {}
         for tag_id in exifdatas:
             tag = ExifTags.TAGS.get(tag_id, tag_id)
@@ -212,7 +372,7 @@ def get_image_info(item: str, folder: str) -> ImageMetadata | None:
                     content = None
             exifdata[tag] = content
         if "Orientation" in exifdata and exifdata["Orientation"] in [6, 8]:
-            logger.info("image is rotated", extra={"file": file})
+            image_logger.info("image is rotated", extra={"file": file})
             width, height = height, width
         for key in ["PrintImageMatching", "UserComment", "MakerNote"]:
             if key in exifdata:
@@ -222,7 +382,7 @@ def get_image_info(item: str, folder: str) -> ImageMetadata | None:
     tags = []
     xmp = None
     if xmpdata:
-        logger.info("extracting XMP data", extra={"file": file})
+        image_logger.info("extracting XMP data", extra={"file": file})
         try:
             tags = xmpdata["xmpmeta"]["RDF"]["Description"]["subject"]["Bag"]["li"]
             if isinstance(tags, str):
@@ -256,12 +416,12 @@ def get_image_info(item: str, folder: str) -> ImageMetadata | None:
         except KeyError:
             pass
     sidecarfile = os.path.join(folder, item + ".xmp")
-    if os.path.exists(sidecarfile):
-        logger.info("xmp sidecar file found", extra={"file": sidecarfile})
+    if sidecar:
+        image_logger.info("xmp sidecar file found", extra={"file": sidecarfile})
         try:
             tags = get_tags(sidecarfile)
         except Exception as e:
-            logger.error(e)
+            image_logger.error(e)
     if None in tags:  # type: ignore
         tags.remove(None)  # type: ignore
     if not isinstance(tags, list):
@@ -295,6 +455,61 @@ def parse_hierarchical_tags(tags, delimiter="|"):
     return finalize(tree)
 
 
+def render_tag_tree(tree: dict[str, Any], depth: int = 0) -> str:
+    """
+    Renders a hierarchical tag tree as the indented tooltip text shown on images.
+
+    Args:
+        tree (dict[str, Any]): The tag tree from parse_hierarchical_tags().
+        depth (int): The current indentation depth.
+
+    Returns:
+        str: The tooltip text.
+    """
+    lines = []
+    for key, value in tree.items():
+        lines.append("&nbsp;&nbsp;" * depth + key)
+        if value:
+            lines.append(render_tag_tree(value, depth + 1))
+    return "\n".join(lines)
+
+
+def tag_postings(images: list[ImageMetadata]) -> dict[str, list[int]]:
+    """
+    Builds an inverted index mapping every tag, including its expanded parent prefixes,
+    to the positions of the images carrying it.
+
+    Args:
+        images (list[ImageMetadata]): The images in display order.
+
+    Returns:
+        dict[str, list[int]]: Sorted image positions per tag.
+    """
+    postings: defaultdict[str, list[int]] = defaultdict(list)
+    for index, img in enumerate(images):
+        keys = set()
+        for tag in img.tags or []:
+            keys.update(expand_tag(tag))
+        for key in keys:
+            postings[key].append(index)
+    return dict(sorted(postings.items()))
+
+
+def add_tag_index(content: dict[str, Any], images: list[ImageMetadata]) -> None:
+    """
+    Adds the tag postings and pre-rendered tag tooltips to a serialised metadata document,
+    so the browser can filter by set intersection instead of scanning every image.
+
+    Args:
+        content (dict[str, Any]): The serialised metadata, with images in the same order as `images`.
+        images (list[ImageMetadata]): The images in display order.
+    """
+    for img, entry in zip(images, content["images"].values(), strict=True):
+        if img.tags:
+            entry["tagtitle"] = render_tag_tree(parse_hierarchical_tags(img.tags))
+    content["tagindex"] = tag_postings(images)
+
+
 def get_tags(sidecarfile: str) -> list[str]:
     """
     Extracts Tags from XMP sidecar file
@@ -305,7 +520,7 @@ def get_tags(sidecarfile: str) -> list[str]:
     Returns:
         list[str]: List containing image tags.
     """
-    logger.info("extracting XMP sidecar file data", extra={"file": sidecarfile})
+    image_logger.info("extracting XMP sidecar file data", extra={"file": sidecarfile})
     with open(sidecarfile) as sidecar:
         strbuffer = sidecar.read()
     if strbuffer == "":
@@ -349,35 +564,47 @@ def get_tags(sidecarfile: str) -> list[str]:
     return tags  # type: ignore
 
 
-def process_image(item: str, folder: str, _args: Args, baseurl: str, metadata: Metadata, raw: list[str]) -> tuple[ImageMetadata | None, Metadata]:
+def process_image(
+    state: BuildState, item: str, folder: str, _args: Args, baseurl: str, metadata: Metadata, raw: list[str], scan: FolderScan
+) -> tuple[ImageMetadata | None, Metadata]:
     """
     Processes an image and prepares its data for the HTML template.
 
     Args:
+        state (BuildState): The state of the build.
         item (str): The image file name.
         folder (str): The folder containing the image.
         _args (Args): Parsed command line arguments.
         baseurl (str): Base URL for the web root.
         metadata (dict[str, dict[str, int]]): dictionary containing size information for images.
         raw (list[str]): list of raw image file extensions.
+        scan (FolderScan): Listings of the folder and its thumbnail and display folders.
 
     Returns:
         dict[str, Any]: dictionary containing image details for HTML rendering.
     """
     extsplit = os.path.splitext(item)
     sidecarfile = os.path.join(folder, item + ".xmp")
-    if item not in metadata.images or _args.reread_metadata:
-        imgmetadata = get_image_info(item, folder)
+    quarantined = state.quarantine.lookup(os.path.join(folder, item))
+    if quarantined and item not in metadata.images:
+        image_logger.debug("skipping quarantined image", extra={"file": os.path.join(folder, item), "error": quarantined.error})
+        return None, metadata
+    if (item not in metadata.images or _args.reread_metadata) and not quarantined:
+        state.metrics.counters["metadata_cache_misses"] += 1
+        imgmetadata = get_image_info(state, item, folder, scan.files.exists(item + ".xmp"))
         if imgmetadata:
             metadata.images[item] = imgmetadata
         else:
             return None, metadata
-    if _args.reread_sidecar and os.path.exists(sidecarfile):
-        logger.info("xmp sidecar file found", extra={"file": sidecarfile})
+    else:
+        state.metrics.counters["metadata_cache_hits"] += 1
+    state.metrics.counters["images"] += 1
+    if _args.reread_sidecar and scan.files.exists(item + ".xmp"):
+        image_logger.info("xmp sidecar file found", extra={"file": sidecarfile})
         try:
             metadata.images[item].tags = get_tags(sidecarfile)
         except Exception as e:
-            logger.error(e)
+            image_logger.error(e)
 
     image = metadata.images[item]
     image.src = f"{_args.web_root_url}{baseurl}{urllib.parse.quote(item)}"
@@ -385,15 +612,25 @@ def process_image(item: str, folder: str, _args: Args, baseurl: str, metadata: M
     image.name = item
     image.title = item
 
-    path = os.path.join(_args.root_directory, ".thumbnails", baseurl, item + ".jpg")
-    if not os.path.exists(path) or _args.regenerate_thumbnails:
-        if os.path.exists(path):
-            os.remove(path)
-        thumbnails.append((folder, item, _args.root_directory))
+    if quarantined:
+        # thumbnailing failed in an earlier run and the image has not changed since
+        pass
+    elif not scan.thumbnails.exists(item + ".jpg") or _args.regenerate_thumbnails:
+        if scan.thumbnails.exists(item + ".jpg"):
+            os.remove(os.path.join(scan.thumbnails.path, item + ".jpg"))
+        state.thumbnails.append((folder, item, _args.root_directory, image.w * image.h))
+    elif image.placeholder is None:
+        # thumbnails from before placeholders existed; decoding them at 1/8 scale is cheap enough to do here
+        thumbnail = os.path.join(scan.thumbnails.path, item + ".jpg")
+        try:
+            image.placeholder, image.color = thumbnail_placeholder(thumbnail)
+        except OSError as e:
+            image_logger.warning("cannot read thumbnail for placeholder", extra={"path": thumbnail, "error": str(e)})
+
+    image.sizes = None if quarantined else display_sizes(state, image, item, folder, baseurl, _args, scan.display)
 
     for _raw in raw:
-        file = os.path.join(folder, extsplit[0] + _raw)
-        if os.path.exists(file):
+        if scan.files.exists(extsplit[0] + _raw):
             url = f"{_args.web_root_url}{baseurl}{urllib.parse.quote(extsplit[0])}{_raw}"
             if _raw in (".tif", ".tiff"):
                 image.tiff = url
@@ -405,23 +642,73 @@ def process_image(item: str, folder: str, _args: Args, baseurl: str, metadata: M
     return image, metadata
 
 
-def generate_html(folder: str, title: str, _args: Args, raw: list[str], version: str, logo: str) -> set[str]:
+def wants_display_copies(_args: Args) -> bool:
+    """
+    Returns whether the build produces display copies: downscaled ones with --display-size,
+    full-size ones of images browsers cannot show. Otherwise the display tree is not scanned.
+    """
+    return bool(_args.display_sizes) or any(ext.lower() not in WEB_EXTENSIONS for ext in _args.file_extensions)
+
+
+def display_sizes(state: BuildState, image: ImageMetadata, item: str, folder: str, baseurl: str, _args: Args, existing: DirectoryIndex) -> list[DisplaySize] | None:
+    """
+    Lists the downscaled viewer copies of an image and queues the missing ones. Only sizes
+    smaller than the original are produced; above that the original is shown. Browsers
+    cannot show RAW or TIFF originals, so those always get a full-size copy as well.
+
+    Args:
+        state (BuildState): The state of the build, collecting the missing copies.
+        image (ImageMetadata): The image metadata.
+        item (str): The image file name.
+        folder (str): The folder containing the image.
+        baseurl (str): Base URL for the web root.
+        _args (Args): Parsed command line arguments.
+        existing (DirectoryIndex): Listing of the folder's display copies.
+
+    Returns:
+        list[DisplaySize] | None: The copies, smallest first, or None if none are needed.
+    """
+    longest = max(image.w, image.h)
+    wanted = [size for size in _args.display_sizes if size < longest]
+    if os.path.splitext(item)[1].lower() not in WEB_EXTENSIONS:
+        wanted.append(longest)
+    if not wanted and not _args.display_sizes:
+        return None
+    sizes = []
+    missing = []
+    for size in wanted:
+        name = f"{item}.{size}.jpg"
+        path = os.path.join(existing.path, name)
+        sizes.append(
+            DisplaySize(w=round(image.w * size / longest), h=round(image.h * size / longest), src=f"{_args.web_root_url}{DISPLAY_DIR}/{baseurl}{urllib.parse.quote(name)}")
+        )
+        if not existing.exists(name):
+            missing.append((size, path))
+    if missing:
+        state.derivatives.append((os.path.join(folder, item), missing, image.w * image.h))
+    return sizes
+
+
+def generate_html(state: BuildState, folder: str, title: str, _args: Args, raw: list[str], version: str, logo: str) -> set[str]:
     """
     Generates HTML content for a folder of images.
 
     Args:
+        state (BuildState): The state of the build.
         folder (str): The folder to generate HTML for.
         title (str): The title of the HTML page.
         _args (Args): Parsed command line arguments.
         raw (list[str]): Raw image file names.
     """
     logger.info("processing folder", extra={"folder": folder})
+    state.metrics.counters["folders"] += 1
     if _args.regenerate_thumbnails:
         if os.path.exists(os.path.join(folder, ".metadata.json")):
             logger.info("removing .metadata.json", extra={"folder": folder})
             os.remove(os.path.join(folder, ".metadata.json"))
     metadata = initialize_metadata(folder)
-    items = sorted(os.listdir(folder))
+    listing = state.scanner.scan_directory(folder)
+    items = listing.names
 
     contains_files = False
     images: list[ImageMetadata] = []
@@ -436,41 +723,233 @@ def generate_html(folder: str, title: str, _args: Args, raw: list[str], version:
         del metadata.images[gon]
 
     create_thumbnail_folder(foldername, _args.root_directory)
+    display_path = os.path.join(_args.root_directory, DISPLAY_DIR, foldername)
+    scan = FolderScan(
+        files=listing,
+        thumbnails=state.scanner.scan_directory(os.path.join(_args.root_directory, ".thumbnails", foldername)),
+        display=state.scanner.scan_directory(display_path) if wants_display_copies(_args) else DirectoryIndex(display_path),
+    )
+    prefetch_subfolders(state, folder, foldername, listing, _args)
 
     logger.info("processing contents", extra={"folder": folder})
     if not _args.non_interactive_mode:
         iterator = tqdm(items, total=len(items), desc=f"Getting image infos - {folder}", unit="files", ascii=True, dynamic_ncols=True, leave=False)
     else:
         iterator = items
-    for item in iterator:
-        if item not in EXCLUDES and not item.startswith(".") and os.path.splitext(item)[1][1:].lower() not in _args.ignore_extensions:
-            if os.path.isdir(os.path.join(folder, item)):
-                subfoldertags.update(process_subfolder(item, folder, baseurl, subfolders, _args, raw, version, logo))
-            else:
-                contains_files = True
-                if os.path.splitext(item)[1].lower() in _args.file_extensions:
-                    img, metadata = process_image(item, folder, _args, baseurl, metadata, raw)
-                    if img:
-                        images.append(img)
-                if item == "info":
-                    process_info_file(folder, item)
-                if item == "LICENSE":
-                    process_license(folder, item)
+    exif_url = f"{_args.web_root_url}{baseurl}{EXIF_FILE}" if _args.split_exif else None
+    queued = len(state.thumbnails)
+    last_checkpoint = time.monotonic()
+    try:
+        for item in iterator:
+            if is_page_file(item):
+                continue
+            if item not in EXCLUDES and not item.startswith(".") and os.path.splitext(item)[1][1:].lower() not in _args.ignore_extensions:
+                if scan.files.is_dir(item):
+                    subfoldertags.update(process_subfolder(state, item, folder, baseurl, subfolders, _args, raw, version, logo))
+                else:
+                    contains_files = True
+                    if os.path.splitext(item)[1].lower() in _args.file_extensions:
+                        img, metadata = process_image(state, item, folder, _args, baseurl, metadata, raw, scan)
+                        if img:
+                            images.append(img)
+                        if time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                            checkpoint_metadata(state, metadata, folder, exif_url)
+                            last_checkpoint = time.monotonic()
+                    if item == "info":
+                        process_info_file(state, folder, item)
+                    if item == "LICENSE":
+                        process_license(state, folder, item)
+    except BaseException:
+        # keep what was extracted so far, so the next run does not read these images again
+        checkpoint_metadata(state, metadata, folder, exif_url)
+        raise
 
     metadata.subfolders = subfolders
     if _args.reverse_sort:
         metadata.sort(reverse=True)
     else:
         metadata.sort()
-    update_metadata(metadata, folder)
+    generate = should_generate_html(images, contains_files, _args)
+    tags = folder_tags(list(metadata.images.values()), subfoldertags) if generate else subfoldertags
+    finish = partial(finish_folder, state, folder, title, foldername, baseurl, metadata, subfolders, generate, subfoldertags, items, exif_url, _args, version, logo)
+    if any(job[0] == folder for job in state.thumbnails[queued:]):
+        # written with the placeholders once the thumbnails exist, so one build leaves the folder final
+        checkpoint_metadata(state, metadata, folder, exif_url)
+        state.pending[folder] = PendingFolder(metadata, finish)
+    else:
+        finish()
+    return tags
+
+
+def finish_folder(
+    state: BuildState,
+    folder: str,
+    title: str,
+    foldername: str,
+    baseurl: str,
+    metadata: Metadata,
+    subfolders: list[SubfolderMetadata],
+    generate: bool,
+    subfoldertags: set[str],
+    items: list[str],
+    exif_url: str | None,
+    _args: Args,
+    version: str,
+    logo: str,
+) -> None:
+    """
+    Writes the metadata, metadata pages and HTML files of a processed folder.
 
-    if should_generate_html(images, contains_files, _args):
-        subfoldertags = create_html_file(folder, title, foldername, images, subfolders, _args, version, logo, subfoldertags)
+    Args:
+        state (BuildState): The state of the build.
+        folder (str): The folder path.
+        title (str): The title of the HTML page.
+        foldername (str): The folder path relative to the root directory.
+        baseurl (str): Base URL for the web root.
+        metadata (Metadata): The folder metadata.
+        subfolders (list[SubfolderMetadata]): The subfolders of the folder.
+        generate (bool): Whether the folder gets an HTML page, see should_generate_html.
+        subfoldertags (set[str]): The tags of the subfolders.
+        items (list[str]): The folder listing.
+        exif_url (str | None): URL of the separate EXIF file, None if EXIF data is kept in the metadata file.
+        _args (Args): Parsed command line arguments.
+    """
+    update_metadata(state, metadata, folder, exif_url)
+    pages = write_metadata_pages(state, metadata, folder, baseurl, _args, items)
+
+    if generate:
+        create_html_file(state, folder, title, foldername, list(metadata.images.values()), subfolders, _args, version, logo, subfoldertags, pages)
     else:
         if os.path.exists(os.path.join(folder, "index.html")):
             logger.info("removing existing index.html", extra={"folder": folder})
             os.remove(os.path.join(folder, "index.html"))
-    return subfoldertags
+            remove_precompressed(os.path.join(folder, "index.html"))
+
+
+def finish_pending(state: BuildState, results: list[tuple[str, str, str, str, int] | Failure | None]) -> None:
+    """
+    Adds the placeholders computed while thumbnailing to the metadata of the folders
+    waiting for them, and writes these folders.
+
+    Args:
+        state (BuildState): The state of the build.
+        results (list[tuple[str, str, str, str, int] | Failure | None]): (folder, item,
+            placeholder, color, bytes written) for every thumbnail job, or the failure.
+    """
+    for result in results:
+        if isinstance(result, tuple):
+            folder, item, placeholder, color, _ = result
+            pending = state.pending.get(folder)
+            if pending and item in pending.metadata.images:
+                pending.metadata.images[item].placeholder = placeholder
+                pending.metadata.images[item].color = color
+    folders = list(state.pending.values())
+    state.pending.clear()
+    for pending in folders:
+        pending.finish()
+
+
+def is_page_file(item: str) -> bool:
+    """
+    Checks whether a file is a generated page of a paginated folder, or a precompressed copy of one.
+
+    Args:
+        item (str): The file name.
+
+    Returns:
+        bool: True if the file was generated by the pagination.
+    """
+    return bool(PAGE_HTML_RE.match(item.removesuffix(".gz").removesuffix(".br")))
+
+
+def page_filename(number: int) -> str:
+    return "index.html" if number == 1 else f"index-{number}.html"
+
+
+def page_url(_args: Args, baseurl: str, number: int) -> str:
+    if number == 1 and not _args.web_root_url.startswith("file://"):
+        return f"{_args.web_root_url}{baseurl}"
+    return f"{_args.web_root_url}{baseurl}{page_filename(number)}"
+
+
+def expand_tag(tag: str, delimiter: str = "|") -> list[str]:
+    """
+    Expands a hierarchical tag into itself and all of its parent prefixes, as selected
+    in the tag filter (e.g. "a|b|c" -> ["a|", "a|b|", "a|b|c"]).
+
+    Args:
+        tag (str): The hierarchical tag.
+        delimiter (str): The hierarchy delimiter.
+
+    Returns:
+        list[str]: The tag and its parent prefixes.
+    """
+    parts = tag.split(delimiter)
+    return [delimiter.join(parts[:i]) + delimiter for i in range(1, len(parts))] + [tag]
+
+
+def write_metadata_pages(state: BuildState, metadata: Metadata, folder: str, baseurl: str, _args: Args, items: list[str]) -> list[Page]:
+    """
+    Splits the images of a folder into metadata chunks of `page_size` images and writes a
+    folder-level tag index mapping each tag to the folder-wide positions of its images.
+    Stale pages from previous runs are removed.
+
+    Args:
+        state (BuildState): The state of the build.
+        metadata (Metadata): The folder metadata.
+        folder (str): The folder path.
+        baseurl (str): Base URL for the web root.
+        _args (Args): Parsed command line arguments.
+        items (list[str]): The folder listing.
+
+    Returns:
+        list[Page]: The pages, or an empty list if the folder is not paginated.
+    """
+    images = list(metadata.images.values())
+    size = _args.page_size
+    count = -(-len(images) // size) if size and len(images) > size else 0
+
+    for item in items:
+        match = PAGE_HTML_RE.match(item) or PAGE_METADATA_RE.match(item)
+        if match and int(match[1]) > count:
+            logger.info("removing stale page", extra={"file": os.path.join(folder, item)})
+            os.remove(os.path.join(folder, item))
+            remove_precompressed(os.path.join(folder, item))
+    tagindex_path = os.path.join(folder, TAGINDEX_FILE)
+    if not count:
+        if TAGINDEX_FILE in items:
+            os.remove(tagindex_path)
+            remove_precompressed(tagindex_path)
+        return []
+
+    logger.info("writing metadata pages", extra={"folder": folder, "pages": count})
+    tagindex_url = f"{_args.web_root_url}{baseurl}{TAGINDEX_FILE}"
+    pages: list[Page] = []
+    for number in range(1, count + 1):
+        chunk = images[(number - 1) * size : number * size]
+        content: dict[str, Any] = {"version": METADATA_VERSION, "page": number, "pages": count}
+        content["images"] = {img.name: img.to_dict(include_exif=not _args.split_exif) for img in chunk}
+        add_tag_index(content, chunk)
+        if _args.split_exif:
+            content["exif"] = f"{_args.web_root_url}{baseurl}{EXIF_FILE}"
+        path = os.path.join(folder, f".metadata-{number}.json")
+        state.write(path, jsonutil.dumps(content, indent=False))
+        state.outputs.append(path)
+        pages.append(
+            Page(
+                number=number,
+                count=count,
+                metadata=f"{_args.web_root_url}{baseurl}.metadata-{number}.json",
+                tagindex=tagindex_url,
+                prev=page_url(_args, baseurl, number - 1) if number > 1 else None,
+                next=page_url(_args, baseurl, number + 1) if number < count else None,
+            )
+        )
+
+    tagindex = {"version": METADATA_VERSION, "pagesize": size, "pages": [page.metadata for page in pages], "tags": tag_postings(images)}
+    state.write(tagindex_path, jsonutil.dumps(tagindex, indent=False))
+    state.outputs.append(tagindex_path)
+    return pages
 
 
 def create_thumbnail_folder(foldername: str, root_directory: str) -> None:
@@ -487,11 +966,44 @@ def create_thumbnail_folder(foldername: str, root_directory: str) -> None:
         os.mkdir(thumbnails_path)
 
 
-def process_subfolder(item: str, folder: str, baseurl: str, subfolders: list[SubfolderMetadata], _args: Args, raw: list[str], version: str, logo: str) -> set[str]:
+def is_excluded(folder: str, item: str, _args: Args) -> bool:
+    return item in _args.exclude_folders or any(fnmatch.fnmatchcase(os.path.join(folder, item), exclude) for exclude in _args.exclude_folders)
+
+
+def prefetch_subfolders(state: BuildState, folder: str, foldername: str, listing: DirectoryIndex, _args: Args) -> None:
+    """
+    Queues the listings the subfolders of a folder will need, so they are read in the
+    background while this folder is processed.
+
+    Args:
+        state (BuildState): The state of the build.
+        folder (str): The folder path.
+        foldername (str): The folder path relative to the root directory.
+        listing (DirectoryIndex): The folder listing.
+        _args (Args): Parsed command line arguments.
+    """
+    paths = []
+    for item in listing.names:
+        if item in EXCLUDES or item.startswith(".") or not listing.is_dir(item):
+            continue
+        if not is_excluded(folder, item, _args):
+            paths.append(os.path.join(folder, item))
+            paths.append(os.path.join(_args.root_directory, ".thumbnails", foldername, item, ""))
+            if wants_display_copies(_args):
+                paths.append(os.path.join(_args.root_directory, DISPLAY_DIR, foldername, item, ""))
+        elif _args.folder_thumbs:
+            paths.append(os.path.join(folder, item))
+    state.scanner.prefetch_directories(paths)
+
+
+def process_subfolder(
+    state: BuildState, item: str, folder: str, baseurl: str, subfolders: list[SubfolderMetadata], _args: Args, raw: list[str], version: str, logo: str
+) -> set[str]:
     """
     Processes a subfolder.
 
     Args:
+        state (BuildState): The state of the build.
         item (str): The name of the subfolder.
         folder (str): The parent folder containing the subfolder.
         baseurl (str): Base URL for the web root.
@@ -504,28 +1016,31 @@ def process_subfolder(item: str, folder: str, baseurl: str, subfolders: list[Sub
         if _args.web_root_url.startswith("file://")
         else f"{_args.web_root_url}{baseurl}{urllib.parse.quote(item)}"
     )
+    excluded = is_excluded(folder, item, _args)
     thumb = None
     if _args.folder_thumbs:
-        thumbitems = [i for i in sorted(os.listdir(os.path.join(folder, item))) if os.path.splitext(i)[1].lower() in _args.file_extensions]
+        # the listing is kept for generate_html of the subfolder, so it is only read once
+        listing = state.scanner.scan_directory(os.path.join(folder, item)) if excluded else state.scanner.peek_directory(os.path.join(folder, item))
+        thumbitems = [i for i in listing.names if os.path.splitext(i)[1].lower() in _args.file_extensions]
         if len(thumbitems) > 0:
             if _args.reverse_sort:
                 thumb = f"{_args.web_root_url}.thumbnails/{baseurl}{urllib.parse.quote(item)}/{urllib.parse.quote(thumbitems[-1])}.jpg"
             else:
                 thumb = f"{_args.web_root_url}.thumbnails/{baseurl}{urllib.parse.quote(item)}/{urllib.parse.quote(thumbitems[0])}.jpg"
 
-    if item not in _args.exclude_folders:
-        if not any(fnmatch.fnmatchcase(os.path.join(folder, item), exclude) for exclude in _args.exclude_folders):
-            subfolders.append(SubfolderMetadata(url=subfolder_url, name=item, thumb=thumb, metadata=f"{_args.web_root_url}{baseurl}{urllib.parse.quote(item)}/.metadata.json"))
-            return generate_html(os.path.join(folder, item), os.path.join(folder, item).removeprefix(_args.root_directory), _args, raw, version, logo)
+    if not excluded:
+        subfolders.append(SubfolderMetadata(url=subfolder_url, name=item, thumb=thumb, metadata=f"{_args.web_root_url}{baseurl}{urllib.parse.quote(item)}/.metadata.json"))
+        return generate_html(state, os.path.join(folder, item), os.path.join(folder, item).removeprefix(_args.root_directory), _args, raw, version, logo)
     subfolders.append(SubfolderMetadata(url=subfolder_url, name=item, thumb=thumb))
     return set()
 
 
-def process_license(folder: str, item: str) -> None:
+def process_license(state: BuildState, folder: str, item: str) -> None:
     """
     Processes a LICENSE file, preserving formatting in HTML.
 
     Args:
+        state (BuildState): The state of the build.
         folder (str): The folder containing the LICENSE file.
         item (str): The LICENSE file name.
     """
@@ -534,20 +1049,61 @@ def process_license(folder: str, item: str) -> None:
         logger.info("processing LICENSE", extra={"path": path})
         raw_text = f.read()
         escaped_text = html.escape(raw_text)
-        folder_licenses[urllib.parse.quote(folder)] = f"<pre>{escaped_text}</pre>"
+        state.folder_licenses[urllib.parse.quote(folder)] = f"<pre>{escaped_text}</pre>"
 
 
-def process_info_file(folder: str, item: str) -> None:
+def process_info_file(state: BuildState, folder: str, item: str) -> None:
     """
     Processes an info file.
 
     Args:
+        state (BuildState): The state of the build.
         folder (str): The folder containing the info file.
         item (str): The info file name.
     """
     with open(os.path.join(folder, item), encoding="utf-8") as f:
         logger.info("processing info file", extra={"path": os.path.join(folder, item)})
-        info[urllib.parse.quote(folder)] = f.read()
+        state.info[urllib.parse.quote(folder)] = f.read()
+
+
+def grid_item(img: ImageMetadata) -> dict[str, Any]:
+    """
+    Prepares an image for server-side rendering in the grid.
+
+    Args:
+        img (ImageMetadata): The image metadata.
+
+    Returns:
+        dict[str, Any]: The fields used by the grid markup.
+    """
+    item = img.to_dict(include_exif=False)
+    item["tagtitle"] = render_tag_tree(parse_hierarchical_tags(img.tags)) if img.tags else ""
+    return item
+
+
+def static_url(_args: Args, name: str) -> str:
+    """
+    Returns the URL of a static file, using its fingerprinted name if available.
+
+    Args:
+        _args (Args): Parsed command line arguments.
+        name (str): The file name relative to the .static folder.
+
+    Returns:
+        str: The URL of the file.
+    """
+    return f"{_args.web_root_url}.static/{_args.assets.get(name, name)}"
+
+
+def folder_tags(images: list[ImageMetadata], subfoldertags: set[str]) -> set[str]:
+    """
+    Collects the tags of a folder's images and subfolders.
+    """
+    alltags = set(subfoldertags)
+    for img in images:
+        if img.tags:
+            alltags.update(img.tags)
+    return alltags
 
 
 def should_generate_html(images: list[ImageMetadata], contains_files, _args: Args) -> bool:
@@ -573,21 +1129,31 @@ def format_html(html: str) -> str:
 
 
 def create_html_file(
-    folder: str, title: str, foldername: str, images: list[ImageMetadata], subfolders: list[SubfolderMetadata], _args: Args, version: str, logo: str, subfoldertags: set[str]
+    state: BuildState,
+    folder: str,
+    title: str,
+    foldername: str,
+    images: list[ImageMetadata],
+    subfolders: list[SubfolderMetadata],
+    _args: Args,
+    version: str,
+    logo: str,
+    subfoldertags: set[str],
+    pages: list[Page] | None = None,
 ) -> set[str]:
     """
     Creates the HTML file using the template.
 
     Args:
+        state (BuildState): The state of the build.
         folder (str): The folder to create the HTML file in.
         title (str): The title of the HTML page.
         foldername (str): The name of the folder.
-        images (list[dict[str, Any]]): A list of images to include in the HTML.
+        images (list[dict[str, Any]]): A list of images to include in the HTML, in display order.
         subfolders (list[dict[str, str]]): A list of subfolders to include in the HTML.
         _args (Args): Parsed command line arguments.
+        pages (list[Page] | None): Pages of a paginated folder, one HTML file is written per page.
     """
-    html_file = os.path.join(folder, "index.html")
-    logger.info("generating html file with jinja2", extra={"path": html_file})
     header = os.path.basename(folder) or title
     parent = None if not foldername else f"{_args.web_root_url}{urllib.parse.quote(foldername.removesuffix(folder.split('/')[-1] + '/'))}"
     if parent and _args.web_root_url.startswith("file://"):
@@ -605,75 +1171,85 @@ def create_html_file(
         else None
     )
 
-    alltags = set()
-    for img in images:
-        if img.tags:
-            alltags.update(img.tags)
-
-    alltags.update(subfoldertags)
+    alltags = folder_tags(images, subfoldertags)
 
-    folder_info = info.get(urllib.parse.quote(folder), "").split("\n")
+    folder_info = state.info.get(urllib.parse.quote(folder), "").split("\n")
     _info = [i for i in folder_info if len(i) > 1] if folder_info else None
 
-    folder_license = folder_licenses.get(urllib.parse.quote(folder), False)
+    folder_license = state.folder_licenses.get(urllib.parse.quote(folder), False)
 
     license_url = ""
 
     if folder_license:
         license_html = os.path.join(folder, "license.html")
         license_url = _args.web_root_url + urllib.parse.quote(foldername) + "license.html"
-        with open(license_html, "w+", encoding="utf-8") as f:
-            logger.info("writing license html file", extra={"path": license_html})
-            gtml = env.get_template("license.html.j2")
-            content = gtml.render(
-                title=f"{title} - LICENSE",
-                favicon=f"{_args.web_root_url}{FAVICON_PATH}",
-                stylesheet=f"{_args.web_root_url}{GLOBAL_CSS_PATH}",
-                theme=f"{_args.web_root_url}.static/theme.css",
-                darktheme=f"{_args.web_root_url}.static/theme-dark.css" if _args.darktheme else None,
-                root=_args.web_root_url,
-                parent=f"{_args.web_root_url}{urllib.parse.quote(foldername)}",
-                header=f"{header} - LICENSE",
-                license=license_info,
-                webmanifest=_args.generate_webmanifest,
-                version=version,
-                logo=logo,
-                licensefile=folder_license,
-            )
-            f.write(format_html(content))
-
+        gtml = env.get_template("license.html.j2")
+        content = gtml.render(
+            title=f"{title} - LICENSE",
+            favicon=f"{_args.web_root_url}{FAVICON_PATH}",
+            stylesheet=static_url(_args, "global.css"),
+            theme=static_url(_args, "theme.css"),
+            darktheme=static_url(_args, "theme-dark.css") if _args.darktheme else None,
+            root=_args.web_root_url,
+            parent=f"{_args.web_root_url}{urllib.parse.quote(foldername)}",
+            header=f"{header} - LICENSE",
+            license=license_info,
+            webmanifest=_args.generate_webmanifest,
+            version=version,
+            logo=logo,
+            licensefile=folder_license,
+        )
+        if state.write(license_html, format_html(content)):
+            logger.info("wrote license html file", extra={"path": license_html})
+        state.outputs.append(license_html)
+
+    tag_tree = parse_hierarchical_tags(alltags)
     html = env.get_template("index.html.j2")
-    content = html.render(
-        title=title,
-        favicon=f"{_args.web_root_url}{FAVICON_PATH}",
-        stylesheet=f"{_args.web_root_url}{GLOBAL_CSS_PATH}",
-        theme=f"{_args.web_root_url}.static/theme.css",
-        darktheme=f"{_args.web_root_url}.static/theme-dark.css" if _args.darktheme else None,
-        root=_args.web_root_url,
-        parent=parent,
-        header=header,
-        license=license_info,
-        subdirectories=subfolders,
-        info=_info,
-        webmanifest=_args.generate_webmanifest,
-        version=version,
-        logo=logo,
-        licensefile=license_url,
-        tags=parse_hierarchical_tags(alltags),
-    )
-
-    with open(html_file, "w", encoding="utf-8") as f:
-        logger.info("writing formatted html file", extra={"path": html_file})
-        f.write(format_html(content))
+    for page in pages or [None]:
+        html_file = os.path.join(folder, page_filename(page.number) if page else "index.html")
+        logger.info("generating html file with jinja2", extra={"path": html_file})
+        grid = None
+        if _args.prerender_grid:
+            chunk = images[(page.number - 1) * _args.page_size : page.number * _args.page_size] if page else images
+            grid = [grid_item(img) for img in chunk]
+        content = html.render(
+            title=title,
+            favicon=f"{_args.web_root_url}{FAVICON_PATH}",
+            stylesheet=static_url(_args, "global.css"),
+            theme=static_url(_args, "theme.css"),
+            darktheme=static_url(_args, "theme-dark.css") if _args.darktheme else None,
+            static={
+                name: static_url(_args, name)
+                for name in ("functionality.min.js", "pswp/photoswipe.css", "pswp/default-skin/default-skin.css", "pswp/photoswipe.min.js", "pswp/photoswipe-ui-default.min.js")
+            },
+            root=_args.web_root_url,
+            parent=parent,
+            header=header,
+            license=license_info,
+            subdirectories=subfolders,
+            info=_info,
+            webmanifest=_args.generate_webmanifest,
+            version=version,
+            logo=logo,
+            licensefile=license_url,
+            tags=tag_tree,
+            page=page,
+            grid=grid,
+            serviceworker=f"{_args.web_root_url}{SERVICE_WORKER_FILE}" if _args.generate_webmanifest else None,
+        )
+        if state.write(html_file, format_html(content)):
+            logger.info("wrote formatted html file", extra={"path": html_file})
+        state.outputs.append(html_file)
 
     return set(sorted(alltags))
 
 
-def list_folder(folder: str, title: str, _args: Args, raw: list[str], version: str, logo: str) -> list[tuple[str, str, str]]:
+def list_folder(state: BuildState, folder: str, title: str, _args: Args, raw: list[str], version: str, logo: str) -> list[tuple[str, str, str, int]]:
     """
     lists and processes a folder, generating HTML files.
 
     Args:
+        state (BuildState): The state of the build.
         total (int): Total number of folders to process.
         folder (str): The folder to process.
         title (str): The title of the HTML page.
@@ -683,5 +1259,9 @@ def list_folder(folder: str, title: str, _args: Args, raw: list[str], version: s
     Returns:
         list[tuple[str, str]]: list of thumbnails generated.
     """
-    generate_html(folder, title, _args, raw, version, logo)
-    return thumbnails
+    state.scanner.start_prefetch(_args.scan_threads)
+    try:
+        generate_html(state, folder, title, _args, raw, version, logo)
+    finally:
+        state.scanner.stop_prefetch()
+    return state.thumbnails
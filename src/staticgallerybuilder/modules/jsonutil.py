@@ -0,0 +1,54 @@
+"""
+jsonutil.py
+
+Thin wrapper around the JSON codec used for metadata files. If `orjson` is installed
+it is used for (de)serialisation, otherwise the standard library `json` module is used.
+Both write the same documents: two-space indentation or compact separators, non-ASCII
+characters unescaped and integer keys converted to strings.
+"""
+
+import json
+from typing import Any
+
+try:
+    import orjson
+
+    ORJSON = True
+except ImportError:
+    ORJSON = False
+
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(data: str | bytes) -> Any:
+    """
+    Deserialises a JSON document.
+
+    Args:
+        data (str | bytes): The JSON document.
+
+    Returns:
+        Any: The decoded object.
+    """
+    if ORJSON:
+        return orjson.loads(data)  # pyright: ignore[reportPossiblyUnboundVariable]
+    return json.loads(data)
+
+
+def dumps(obj: Any, indent: bool = True) -> str:
+    """
+    Serialises an object to a JSON string.
+
+    Args:
+        obj (Any): The object to serialise.
+        indent (bool): Whether to pretty-print the output.
+
+    Returns:
+        str: The JSON document.
+    """
+    if ORJSON:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)  # pyright: ignore[reportPossiblyUnboundVariable]
+        return orjson.dumps(obj, option=option).decode()  # pyright: ignore[reportPossiblyUnboundVariable]
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
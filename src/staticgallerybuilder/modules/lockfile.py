@@ -0,0 +1,221 @@
+"""
+lockfile.py
+
+Keeps a lock file in the root directory while a build runs. The file records the process
+ID, host and start time of the build plus a heartbeat that a background thread refreshes,
+so a lock left behind by a killed build can be told apart from one held by a running build,
+also when the root directory is shared between hosts. A process can hold the locks of
+several root directories at once.
+"""
+
+import json
+import logging
+import os
+import platform
+import socket
+import threading
+import time
+from dataclasses import dataclass
+
+try:
+    import fcntl
+
+    FCNTL = True
+except ImportError:
+    FCNTL = False
+
+HEARTBEAT_INTERVAL = 30
+# a lock whose heartbeat is older than this is considered abandoned
+STALE_AFTER = 300
+# attempts to take the lock while other processes replace an abandoned one
+ATTEMPTS = 5
+
+logger = logging.getLogger(name="defaultlogger")
+
+# locks held by this process, by absolute path
+held: dict[str, "HeldLock"] = {}
+held_lock = threading.Lock()
+
+
+@dataclass
+class LockInfo:
+    pid: int
+    host: str
+    started: float
+    heartbeat: float
+
+    @staticmethod
+    def current() -> "LockInfo":
+        now = time.time()
+        return LockInfo(pid=os.getpid(), host=socket.gethostname(), started=now, heartbeat=now)
+
+    @staticmethod
+    def from_dict(obj: dict) -> "LockInfo":
+        return LockInfo(pid=int(obj["pid"]), host=str(obj["host"]), started=float(obj["started"]), heartbeat=float(obj["heartbeat"]))
+
+    def to_dict(self) -> dict:
+        return {"pid": self.pid, "host": self.host, "started": self.started, "heartbeat": self.heartbeat}
+
+
+@dataclass
+class HeldLock:
+    path: str
+    stop: threading.Event
+    thread: threading.Thread
+
+
+def read_lock(path: str) -> LockInfo | None:
+    """
+    Reads a lock file. Returns None for locks without owner information, e.g. ones written
+    by older versions.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return LockInfo.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def process_running(pid: int) -> bool:
+    # signal 0 only checks for existence; on Windows os.kill would terminate the process
+    if platform.system() == "Windows":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def is_stale(mtime: float, info: LockInfo | None) -> bool:
+    """
+    Decides whether a lock was abandoned: its process is gone (same host only) or it has
+    not been refreshed for STALE_AFTER seconds.
+    """
+    if info is None:
+        return time.time() - mtime > STALE_AFTER
+    if info.host == socket.gethostname() and info.pid != os.getpid() and not process_running(info.pid):
+        return True
+    return time.time() - info.heartbeat > STALE_AFTER
+
+
+def write_lock(path: str, info: LockInfo) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(info.to_dict(), f)
+    os.replace(tmp, path)
+
+
+def heartbeat(path: str, info: LockInfo, stop: threading.Event) -> None:
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        info.heartbeat = time.time()
+        try:
+            write_lock(path, info)
+        except OSError as e:
+            logger.warning("failed to refresh lock file", extra={"path": path, "error": str(e)})
+
+
+def remove_if_stale(path: str) -> tuple[bool | None, LockInfo | None]:
+    """
+    Removes the lock at path if it was abandoned. Checking and removing is not atomic, so
+    two processes could both find a lock abandoned and the second remove the lock the
+    first just created. Processes replacing a lock therefore hold an flock on it and make
+    sure it is still the file at path, which a new lock or a heartbeat replaces.
+
+    Returns:
+        tuple[bool | None, LockInfo | None]: True if the lock was removed, False if it is
+        held, None if it changed meanwhile; and the owner of the lock.
+    """
+    try:
+        f = open(path, encoding="utf-8")
+    except FileNotFoundError:
+        return None, None
+    with f:
+        if FCNTL:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)  # pyright: ignore[reportPossiblyUnboundVariable]
+            except OSError:
+                # another process is replacing it
+                return None, None
+        stat = os.fstat(f.fileno())
+        try:
+            if os.stat(path).st_ino != stat.st_ino:
+                return None, None
+        except FileNotFoundError:
+            return None, None
+        try:
+            info = LockInfo.from_dict(json.load(f))
+        except (ValueError, KeyError, TypeError):
+            info = None
+        if not is_stale(stat.st_mtime, info):
+            return False, info
+        os.remove(path)
+        # the flock is released when the file is closed
+        return True, info
+
+
+def acquire_lock(path: str) -> tuple[bool, LockInfo | None, bool]:
+    """
+    Takes the lock, replacing an abandoned one, and starts refreshing its heartbeat.
+
+    Args:
+        path (str): The lock file.
+
+    Returns:
+        tuple[bool, LockInfo | None, bool]: Whether the lock was taken, the owner of the lock
+        that blocked or was replaced (None if unknown), and whether an abandoned lock was replaced.
+    """
+    previous = None
+    replaced = False
+    for _ in range(ATTEMPTS):
+        info = LockInfo.current()
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            removed, owner = remove_if_stale(path)
+            if removed is None:
+                time.sleep(0.1)
+                continue
+            previous = owner
+            if not removed:
+                return False, previous, False
+            replaced = True
+            continue
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(info.to_dict(), f)
+        stop = threading.Event()
+        thread = threading.Thread(target=heartbeat, args=(path, info, stop), name="heartbeat", daemon=True)
+        with held_lock:
+            held[os.path.abspath(path)] = HeldLock(path, stop, thread)
+        thread.start()
+        return True, previous, replaced
+    return False, previous, False
+
+
+def holds_lock(path: str) -> bool:
+    """
+    Returns whether this process holds the lock at path.
+    """
+    with held_lock:
+        return os.path.abspath(path) in held
+
+
+def release_lock(path: str) -> None:
+    """
+    Stops the heartbeat and removes the lock at path if this process still holds it.
+    """
+    with held_lock:
+        lock = held.pop(os.path.abspath(path), None)
+    if lock is None:
+        return
+    lock.stop.set()
+    # a refresh in progress would otherwise recreate the file after it was removed
+    lock.thread.join()
+    info = read_lock(lock.path)
+    if info is None or (info.pid == os.getpid() and info.host == socket.gethostname()):
+        try:
+            os.remove(lock.path)
+        except FileNotFoundError:
+            pass
@@ -3,22 +3,36 @@ logger.py
 
 This module provides functionality for setting up a centralized logging system using the
 `logging` library and the `python-json-logger` to output logs in JSON format. It handles
-log rotation by renaming old log files and saving them based on the first timestamp entry.
+log rotation by renaming old log files based on their first timestamp entry and compressing
+them in the background.
+
+Records are not written by the process that creates them. Every process puts them on a
+shared queue and a single listener thread in the main process formats and writes them in
+batches, so image workers neither block on the log file nor interleave partial lines.
 
 Functions:
 - log_format(keys): Generates the logging format string based on the list of keys.
 - rotate_log_file(): Handles renaming the existing log file to a timestamp-based name.
+- compress_log_files(): Gzips rotated log files.
 - setup_logger(): Configures the logging system, applies a JSON format, and returns a logger instance.
+- init_worker_logger(): Sends the records of a worker process to the main process.
+- stop_logger(): Writes out queued records and stops the listener.
 - setup_consolelogger(): Configures the logging system to output logs in console format.
 """
 
+import atexit
 import gzip
 import json
 import logging
+import multiprocessing
+import multiprocessing.util
 import os
 import platform
 import shutil
+import threading
+import time
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 
 from pythonjsonlogger import jsonlogger
@@ -32,6 +46,102 @@ else:
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 LATEST_LOG_FILE = LOG_DIR / "latest.jsonl"
 
+# child loggers of defaultlogger whose level can be set separately (defaultlogger.<stage>)
+STAGES = ("metadata", "thumbnails", "compression", "scan")
+BATCH_SIZE = 512
+BATCH_INTERVAL = 1.0
+
+queue = None
+listener: "BatchListener | None" = None
+file_handler: logging.Handler | None = None
+
+
+class BatchingFileHandler(logging.FileHandler):
+    """
+    File handler that leaves records in the file buffer and flushes every `capacity`
+    records, every `interval` seconds and for every error, instead of after each record.
+    """
+
+    def __init__(self, filename, capacity: int = BATCH_SIZE, interval: float = BATCH_INTERVAL):
+        super().__init__(filename, encoding="utf-8")
+        self.capacity = capacity
+        self.interval = interval
+        self.pending = 0
+        self.flushed = time.monotonic()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            msg = self.format(record)
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(msg + self.terminator)
+            self.pending += 1
+            if self.pending >= self.capacity or record.levelno >= logging.ERROR or time.monotonic() - self.flushed >= self.interval:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        super().flush()
+        self.pending = 0
+        self.flushed = time.monotonic()
+
+
+class BatchingQueueHandler(QueueHandler):
+    """
+    Queue handler that puts records on the queue in lists of up to `capacity`, so a batch
+    costs a single pickle and pipe write. Pending records are sent every `interval`
+    seconds, for every error and when the process exits.
+    """
+
+    def __init__(self, log_queue, capacity: int = BATCH_SIZE, interval: float = BATCH_INTERVAL):
+        super().__init__(log_queue)
+        self.capacity = capacity
+        self.interval = interval
+        self.buffer: list[logging.LogRecord] = []
+        self.sent = time.monotonic()
+        # pool workers leave through os._exit, which skips atexit but runs these finalizers;
+        # the priority is above that of the queue, which stops accepting items at exit
+        multiprocessing.util.Finalize(None, self.flush, exitpriority=100)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.buffer.append(self.prepare(record))
+            if len(self.buffer) >= self.capacity or record.levelno >= logging.ERROR or time.monotonic() - self.sent >= self.interval:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        with self.lock:  # type: ignore
+            if self.buffer:
+                self.enqueue(self.buffer)  # type: ignore
+                self.buffer = []
+            self.sent = time.monotonic()
+
+
+class StageFormatter(jsonlogger.JsonFormatter):
+    """
+    JSON formatter that adds the stage of records logged by a stage logger
+    (defaultlogger.<stage>) as the "stage" field, keeping "logger" constant.
+    """
+
+    def add_fields(self, log_record, record, message_dict) -> None:
+        super().add_fields(log_record, record, message_dict)
+        prefix, _, stage = record.name.partition(".")
+        if prefix == "defaultlogger" and stage:
+            log_record["stage"] = stage
+
+
+class BatchListener(QueueListener):
+    """
+    Queue listener that accepts both single records and the batches of BatchingQueueHandler.
+    """
+
+    def handle(self, record) -> None:
+        for item in record if isinstance(record, list) else [record]:
+            super().handle(item)
+
 
 def log_format(keys):
     """
@@ -46,53 +156,88 @@ def log_format(keys):
     return [f"%({i})s" for i in keys]
 
 
-def rotate_log_file(compress=False):
+def compress_log_files(paths: list[Path]) -> None:
     """
-    Truncates the 'latest.jsonl' file after optionally compressing its contents to a timestamped file.
-    The 'latest.jsonl' file is not deleted or moved, just emptied.
+    Gzips rotated log files and removes the originals. Each archive is written under a
+    temporary name first, so an interrupted run leaves the original to be retried.
 
     Args:
-        compress (bool): If True, compress the old log file using gzip.
+        paths (list[Path]): The rotated log files.
     """
-    if os.path.exists(LATEST_LOG_FILE):
-        with open(LATEST_LOG_FILE, "r+", encoding="utf-8") as f:
-            first_line = f.readline()
-            try:
-                first_log = json.loads(first_line)
-                first_timestamp = first_log.get("asctime")
-                first_timestamp = first_timestamp.split(",")[0]
-            except (json.JSONDecodeError, KeyError):
-                first_timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    for path in paths:
+        tmp = f"{path}.gz.tmp"
+        with open(path, "rb") as f_in, gzip.open(tmp, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        os.replace(tmp, f"{path}.gz")
+        os.remove(path)
 
-            safe_timestamp = first_timestamp.replace(":", "-").replace(" ", "_")
-            old_log_filename = os.path.join(LOG_DIR, f"{safe_timestamp}.jsonl")
 
-            # Write contents to the new file
-            with open(old_log_filename, "w", encoding="utf-8") as old_log_file:
-                f.seek(0)  # Go back to the beginning of the file
-                shutil.copyfileobj(f, old_log_file)
+def rotate_log_file(compress=False) -> threading.Thread | None:
+    """
+    Renames the 'latest.jsonl' file to a file named after its first timestamp, so the new
+    run starts with an empty log. Renaming does not touch the contents, however large the
+    log grew.
 
-            if compress:
-                with open(old_log_filename, "rb") as f_in:
-                    with gzip.open(f"{old_log_filename}.gz", "wb") as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-                os.remove(old_log_filename)
+    Args:
+        compress (bool): If True, gzip the old log file (and any left uncompressed by an
+            earlier run) in a background thread.
 
-            # Truncate the original file
-            f.seek(0)
-            f.truncate()
+    Returns:
+        threading.Thread | None: The compression thread. It is not a daemon thread, so the
+        interpreter waits for it before exiting.
+    """
+    if os.path.exists(LATEST_LOG_FILE) and os.path.getsize(LATEST_LOG_FILE):
+        with open(LATEST_LOG_FILE, encoding="utf-8") as f:
+            first_line = f.readline()
+        try:
+            first_log = json.loads(first_line)
+            first_timestamp = first_log.get("asctime")
+            first_timestamp = first_timestamp.split(",")[0]
+        except (json.JSONDecodeError, AttributeError):
+            first_timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+
+        safe_timestamp = first_timestamp.replace(":", "-").replace(" ", "_")
+        old_log_filename = LOG_DIR / f"{safe_timestamp}.jsonl"
+        number = 1
+        while old_log_filename.exists() or Path(f"{old_log_filename}.gz").exists():
+            old_log_filename = LOG_DIR / f"{safe_timestamp}-{number}.jsonl"
+            number += 1
+        os.replace(LATEST_LOG_FILE, old_log_filename)
+
+    if not compress:
+        return None
+    pending = sorted(path for path in LOG_DIR.glob("*.jsonl") if path != LATEST_LOG_FILE)
+    if not pending:
+        return None
+    thread = threading.Thread(target=compress_log_files, args=(pending,), name="logcompress")
+    thread.start()
+    return thread
+
+
+def set_levels(levels: dict[str, str]) -> None:
+    """
+    Applies log levels to defaultlogger ("" key) and its stage loggers.
+    """
+    for stage, level in levels.items():
+        logging.getLogger(name=f"defaultlogger.{stage}" if stage else "defaultlogger").setLevel(level)
 
 
-def setup_logger(level=logging.INFO):
+def setup_logger(level=logging.INFO, levels: dict[str, str] | None = None):
     """
     Configures the logging system with a custom format and outputs logs in JSON format.
 
     The logger will write to the 'logs/latest.jsonl' file, and it will include
     multiple attributes such as the time of logging, the filename, function name, log level, etc.
+    Records are handed to a listener thread through a queue that worker processes share.
+
+    Args:
+        level: The level of defaultlogger.
+        levels (dict[str, str] | None): Levels of defaultlogger ("") and its stage loggers.
 
     Returns:
         logging.Logger: A configured logger instance that can be used to log messages.
     """
+    global queue, listener, file_handler
     _logger = logging.getLogger(name="defaultlogger")
 
     supported_keys = [
@@ -114,17 +259,72 @@ def setup_logger(level=logging.INFO):
     ]
 
     custom_format = " ".join(log_format(supported_keys))
-    formatter = jsonlogger.JsonFormatter(custom_format, timestamp=True, rename_fields={"levelname": "level"}, static_fields={"logger": "defaultlogger"})
+    formatter = StageFormatter(custom_format, timestamp=True, rename_fields={"levelname": "level"}, static_fields={"logger": "defaultlogger"})
 
-    log_handler = logging.FileHandler(LATEST_LOG_FILE)
-    log_handler.setFormatter(formatter)
+    file_handler = BatchingFileHandler(LATEST_LOG_FILE)
+    file_handler.setFormatter(formatter)
 
-    _logger.addHandler(log_handler)
+    queue = multiprocessing.Queue()
+    listener = BatchListener(queue, file_handler)
+    listener.start()
+    atexit.register(stop_logger)
+
+    _logger.addHandler(BatchingQueueHandler(queue))
     _logger.setLevel(level=level)
+    set_levels(levels or {})
 
     return _logger
 
 
+def worker_logger_args() -> tuple:
+    """
+    Returns the initargs for init_worker_logger, to be passed to a multiprocessing Pool.
+    """
+    levels = {"": logging.getLevelName(logging.getLogger(name="defaultlogger").level)}
+    for stage in STAGES:
+        level = logging.getLogger(name=f"defaultlogger.{stage}").level
+        if level != logging.NOTSET:
+            levels[stage] = logging.getLevelName(level)
+    return queue, levels
+
+
+def init_worker_logger(log_queue, levels: dict[str, str]) -> None:
+    """
+    Pool initializer that replaces the handlers a worker inherited with one putting its
+    records on the queue of the main process.
+
+    Args:
+        log_queue: The queue returned by worker_logger_args, None if logging is not set up.
+        levels (dict[str, str]): Levels of defaultlogger ("") and its stage loggers.
+    """
+    _logger = logging.getLogger(name="defaultlogger")
+    for handler in list(_logger.handlers):
+        _logger.removeHandler(handler)
+    if log_queue is not None:
+        _logger.addHandler(BatchingQueueHandler(log_queue))
+    set_levels(levels)
+
+
+def stop_logger() -> None:
+    """
+    Writes out the records still queued and stops the listener. Records logged afterwards
+    are written directly.
+    """
+    global listener
+    if listener is None:
+        return
+    _logger = logging.getLogger(name="defaultlogger")
+    for handler in list(_logger.handlers):
+        if isinstance(handler, QueueHandler):
+            handler.flush()
+            _logger.removeHandler(handler)
+    listener.stop()
+    listener = None
+    if file_handler is not None:
+        file_handler.flush()
+        _logger.addHandler(file_handler)
+
+
 def setup_consolelogger(level=logging.INFO):
     """
     Configures the logging system to output logs in console and JSON format.
@@ -0,0 +1,153 @@
+"""
+metrics.py
+
+Collects counts and durations of a build and writes them in the Prometheus text
+exposition format, to be picked up by the node-exporter textfile collector. All values
+describe the last run, so they are exported as gauges. Every build collects into its own
+Metrics, so builds of several roots in one process do not mix their values.
+"""
+
+import os
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+try:
+    import resource
+
+    RESOURCE = True
+except ImportError:
+    RESOURCE = False
+
+PREFIX = "staticgallerybuilder"
+
+COUNTERS = {
+    "folders": "Folders processed.",
+    "images": "Images processed.",
+    "metadata_cache_hits": "Images whose metadata was taken from .metadata.json.",
+    "metadata_cache_misses": "Images whose metadata was read from the image file.",
+    "images_quarantined": "Images skipped because they failed in an earlier run and have not changed since.",
+    "thumbnails_generated": "Thumbnails generated.",
+    "thumbnails_skipped": "Thumbnails that already existed.",
+    "thumbnails_failed": "Thumbnails that could not be generated.",
+    "display_images_generated": "Images whose downscaled display copies were generated.",
+    "display_images_failed": "Images whose downscaled display copies could not be generated.",
+    "bytes_written": "Bytes written for pages, metadata, thumbnails, display copies and precompressed files.",
+}
+
+
+@dataclass
+class Metrics:
+    """
+    The values collected during one build.
+    """
+
+    # counts keyed by the names in COUNTERS
+    counters: Counter[str] = field(default_factory=Counter)
+    # wall time per build stage in seconds; stages may overlap with work running on the pool
+    durations: dict[str, float] = field(default_factory=dict)
+    # directory listings, entries read and in-memory lookups, see dirindex
+    operations: Counter[str] = field(default_factory=Counter)
+    # largest peak resident set size reported by a worker job in bytes, 0 if none ran
+    worker_rss: int = 0
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Adds the wall time of the enclosed block to the duration of a stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + time.perf_counter() - start
+
+
+def own_peak_rss() -> int:
+    """
+    Returns the peak resident set size of this process in bytes, 0 where the resource
+    module is unavailable.
+    """
+    if not RESOURCE:
+        return 0
+    # ru_maxrss is in kilobytes, except on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale  # pyright: ignore[reportPossiblyUnboundVariable]
+
+
+def measured(func, job) -> tuple[Any, int]:
+    """
+    Runs a job on a pool worker and returns its result together with the peak resident set
+    size of the worker. RUSAGE_CHILDREN only covers workers that have exited, which the
+    workers of a persistent pool have not.
+    """
+    return func(job), own_peak_rss()
+
+
+def peak_rss(collected: Metrics) -> dict[str, int]:
+    """
+    Returns the peak resident set size in bytes of this process and of the largest worker
+    that ran a job of the build, or an empty dict where the resource module is unavailable.
+    Both are peaks over the lifetime of the process, which for a kept pool spans builds.
+    """
+    if not RESOURCE:
+        return {}
+    rss = {"main": own_peak_rss()}
+    if collected.worker_rss:
+        rss["workers"] = collected.worker_rss
+    return rss
+
+
+def render(collected: Metrics, success: bool) -> str:
+    """
+    Renders the metrics of a build.
+
+    Args:
+        collected (Metrics): The values collected during the build.
+        success (bool): Whether the build finished without an unhandled exception.
+
+    Returns:
+        str: The metrics in the Prometheus text format.
+    """
+    lines: list[str] = []
+
+    def gauge(name: str, text: str, samples: list[tuple[str, float]]) -> None:
+        lines.append(f"# HELP {PREFIX}_{name} {text}")
+        lines.append(f"# TYPE {PREFIX}_{name} gauge")
+        for labels, value in samples:
+            lines.append(f"{PREFIX}_{name}{labels} {value}")
+
+    gauge("last_run_timestamp_seconds", "Time the last build finished.", [("", round(time.time(), 3))])
+    gauge("last_run_success", "Whether the last build finished without an unhandled exception.", [("", int(success))])
+    for name, text in COUNTERS.items():
+        gauge(name, text, [("", collected.counters[name])])
+    gauge("stage_duration_seconds", "Wall time of each build stage.", [(f'{{stage="{name}"}}', round(value, 3)) for name, value in collected.durations.items()])
+    if collected.operations:
+        gauge(
+            "directory_operations",
+            "Directory listings, entries read and in-memory lookups.",
+            [(f'{{operation="{name}"}}', value) for name, value in sorted(collected.operations.items())],
+        )
+    rss = peak_rss(collected)
+    if rss:
+        gauge("peak_rss_bytes", "Peak resident set size of the main process and of the largest worker.", [(f'{{process="{name}"}}', value) for name, value in rss.items()])
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path: str, collected: Metrics, success: bool) -> None:
+    """
+    Writes the metrics file atomically, so the collector never reads a partial file.
+
+    Args:
+        path (str): The metrics file, usually ending in .prom.
+        collected (Metrics): The values collected during the build.
+        success (bool): Whether the build finished without an unhandled exception.
+    """
+    # the collector only reads files ending in .prom, so the temporary file is ignored
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render(collected, success))
+    os.replace(tmp, path)
@@ -0,0 +1,52 @@
+"""
+placeholder.py
+
+Computes low-quality image placeholders: a tiny, heavily compressed copy of an image
+inlined as a data URI plus its average colour, shown in the grid while the real
+thumbnail is loading.
+"""
+
+import base64
+from io import BytesIO
+
+from PIL import Image, features
+
+PLACEHOLDER_SIZE = 32
+PLACEHOLDER_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+
+
+def make_placeholder(img: Image.Image) -> tuple[str, str]:
+    """
+    Builds the placeholder for an already decoded image, typically the downscaled thumbnail.
+
+    Args:
+        img (Image.Image): The image.
+
+    Returns:
+        tuple[str, str]: The placeholder data URI and the average colour as #rrggbb.
+    """
+    small = img.convert("RGB")
+    small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    red, green, blue = small.resize((1, 1), Image.Resampling.BOX).getpixel((0, 0))  # type: ignore
+    buffer = BytesIO()
+    small.save(buffer, PLACEHOLDER_FORMAT, quality=30)
+    data = base64.b64encode(buffer.getvalue()).decode("ascii")
+    return f"data:image/{PLACEHOLDER_FORMAT.lower()};base64,{data}", f"#{red:02x}{green:02x}{blue:02x}"
+
+
+def thumbnail_placeholder(path: str) -> tuple[str, str]:
+    """
+    Builds the placeholder from an existing thumbnail, decoded at a reduced scale.
+
+    Args:
+        path (str): The thumbnail file.
+
+    Returns:
+        tuple[str, str]: The placeholder data URI and the average colour as #rrggbb.
+
+    Raises:
+        OSError: If the thumbnail cannot be read.
+    """
+    with Image.open(path) as thumbfile:
+        thumbfile.draft("RGB", (PLACEHOLDER_SIZE * 2, PLACEHOLDER_SIZE * 2))
+        return make_placeholder(thumbfile)
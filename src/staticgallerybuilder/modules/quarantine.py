@@ -0,0 +1,159 @@
+"""
+quarantine.py
+
+Remembers images that could not be read or thumbnailed, keyed by their path,
+modification time and size, in a .quarantine.json file in the root directory. Later
+runs skip these images without opening them until the file changes, instead of
+failing on the same corrupt or unsupported files in every run.
+"""
+
+import logging
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from ..modules import jsonutil
+from ..modules.util import write_if_changed
+
+QUARANTINE_FILE = ".quarantine.json"
+
+logger = logging.getLogger(name="defaultlogger")
+
+
+@dataclass
+class Failure:
+    """
+    Returned by a worker job instead of its result when the image could not be processed.
+    """
+
+    path: str
+    error: str
+
+
+@dataclass
+class Entry:
+    mtime: int
+    size: int
+    stage: str
+    error: str
+    since: float
+
+    @staticmethod
+    def from_dict(obj: dict) -> "Entry":
+        return Entry(mtime=int(obj["mtime"]), size=int(obj["size"]), stage=str(obj["stage"]), error=str(obj["error"]), since=float(obj["since"]))
+
+    def to_dict(self) -> dict:
+        return {"mtime": self.mtime, "size": self.size, "stage": self.stage, "error": self.error, "since": self.since}
+
+
+class Quarantine:
+    """
+    The quarantined images of a root directory during one build.
+    """
+
+    def __init__(self, root_directory: str, retry: bool = False, counters: Counter[str] | None = None):
+        """
+        Reads the quarantine of a root directory.
+
+        Args:
+            root_directory (str): The root directory, ending in "/".
+            retry (bool): Forget all entries, so every image is tried again.
+            counters (Counter[str] | None): The build counters, receiving images_quarantined.
+        """
+        self.root = root_directory
+        self.counters: Counter[str] = Counter() if counters is None else counters
+        # quarantined images keyed by their path relative to the root directory
+        self.entries: dict[str, Entry] = {}
+        # images that were skipped or newly quarantined during this run
+        self.seen: set[str] = set()
+        # images that failed for the first time during this run
+        self.added: set[str] = set()
+        if retry:
+            logger.info("retrying quarantined images")
+            return
+        try:
+            with open(os.path.join(self.root, QUARANTINE_FILE), encoding="utf-8") as f:
+                content = jsonutil.loads(f.read())
+            for path, entry in content["files"].items():
+                self.entries[path] = Entry.from_dict(entry)
+        except FileNotFoundError:
+            pass
+        except (OSError, jsonutil.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError) as e:
+            logger.warning("ignoring unreadable quarantine file", extra={"error": str(e)})
+            self.entries.clear()
+
+    def key(self, path: str) -> str:
+        return path.removeprefix(self.root)
+
+    def lookup(self, path: str) -> Entry | None:
+        """
+        Returns the quarantine entry of an image that has not changed since it failed. The
+        file is only stat'ed if it has an entry; a changed file loses its entry.
+        """
+        name = self.key(path)
+        entry = self.entries.get(name)
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            del self.entries[name]
+            return None
+        if stat.st_mtime_ns != entry.mtime or stat.st_size != entry.size:
+            logger.info("quarantined image changed, trying again", extra={"file": path})
+            del self.entries[name]
+            return None
+        if name not in self.seen:
+            self.seen.add(name)
+            self.counters["images_quarantined"] += 1
+        return entry
+
+    def add(self, path: str, stage: str, error: str) -> None:
+        """
+        Quarantines an image that failed in a stage (metadata, thumbnails).
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        name = self.key(path)
+        logger.warning("quarantining image", extra={"file": path, "stage": stage, "error": error})
+        self.entries[name] = Entry(mtime=stat.st_mtime_ns, size=stat.st_size, stage=stage, error=error, since=time.time())
+        self.seen.add(name)
+        self.added.add(name)
+
+    def save(self, complete: bool) -> None:
+        """
+        Writes the quarantine file, or removes it if nothing is quarantined.
+
+        Args:
+            complete (bool): Whether every folder was processed. Only then entries of images
+                that were not seen during this run (deleted or excluded since) are dropped.
+        """
+        if complete:
+            for name in [name for name in self.entries if name not in self.seen]:
+                del self.entries[name]
+        path = os.path.join(self.root, QUARANTINE_FILE)
+        if not self.entries:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        content = {"files": {name: entry.to_dict() for name, entry in sorted(self.entries.items())}}
+        write_if_changed(path, jsonutil.dumps(content, indent=True))
+
+    def quarantined(self) -> dict[str, dict]:
+        """
+        Returns the entries of the images that were skipped or quarantined during this run.
+        """
+        return {name: self.entries[name].to_dict() for name in sorted(self.seen) if name in self.entries}
+
+    def report(self) -> None:
+        """
+        Lists the quarantined images in the log and prints a one-line summary.
+        """
+        if not self.seen:
+            return
+        files = self.quarantined()
+        logger.warning("quarantined images", extra={"count": len(files), "new": len(self.added), "files": files})
+        print(f"{len(files)} images ({len(self.added)} new) could not be processed and are skipped until they change, see {os.path.join(self.root, QUARANTINE_FILE)}")
@@ -0,0 +1,265 @@
+"""
+rawpreview.py
+
+Opens RAW and TIFF files without decoding their full-resolution image. Most RAW
+containers are TIFF structured and carry embedded JPEG previews, and multi-page or
+pyramidal TIFFs carry reduced copies of the main page. Only the image file directories
+(IFDs) and the chosen preview are read from disk.
+"""
+
+import logging
+import os
+import struct
+from dataclasses import dataclass
+from io import BytesIO
+
+from PIL import Image, UnidentifiedImageError
+
+# Formats browsers display natively; everything else is shown through a converted copy
+WEB_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif")
+TIFF_EXTENSIONS = (".tif", ".tiff")
+# TIFF, Olympus ORF and Panasonic RW2 headers with their byte order
+TIFF_HEADERS = {b"II*\x00": "<", b"MM\x00*": ">", b"IIRO": "<", b"IIU\x00": "<"}
+RAF_HEADER = b"FUJIFILMCCD-RAW"
+MAX_IFDS = 64
+
+# TIFF tags
+NEW_SUBFILE_TYPE = 0xFE
+COMPRESSION = 0x103
+STRIP_OFFSETS = 0x111
+ORIENTATION = 0x112
+STRIP_BYTE_COUNTS = 0x117
+SUB_IFDS = 0x14A
+JPEG_OFFSET = 0x201
+JPEG_LENGTH = 0x202
+TAGS = (NEW_SUBFILE_TYPE, COMPRESSION, STRIP_OFFSETS, ORIENTATION, STRIP_BYTE_COUNTS, SUB_IFDS, JPEG_OFFSET, JPEG_LENGTH)
+TYPE_FORMATS = {1: "B", 3: "H", 4: "I", 7: "B", 13: "I"}
+JPEG_COMPRESSION = (6, 7)
+# baseline, extended and progressive JPEG; lossless JPEG raw data is not decodable by Pillow
+SOF_MARKERS = (0xC0, 0xC1, 0xC2)
+
+logger = logging.getLogger(name="defaultlogger")
+
+
+@dataclass
+class Preview:
+    offset: int
+    length: int
+    width: int
+    height: int
+
+
+def read_ifd(f, offset: int, order: str) -> tuple[dict[int, list[int]], int]:
+    """
+    Reads the tags this module needs from a single IFD.
+
+    Args:
+        f: The open file.
+        offset (int): File offset of the IFD.
+        order (str): struct byte order of the file.
+
+    Returns:
+        tuple[dict[int, list[int]], int]: The tag values and the offset of the next IFD.
+    """
+    f.seek(offset)
+    (count,) = struct.unpack(order + "H", f.read(2))
+    data = f.read(count * 12)
+    (following,) = struct.unpack(order + "I", f.read(4))
+    tags: dict[int, list[int]] = {}
+    for i in range(count):
+        tag, kind, number, value = struct.unpack_from(order + "HHI4s", data, i * 12)
+        fmt = TYPE_FORMATS.get(kind)
+        if tag not in TAGS or fmt is None or number > 1024:
+            continue
+        size = struct.calcsize(fmt) * number
+        if size > 4:
+            f.seek(struct.unpack(order + "I", value)[0])
+            value = f.read(size)
+        tags[tag] = list(struct.unpack(order + fmt * number, value[:size]))
+    return tags, following
+
+
+def jpeg_size(f, offset: int, length: int) -> tuple[int, int] | None:
+    """
+    Reads the dimensions of an embedded JPEG from its frame header without decoding it.
+
+    Returns:
+        tuple[int, int] | None: Width and height, or None if this is not a decodable JPEG.
+    """
+    end = offset + length
+    f.seek(offset)
+    if f.read(2) != b"\xff\xd8":
+        return None
+    while f.tell() + 4 <= end:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        if marker[1] in (0xD9, 0xDA):
+            return None
+        (size,) = struct.unpack(">H", f.read(2))
+        if marker[1] in SOF_MARKERS:
+            _, height, width = struct.unpack(">BHH", f.read(5))
+            return width, height
+        f.seek(size - 2, os.SEEK_CUR)
+    return None
+
+
+def find_previews(path: str) -> tuple[list[Preview], int | None]:
+    """
+    Walks the IFD chain and SubIFDs of a TIFF-structured file (or the header of a Fujifilm
+    RAF) and collects its embedded JPEG previews.
+
+    Args:
+        path (str): The file path.
+
+    Returns:
+        tuple[list[Preview], int | None]: The previews and the orientation of the main image.
+    """
+    previews: list[Preview] = []
+    orientation = None
+    with open(path, "rb") as f:
+        header = f.read(16)
+        if header.startswith(RAF_HEADER):
+            f.seek(84)
+            offset, length = struct.unpack(">II", f.read(8))
+            size = jpeg_size(f, offset, length)
+            return ([Preview(offset, length, *size)] if size else []), None
+        order = TIFF_HEADERS.get(header[:4])
+        if not order or len(header) < 8:
+            return [], None
+        queue = [struct.unpack(order + "I", header[4:8])[0]]
+        seen: set[int] = set()
+        while queue and len(seen) < MAX_IFDS:
+            offset = queue.pop(0)
+            if offset < 8 or offset in seen:
+                continue
+            seen.add(offset)
+            try:
+                tags, following = read_ifd(f, offset, order)
+            except struct.error:
+                continue
+            if len(seen) == 1:
+                orientation = tags.get(ORIENTATION, [None])[0]
+            queue.extend(tags.get(SUB_IFDS, []))
+            queue.append(following)
+
+            if JPEG_OFFSET in tags and JPEG_LENGTH in tags:
+                candidate = (tags[JPEG_OFFSET][0], tags[JPEG_LENGTH][0])
+            elif tags.get(COMPRESSION, [1])[0] in JPEG_COMPRESSION and len(tags.get(STRIP_OFFSETS, [])) == 1 and STRIP_BYTE_COUNTS in tags:
+                candidate = (tags[STRIP_OFFSETS][0], tags[STRIP_BYTE_COUNTS][0])
+            else:
+                continue
+            try:
+                size = jpeg_size(f, *candidate)
+            except struct.error:
+                size = None
+            if size:
+                previews.append(Preview(*candidate, *size))
+    return previews, orientation
+
+
+def select_preview(previews: list[Preview], min_size: int | None) -> Preview:
+    """
+    Picks the smallest preview whose long edge is at least min_size, or the largest one.
+    """
+    adequate = [p for p in previews if min_size is not None and max(p.width, p.height) >= min_size]
+    if adequate:
+        return min(adequate, key=lambda p: p.width * p.height)
+    return max(previews, key=lambda p: p.width * p.height)
+
+
+def select_tiff_page(img: Image.Image, min_size: int) -> None:
+    """
+    Seeks a multi-page TIFF to the smallest page with the aspect ratio of the first page
+    whose long edge is at least min_size. Seeking only reads the page's IFD.
+    """
+    width, height = img.size
+    best = (0, width * height)
+    for frame in range(1, getattr(img, "n_frames", 1)):
+        img.seek(frame)
+        w, h = img.size
+        if max(w, h) >= min_size and abs(w * height - h * width) <= max(width, height) and w * h < best[1]:
+            best = (frame, w * h)
+    img.seek(best[0])
+
+
+def open_image(path: str, min_size: int | None = None) -> Image.Image:
+    """
+    Opens an image for thumbnailing or metadata extraction. RAW files are opened through
+    their embedded JPEG preview, TIFFs through an adequate reduced page or preview, and
+    everything else through Pillow directly.
+
+    Args:
+        path (str): The image path.
+        min_size (int | None): The long edge the caller needs, None for full size.
+
+    Returns:
+        Image.Image: The opened, not yet decoded image.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in WEB_EXTENSIONS:
+        return Image.open(path)
+    try:
+        previews, orientation = find_previews(path)
+    except (OSError, struct.error):
+        previews, orientation = [], None
+    if ext in TIFF_EXTENSIONS:
+        img = Image.open(path)
+        if min_size is None:
+            return img
+        select_tiff_page(img, min_size)
+        adequate = [p for p in previews if max(p.width, p.height) >= min_size and p.width * p.height < img.size[0] * img.size[1]]
+        if not adequate:
+            return img
+        img.close()
+    elif not previews:
+        return Image.open(path)
+
+    preview = select_preview(previews, min_size)
+    logger.debug("using embedded preview", extra={"path": path, "width": preview.width, "height": preview.height})
+    with open(path, "rb") as f:
+        f.seek(preview.offset)
+        data = f.read(preview.length)
+    img = Image.open(BytesIO(data))
+    if orientation:
+        # previews are stored unrotated; the orientation of the RAW applies to them. It is
+        # written back to the raw EXIF data so it survives convert() and copy()
+        exif = img.getexif()
+        exif[ORIENTATION] = orientation
+        img.info["exif"] = exif.tobytes()
+    return img
+
+
+def open_metadata(path: str) -> tuple[Image.Image, tuple[int, int]]:
+    """
+    Opens an image for reading its EXIF and XMP data, which come from the file itself: the
+    TIFF structure of a RAW file holds the camera, lens and exposure data, while its previews
+    usually carry only the orientation. RAW formats Pillow cannot parse fall back to their
+    embedded preview.
+
+    Args:
+        path (str): The image path.
+
+    Returns:
+        tuple[Image.Image, tuple[int, int]]: The opened image and the size of the largest
+        pixels that can be shown. The first page of a RAW file is often a small thumbnail, so
+        the largest embedded preview is used where it is bigger.
+    """
+    try:
+        img = Image.open(path)
+    except UnidentifiedImageError:
+        img = open_image(path)
+        return img, img.size
+    ext = os.path.splitext(path)[1].lower()
+    if ext in WEB_EXTENSIONS or ext in TIFF_EXTENSIONS:
+        return img, img.size
+    try:
+        previews, _ = find_previews(path)
+    except (OSError, struct.error):
+        previews = []
+    width, height = img.size
+    if previews:
+        largest = select_preview(previews, None)
+        if largest.width * largest.height > width * height:
+            width, height = largest.width, largest.height
+    return img, (width, height)
@@ -0,0 +1,132 @@
+"""
+scheduler.py
+
+Runs image jobs on the worker pool under a memory budget. Every job comes with an estimate
+of the memory needed to decode its image. Jobs are started largest first while the
+estimates of the running jobs fit the budget, and the smallest pending jobs fill the room
+a large job leaves, so a handful of panoramas can no longer be decoded at the same time.
+Filling that room stops once the largest pending job has waited for a few completions, so
+a steady stream of small jobs cannot keep it from ever fitting. Small jobs are sent to the
+workers in batches, like pool.map does, to save a round trip per job.
+"""
+
+import logging
+import os
+import queue
+from collections import deque
+from collections.abc import Callable, Iterator
+from typing import Any
+
+# bytes per pixel at the peak of a job: Pillow keeps RGB images in 4 bytes per pixel, and
+# the decoded image, its RGB conversion and its transposed copy can exist at the same time
+BYTES_PER_PIXEL = 12
+# share of the physical memory used as budget if none is configured
+DEFAULT_BUDGET_SHARE = 0.5
+# completions per worker the largest pending job waits for while smaller jobs are started
+# in its place, after which the running jobs are left to drain until it fits
+BACKFILL_ROUNDS = 2
+# jobs estimated below this share of the budget per worker are small enough to be batched
+BATCH_SHARE = 4
+# most jobs sent to a worker in one batch
+MAX_BATCH = 16
+
+logger = logging.getLogger(name="defaultlogger.thumbnails")
+
+
+def estimate(pixels: int) -> int:
+    """
+    Estimates the peak memory in bytes of a job decoding an image with this many pixels.
+    """
+    return pixels * BYTES_PER_PIXEL
+
+
+def default_budget() -> int | None:
+    """
+    Returns half of the physical memory, or None where it cannot be determined.
+    """
+    try:
+        return int(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") * DEFAULT_BUDGET_SHARE)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def run_batch(func: Callable[[Any], Any], jobs: list) -> list:
+    """
+    Runs a batch of jobs on a pool worker.
+    """
+    return [func(job) for job in jobs]
+
+
+def batches(costs: list[int], budget: int | None, slots: int) -> list[list[int]]:
+    """
+    Groups the jobs, largest first, into batches of job indices. Jobs estimated to need
+    more than a small share of the budget run on their own; the others are batched in
+    chunks sized like those of pool.map, up to MAX_BATCH jobs.
+
+    Returns:
+        list[list[int]]: The batches, largest first. The first job of a batch is its largest.
+    """
+    order = sorted(range(len(costs)), key=costs.__getitem__, reverse=True)
+    limit = budget // (slots * BATCH_SHARE) if budget is not None else None
+    large = [index for index in order if limit is not None and costs[index] > limit]
+    small = order[len(large) :]
+    size = max(min(-(-len(small) // (slots * 4)), MAX_BATCH), 1)
+    return [[index] for index in large] + [small[i : i + size] for i in range(0, len(small), size)]
+
+
+def schedule(pool, func: Callable[[Any], Any], jobs: list, costs: list[int], budget: int | None, slots: int) -> Iterator[Any]:
+    """
+    Runs func on every job and yields the results in the order they complete.
+
+    At most `slots` batches run at once, and only as many as fit the budget together. A
+    batch is estimated by its largest job, since its jobs run one after another. A job
+    larger than the whole budget runs alone.
+
+    Args:
+        pool (multiprocessing.pool.Pool): The worker pool.
+        func (Callable): The job function.
+        jobs (list): The job arguments.
+        costs (list[int]): The estimated memory of each job in bytes.
+        budget (int | None): The memory budget in bytes, None for no limit.
+        slots (int): The number of pool workers.
+
+    Yields:
+        The results of func.
+    """
+    done: queue.SimpleQueue = queue.SimpleQueue()
+    pending = deque(batches(costs, budget, slots))
+    running = 0
+    in_use = 0
+    # completions the largest pending batch has waited for since it last did not fit
+    waited = 0
+    while pending or running:
+        while pending and running < slots:
+            if budget is None or in_use + costs[pending[0][0]] <= budget:
+                batch = pending.popleft()
+                waited = 0
+            elif running == 0:
+                batch = pending.popleft()
+                waited = 0
+                logger.warning("job exceeds the memory budget, running it alone", extra={"job": jobs[batch[0]], "estimate": costs[batch[0]], "budget": budget})
+            elif waited < slots * BACKFILL_ROUNDS and in_use + costs[pending[-1][0]] <= budget:
+                # the smallest jobs fill the room the largest pending one does not fit into
+                batch = pending.pop()
+            else:
+                break
+            cost = costs[batch[0]]
+            running += 1
+            in_use += cost
+            pool.apply_async(
+                run_batch,
+                (func, [jobs[index] for index in batch]),
+                callback=lambda results, cost=cost: done.put((cost, results, None)),
+                error_callback=lambda error, cost=cost: done.put((cost, None, error)),
+            )
+        cost, results, error = done.get()
+        running -= 1
+        in_use -= cost
+        if error is not None:
+            raise error
+        if pending and budget is not None and in_use + costs[pending[0][0]] > budget:
+            waited += 1
+        yield from results
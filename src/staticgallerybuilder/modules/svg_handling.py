@@ -1,3 +1,5 @@
+import hashlib
+import json
 import logging
 import os
 import shutil
@@ -9,7 +11,7 @@ from PIL import Image
 
 from ..modules.argumentparser import Args
 from ..modules.css_color import extract_colorscheme
-from ..modules.util import resource_path
+from ..modules.util import resource_path, write_if_changed
 
 logger = logging.getLogger(name="defaultlogger")
 # Attempt to import cairosvg for SVG support, set flag based on success
@@ -25,6 +27,9 @@ except (ImportError, OSError):
 # Define constants for static files directory and icon sizes
 STATIC_FILES_DIR = resource_path("files")
 ICON_SIZES = ["36x36", "48x48", "72x72", "96x96", "144x144", "192x192", "512x512"]
+SERVICE_WORKER_FILE = "sw.js"
+PAGE_CACHE_SIZE = 200
+THUMBNAIL_CACHE_SIZE = 2000
 
 # Initialize Jinja2 environment for template rendering
 env = Environment(loader=FileSystemLoader(resource_path("templates")))
@@ -56,9 +61,8 @@ def render_svg_icon(colorscheme: dict[str, str], iconspath: str) -> str:
     """
     svg = env.get_template("icon.svg.j2")
     content = svg.render(colorscheme=colorscheme)
-    with open(os.path.join(iconspath, "icon.svg"), "w+", encoding="utf-8") as f:
-        logger.info("writing svg icon", extra={"iconspath": iconspath})
-        f.write(content)
+    if write_if_changed(os.path.join(iconspath, "icon.svg"), content):
+        logger.info("wrote svg icon", extra={"iconspath": iconspath})
     return content
 
 
@@ -156,9 +160,41 @@ def render_manifest_json(_args: Args, icon_list: list[Icon], colors: dict[str, s
         background_color=colors["bcolor1"],
         theme_color=colors["color1"],
     )
-    with open(os.path.join(_args.root_directory, ".static", "manifest.webmanifest"), "w", encoding="utf-8") as f:
-        logger.info("rendering manifest.webmanifest", extra={"path": os.path.join(_args.root_directory, ".static", "manifest.webmanifest")})
-        f.write(content)
+    path = os.path.join(_args.root_directory, ".static", "manifest.webmanifest")
+    if write_if_changed(path, content):
+        logger.info("rendered manifest.webmanifest", extra={"path": path})
+
+
+def service_worker(_args: Args, version: str) -> str:
+    """
+    Render the service worker into the web root, so its scope covers the whole gallery.
+
+    The worker precaches the fingerprinted static files and keeps its caches under a build
+    ID derived from them, so every deploy that changes the shell replaces the old caches.
+    Pages are fetched from the network first and served from the cache when offline.
+
+    Parameters:
+    -----------
+    _args : Args
+        Parsed command-line arguments.
+    version : str
+        The program version.
+
+    Returns:
+    --------
+    str
+        Path of the written service worker.
+    """
+    static_dir = os.path.join(_args.root_directory, ".static")
+    names = sorted(set(_args.assets.values())) + ["favicon.ico", "manifest.webmanifest"]
+    shell = [f"{_args.web_root_url}.static/{name}" for name in names if os.path.exists(os.path.join(static_dir, name))]
+    build_id = hashlib.sha256(json.dumps([version, shell], sort_keys=True).encode()).hexdigest()[:12]
+
+    content = env.get_template("sw.js.j2").render(build_id=build_id, shell=shell, page_cache_size=PAGE_CACHE_SIZE, thumbnail_cache_size=THUMBNAIL_CACHE_SIZE)
+    path = os.path.join(_args.root_directory, SERVICE_WORKER_FILE)
+    if write_if_changed(path, content):
+        logger.info("rendered service worker", extra={"path": path, "build_id": build_id})
+    return path
 
 
 def create_icons_from_svg(files: list[str], iconspath: str, _args: Args) -> list[Icon]:
@@ -1,3 +1,6 @@
+import filecmp
+import os
+import shutil
 import sys
 from importlib.resources import as_file, files
 from pathlib import Path
@@ -11,3 +14,46 @@ def resource_path(*parts: str) -> Path:
 
     with as_file(res) as actual_path:
         return actual_path
+
+
+def write_if_changed(path: str, content: str) -> int:
+    """
+    Writes a text file unless it already has exactly this content, keeping the
+    modification time of unchanged outputs stable. The file is replaced atomically, so
+    an interrupted build never leaves it truncated.
+
+    Returns:
+        int: The number of bytes written, 0 if the file was unchanged.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            if f.read() == content:
+                return 0
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+    # hidden, so a leftover from an interrupted build is not listed in the gallery
+    tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp, path)
+    return len(content.encode("utf-8"))
+
+
+def copy_if_changed(src: str, dest: str) -> int:
+    """
+    Copies a file unless the destination already has the same content, keeping the
+    modification time of unchanged copies stable. The copy replaces the destination
+    atomically.
+
+    Returns:
+        int: The number of bytes written, 0 if the copy was unchanged.
+    """
+    try:
+        if filecmp.cmp(src, dest, shallow=False):
+            return 0
+    except FileNotFoundError:
+        pass
+    tmp = os.path.join(os.path.dirname(dest), f".{os.path.basename(dest)}.tmp")
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+    return os.path.getsize(dest)
@@ -1,38 +1,81 @@
 class PhotoGallery {
+  // Above this many images the grid only keeps the rows near the viewport
+  // in the DOM; VIRTUAL_OVERSCAN extra rows are rendered above and below.
+  static VIRTUAL_THRESHOLD = 1000;
+  static VIRTUAL_OVERSCAN = 4;
+  // Number of full-size images preloaded ahead of the open image in the viewer;
+  // half as many are kept behind it.
+  static PREFETCH_AHEAD = 3;
+
   constructor() {
     this.pswpElement = document.querySelector(".pswp");
     this.items = [];
     this.shown = [];
     this.subfolders = [];
     this.tagDropdownShown = false;
-
+    this.gallery = null;
+    this.exifCache = new Map();
+    this.tagIndex = null;
+    this.postings = new Map();
+    this.postingsComplete = true;
+    this.loadedPages = new Set();
+    this.startPage = 1;
+    this.pageLoading = false;
+    this.prerendered = false;
+    this.virtual = null;
+    this.virtualFrame = null;
+    this.viewerPrefetch = new Map();
+    this.viewerPrefetchTimer = null;
+
+    this.columnContent = this.columnContent.bind(this);
+    this.createColumn = this.createColumn.bind(this);
     this.darkMode = this.darkMode.bind(this);
     this.darkModeToggle = this.darkModeToggle.bind(this);
     this.debounce = this.debounce.bind(this);
     this.detectDarkMode = this.detectDarkMode.bind(this);
+    this.displaySource = this.displaySource.bind(this);
+    this.escapeHtml = this.escapeHtml.bind(this);
 
     this.detectDarkMode();
 
     this.filter = this.filter.bind(this);
     this.finalize = this.finalize.bind(this);
+    this.getExif = this.getExif.bind(this);
+    this.getSelectedTags = this.getSelectedTags.bind(this);
+    this.imagesFromMetadata = this.imagesFromMetadata.bind(this);
     this.insertPath = this.insertPath.bind(this);
     this.lightMode = this.lightMode.bind(this);
+    this.loadNextPage = this.loadNextPage.bind(this);
+    this.loadPages = this.loadPages.bind(this);
     this.onLoad = this.onLoad.bind(this);
     this.openSwipe = this.openSwipe.bind(this);
+    this.pagesForTags = this.pagesForTags.bind(this);
     this.parseHierarchicalTags = this.parseHierarchicalTags.bind(this);
     this.prefetch = this.prefetch.bind(this);
+    this.prefetchBudget = this.prefetchBudget.bind(this);
     this.prefetchCancel = this.prefetchCancel.bind(this);
+    this.prefetchViewer = this.prefetchViewer.bind(this);
+    this.prefetchViewerCancel = this.prefetchViewerCancel.bind(this);
+    this.resetItems = this.resetItems.bind(this);
+    this.resetWindow = this.resetWindow.bind(this);
     this.recursive = this.recursive.bind(this);
     this.renderTree = this.renderTree.bind(this);
+    this.renderWindow = this.renderWindow.bind(this);
     this.requestMetadata = this.requestMetadata.bind(this);
     this.reset = this.reset.bind(this);
     this.resetHoverTimer = this.resetHoverTimer.bind(this);
+    this.rowAt = this.rowAt.bind(this);
+    this.rowTops = this.rowTops.bind(this);
+    this.scheduleWindow = this.scheduleWindow.bind(this);
     this.scrollFunction = this.scrollFunction.bind(this);
     this.setFilter = this.setFilter.bind(this);
     this.setupClickHandlers = this.setupClickHandlers.bind(this);
     this.setupDropdownToggle = this.setupDropdownToggle.bind(this);
+    this.setupInfiniteScroll = this.setupInfiniteScroll.bind(this);
     this.setupTagHandlers = this.setupTagHandlers.bind(this);
+    this.showExif = this.showExif.bind(this);
     this.showLoader = this.showLoader.bind(this);
+    this.sortShown = this.sortShown.bind(this);
     this.toggleTag = this.toggleTag.bind(this);
     this.topFunction = this.topFunction.bind(this);
     this.updateImageList = this.updateImageList.bind(this);
@@ -40,6 +83,26 @@ class PhotoGallery {
     this.init();
   }
 
+  columnContent(item, index) {
+    let caption = item.name;
+    if (item.tiff) caption += `&nbsp;<a href="${item.tiff}">TIFF</a>`;
+    if (item.raw) caption += `&nbsp;<a href="${item.raw}">RAW</a>`;
+    return {
+      title: item.tagtitle ?? this.renderTree(this.parseHierarchicalTags(item.tags || [])),
+      src: item.msrc,
+      placeholder: item.placeholder ? `background-image: url(${item.placeholder})` : "",
+      index: index,
+      caption: caption,
+    };
+  }
+
+  createColumn() {
+    const column = document.createElement("div");
+    column.className = "column";
+    column.innerHTML = '<figure><img /><figcaption class="caption"></figcaption></figure>';
+    return column;
+  }
+
   darkMode() {
     const themeLink = document.getElementById("theme");
     const darkThemeLink = document.getElementById("darktheme");
@@ -102,48 +165,69 @@ class PhotoGallery {
     }
   }
 
-  filter() {
-    this.showLoader();
+  displaySource(item) {
+    // the smallest downscaled copy that still covers the screen, or the original
+    const target = Math.max(window.innerWidth, window.innerHeight) * (window.devicePixelRatio || 1);
+    const sizes = item.sizes || [];
+    // RAW and TIFF originals come with a full-size copy the browser can show
+    const size =
+      sizes.find((size) => Math.max(size.w, size.h) >= target) || sizes.find((size) => size.w === item.w && size.h === item.h);
+    return size ? { src: size.src, w: size.w, h: size.h, original: item.src } : { src: item.src, original: item.src };
+  }
+
+  escapeHtml(value) {
+    return String(value).replace(/[&<>"']/g, (c) => ({ "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;" })[c]);
+  }
+
+  async filter(quiet = false) {
+    if (!quiet && !this.prerendered) this.showLoader();
     const searchParams = new URLSearchParams(window.location.search);
-    this.shown = [];
-    let path = decodeURIComponent(window.location.origin + window.location.pathname.replace("index.html", ""));
+    let path = decodeURIComponent(window.location.origin + window.location.pathname.replace(/index(-\d+)?\.html$/, ""));
     if (path.startsWith("null")) {
       path = window.location.protocol + "//" + path.substring(4);
     }
-    const selectedTags = [];
-
-    document.querySelectorAll("#tagdropdown input.tagcheckbox:checked").forEach((checkbox) => {
-      let tag = checkbox.parentElement.id.trim().substring(1);
-      if (checkbox.parentElement.parentElement.children.length > 1) tag += "|";
-      selectedTags.push(tag);
-    });
+    const selectedTags = this.getSelectedTags();
 
     const urltags = selectedTags.join(",");
 
+    if (this.tagIndex && selectedTags.length > 0) {
+      await this.loadPages(this.pagesForTags(selectedTags));
+    }
+    this.shown = [];
+
     let isRecursiveChecked = false;
     try {
       isRecursiveChecked = document.getElementById("recursive")?.checked || false;
     } catch {}
 
-    for (const item of this.items) {
-      const tags = item.tags || [];
-      const include = selectedTags.every((selected) => {
-        const isParent = selected.endsWith("|");
-        return isParent ? tags.some((t) => t.startsWith(selected)) : tags.includes(selected);
-      });
+    const useIndex = selectedTags.length > 0 && this.postingsComplete;
+    let candidates = this.items;
+    if (useIndex) {
+      const sets = selectedTags.map((tag) => this.postings.get(tag) || new Set()).sort((a, b) => a.size - b.size);
+      candidates = [...sets[0]].filter((item) => sets.every((set) => set.has(item))).sort((a, b) => a.order - b.order);
+    }
 
-      if (include || selectedTags.length === 0) {
-        if (!isRecursiveChecked) {
-          if (decodeURIComponent(item.src).replace(item.name, "") === path) {
-            this.shown.push(item);
-          }
-        } else {
-          this.shown.push(item);
-        }
+    for (const item of candidates) {
+      if (!useIndex && selectedTags.length > 0) {
+        const tags = item.tags || [];
+        const include = selectedTags.every((selected) => {
+          const isParent = selected.endsWith("|");
+          return isParent ? tags.some((t) => t.startsWith(selected)) : tags.includes(selected);
+        });
+        if (!include) continue;
       }
+      if (!isRecursiveChecked && decodeURIComponent(item.src).replace(item.name, "") !== path) continue;
+      this.shown.push(item);
+    }
+    if (this.prerendered) {
+      this.prerendered = false;
+      this.sortShown();
+    } else {
+      this.updateImageList(quiet);
     }
-    this.updateImageList();
     window.location.hash = urltags;
+    if (this.tagIndex) this.loadNextPage();
+    if (quiet) return;
 
     const pid = searchParams.get("pid") - 1;
     if (pid != -1) {
@@ -168,6 +252,59 @@ class PhotoGallery {
     return obj || [];
   }
 
+  async getExif(item) {
+    if (item.exifdata !== undefined) return item.exifdata;
+    if (!item.exif) return null;
+    if (!this.exifCache.has(item.exif)) {
+      const request = fetch(item.exif)
+        .then((response) => {
+          if (!response.ok) throw new Error("Failed to fetch exif data");
+          return response.json();
+        })
+        .catch(() => {
+          this.exifCache.delete(item.exif);
+          return {};
+        });
+      this.exifCache.set(item.exif, request);
+    }
+    const data = await this.exifCache.get(item.exif);
+    return data.images?.[item.name]?.exifdata || null;
+  }
+
+  getSelectedTags() {
+    const selectedTags = [];
+    document.querySelectorAll("#tagdropdown input.tagcheckbox:checked").forEach((checkbox) => {
+      let tag = checkbox.parentElement.id.trim().substring(1);
+      if (checkbox.parentElement.parentElement.children.length > 1) tag += "|";
+      selectedTags.push(tag);
+    });
+    return selectedTags;
+  }
+
+  imagesFromMetadata(data) {
+    const images = Object.values(data.images || {});
+    images.forEach((image, index) => {
+      if (data.exif) image.exif = data.exif;
+      if (data.page) image.page = data.page;
+      image.order = (data.page || 0) * 10000000 + index;
+    });
+    if (!data.tagindex) {
+      if (images.length > 0) this.postingsComplete = false;
+      return images;
+    }
+    for (const [tag, indices] of Object.entries(data.tagindex)) {
+      let postings = this.postings.get(tag);
+      if (!postings) {
+        postings = new Set();
+        this.postings.set(tag, postings);
+      }
+      for (const index of indices) {
+        if (images[index]) postings.add(images[index]);
+      }
+    }
+    return images;
+  }
+
   insertPath(obj, path) {
     let current = obj;
     for (let i = 0; i < path.length; i++) {
@@ -193,7 +330,52 @@ class PhotoGallery {
     if (darkThemeLink) darkThemeLink.disabled = true;
   }
 
+  async loadNextPage() {
+    if (!this.tagIndex || this.pageLoading || this.getSelectedTags().length > 0) return;
+    const sentinel = document.getElementById("page-sentinel");
+    if (!sentinel || sentinel.getBoundingClientRect().top > window.innerHeight + 1000) return;
+    let next = null;
+    for (let number = this.startPage + 1; number <= this.tagIndex.pages.length; number++) {
+      if (!this.loadedPages.has(number)) {
+        next = number;
+        break;
+      }
+    }
+    if (next === null) return;
+    this.pageLoading = true;
+    const loaded = await this.loadPages([next]);
+    this.pageLoading = false;
+    if (loaded) this.filter(true);
+  }
+
+  async loadPages(numbers) {
+    const pending = numbers.filter((number) => !this.loadedPages.has(number) && this.tagIndex.pages[number - 1]);
+    pending.forEach((number) => this.loadedPages.add(number));
+    const results = await Promise.all(
+      pending.map((number) =>
+        fetch(this.tagIndex.pages[number - 1])
+          .then((response) => {
+            if (!response.ok) throw new Error("Failed to fetch page");
+            return response.json();
+          })
+          .catch(() => {
+            this.loadedPages.delete(number);
+            return null;
+          }),
+      ),
+    );
+    let loaded = false;
+    for (const data of results) {
+      if (!data) continue;
+      this.items.push(...this.imagesFromMetadata(data));
+      loaded = true;
+    }
+    if (loaded) this.items.sort((a, b) => a.order - b.order);
+    return loaded;
+  }
+
   onLoad() {
+    this.prerendered = document.getElementById("imagelist")?.hasAttribute("data-prerendered") || false;
     document.querySelectorAll(".tagtoggle").forEach((toggle) => {
       toggle.addEventListener("mouseup", (event) => {
         event.stopPropagation();
@@ -206,14 +388,50 @@ class PhotoGallery {
     this.setupDropdownToggle();
     this.setupTagHandlers();
     this.setupClickHandlers();
+    this.setupInfiniteScroll();
 
     window.addEventListener("scroll", this.scrollFunction);
+    window.addEventListener("scroll", this.scheduleWindow, { passive: true });
+    window.addEventListener(
+      "resize",
+      this.debounce(() => {
+        if (this.virtual) this.resetWindow(true);
+      }, 150),
+    );
   }
 
   openSwipe(imgIndex) {
-    const options = { index: imgIndex };
-    const gallery = new PhotoSwipe(this.pswpElement, PhotoSwipeUI_Default, this.shown, options);
+    if (!this.shown[imgIndex]) return;
+    const options = {
+      index: imgIndex,
+      getImageURLForShare: () => gallery.currItem.original || gallery.currItem.src,
+    };
+    if (!this.prefetchBudget()) options.preload = [0, 0];
+    const slides = this.shown.map((item) => ({ ...item, ...this.displaySource(item) }));
+    const gallery = new PhotoSwipe(this.pswpElement, PhotoSwipeUI_Default, slides, options);
+    const exifPanel = document.getElementById("exif-panel");
+    gallery.listen("afterChange", () => {
+      if (exifPanel && !exifPanel.hidden) this.showExif(true);
+      this.prefetchViewer(gallery.getCurrentIndex());
+    });
+    gallery.listen("destroy", () => {
+      if (exifPanel) exifPanel.hidden = true;
+      this.prefetchViewerCancel();
+      this.gallery = null;
+    });
+    this.gallery = gallery;
     gallery.init();
+    this.prefetchViewer(imgIndex);
+  }
+
+  pagesForTags(selectedTags) {
+    const lists = selectedTags.map((tag) => this.tagIndex.tags[tag] || []).sort((a, b) => a.length - b.length);
+    const others = lists.slice(1).map((list) => new Set(list));
+    const pages = new Set();
+    for (const index of lists[0] || []) {
+      if (others.every((set) => set.has(index))) pages.add(Math.floor(index / this.tagIndex.pagesize) + 1);
+    }
+    return [...pages];
   }
 
   parseHierarchicalTags(tags, delimiter = "|") {
@@ -227,13 +445,21 @@ class PhotoGallery {
 
   prefetch(imgIndex) {
     const prefetchDiv = document.getElementById("img-prefetch");
-    if (!prefetchDiv) return;
+    if (!prefetchDiv || !this.prefetchBudget()) return;
 
     const img = document.createElement("img");
-    img.src = this.shown[imgIndex]?.src || "";
+    img.src = this.shown[imgIndex] ? this.displaySource(this.shown[imgIndex]).src : "";
     prefetchDiv.appendChild(img);
   }
 
+  prefetchBudget() {
+    const connection = navigator.connection;
+    if (!connection) return PhotoGallery.PREFETCH_AHEAD;
+    if (connection.saveData || /2g$/.test(connection.effectiveType || "")) return 0;
+    if (connection.effectiveType === "3g") return 1;
+    return PhotoGallery.PREFETCH_AHEAD;
+  }
+
   prefetchCancel() {
     const prefetchDiv = document.getElementById("img-prefetch");
     if (!prefetchDiv) return;
@@ -242,6 +468,45 @@ class PhotoGallery {
     }
   }
 
+  prefetchViewer(index) {
+    clearTimeout(this.viewerPrefetchTimer);
+    // wait for the navigation to settle, so flicking through the viewer does not
+    // start a download for every image passed on the way
+    this.viewerPrefetchTimer = setTimeout(() => {
+      const ahead = this.prefetchBudget();
+      const count = this.shown.length;
+      const wanted = new Map();
+      const add = (offset, priority) => {
+        const item = this.shown[(((index + offset) % count) + count) % count];
+        if (!item || item === this.shown[index]) return;
+        const src = this.displaySource(item).src;
+        if (src && !wanted.has(src)) wanted.set(src, priority);
+      };
+      for (let offset = 1; offset <= ahead; offset++) add(offset, offset === 1 ? "high" : "low");
+      for (let offset = 1; offset <= Math.ceil(ahead / 2); offset++) add(-offset, "low");
+
+      this.prefetchViewerCancel(wanted);
+      wanted.forEach((priority, src) => {
+        if (this.viewerPrefetch.has(src)) return;
+        const img = new Image();
+        img.decoding = "async";
+        img.fetchPriority = priority;
+        img.src = src;
+        this.viewerPrefetch.set(src, img);
+      });
+    }, 200);
+  }
+
+  prefetchViewerCancel(keep = new Map()) {
+    if (keep.size === 0) clearTimeout(this.viewerPrefetchTimer);
+    this.viewerPrefetch.forEach((img, src) => {
+      if (keep.has(src)) return;
+      // dropping the source aborts the request if the image is still loading
+      if (!img.complete) img.removeAttribute("src");
+      this.viewerPrefetch.delete(src);
+    });
+  }
+
   async recursive() {
     this.showLoader();
     const loc = new URL(window.location.href);
@@ -249,9 +514,11 @@ class PhotoGallery {
     const title = document.title;
     const isChecked = document.getElementById("recursive")?.checked;
     const folders = document.querySelector(".folders");
+    const pagination = document.querySelector(".pagination");
 
     if (!isChecked) {
       if (folders) folders.style.display = "";
+      if (pagination) pagination.style.display = "";
       loc.searchParams.delete("recursive");
       window.history.replaceState({ html: content, pageTitle: title }, "", loc);
       this.requestMetadata();
@@ -260,6 +527,8 @@ class PhotoGallery {
 
     this.showLoader();
     if (folders) folders.style.display = "none";
+    if (pagination) pagination.style.display = "none";
+    this.tagIndex = null;
     loc.searchParams.delete("recursive");
     loc.searchParams.append("recursive", true);
     window.history.replaceState({ html: content, pageTitle: title }, "", loc);
@@ -273,10 +542,10 @@ class PhotoGallery {
       if (!response.ok) throw new Error("Failed to fetch metadata");
       const data = await response.json();
 
-      this.items = [];
+      this.resetItems();
       this.subfolders = data.subfolders || [];
 
-      for (const image of Object.values(data.images || {})) {
+      for (const image of this.imagesFromMetadata(data)) {
         newItems.push(image);
         existingItems.add(image.src);
       }
@@ -295,7 +564,7 @@ class PhotoGallery {
             const response = await fetch(folder.metadata);
             if (!response.ok) throw new Error();
             const data = await response.json();
-            for (const image of Object.values(data.images || {})) {
+            for (const image of this.imagesFromMetadata(data)) {
               if (!existingItems.has(image.src)) {
                 newItems.push(image);
                 existingItems.add(image.src);
@@ -330,18 +599,76 @@ class PhotoGallery {
     return lines.join("\n");
   };
 
+  renderWindow() {
+    this.virtualFrame = null;
+    const virtual = this.virtual;
+    const imagelist = document.getElementById("imagelist");
+    if (!virtual || !imagelist) return;
+    const rows = virtual.tops.length - 1;
+    const offset = -imagelist.getBoundingClientRect().top;
+    const first = Math.max(0, this.rowAt(offset) - PhotoGallery.VIRTUAL_OVERSCAN);
+    const last = Math.min(rows - 1, this.rowAt(offset + window.innerHeight) + PhotoGallery.VIRTUAL_OVERSCAN);
+    if (first === virtual.first && last === virtual.last) return;
+    virtual.first = first;
+    virtual.last = last;
+
+    const start = first * virtual.columns;
+    const end = Math.min(this.shown.length, (last + 1) * virtual.columns);
+    while (virtual.pool.length < end - start) {
+      const column = this.createColumn();
+      virtual.pool.push(column);
+      virtual.container.appendChild(column);
+    }
+    // Every index owns a fixed slot in the pool, so rows that stay in the
+    // window keep their nodes and only rows scrolling in are rewritten.
+    const used = new Set();
+    for (let index = start; index < end; index++) {
+      const slot = index % virtual.pool.length;
+      const column = virtual.pool[slot];
+      used.add(slot);
+      column.hidden = false;
+      column.style.order = index - start;
+      if (column.dataset.item === String(index)) continue;
+      const item = this.shown[index];
+      const content = this.columnContent(item, index);
+      const figure = column.firstChild;
+      const img = figure.firstChild;
+      figure.title = content.title.replaceAll("&nbsp;", "\u00a0");
+      img.style.cssText = content.placeholder;
+      if (item.w && item.h) img.style.aspectRatio = `${item.w} / ${item.h}`;
+      img.src = content.src;
+      img.dataset.index = index;
+      figure.lastChild.innerHTML = content.caption;
+      column.dataset.item = index;
+    }
+    virtual.pool.forEach((column, slot) => {
+      if (!used.has(slot)) column.hidden = true;
+    });
+    virtual.container.style.transform = `translateY(${virtual.tops[first]}px)`;
+  }
+
   requestMetadata() {
-    this.showLoader();
     const hash = window.location.hash;
     const searchParams = new URLSearchParams(window.location.search);
-    fetch(".metadata.json")
-      .then((response) => {
+    if (hash != "" || searchParams.get("recursive") != null) this.prerendered = false;
+    if (!this.prerendered) this.showLoader();
+    const imagelist = document.getElementById("imagelist");
+    const paginated = imagelist?.dataset.metadata && searchParams.get("recursive") == null;
+    const fetchJson = (url) =>
+      fetch(url).then((response) => {
         if (!response.ok) throw new Error("Failed to fetch metadata");
         return response.json();
-      })
-      .then((data) => {
-        this.items = Object.values(data.images || {});
+      });
+    const requests = [fetchJson(paginated ? imagelist.dataset.metadata : ".metadata.json")];
+    if (paginated) requests.push(fetchJson(imagelist.dataset.tagindex).catch(() => null));
+    Promise.all(requests)
+      .then(([data, tagIndex]) => {
+        this.resetItems();
+        this.items = this.imagesFromMetadata(data);
         this.subfolders = data.subfolders || [];
+        this.tagIndex = tagIndex || null;
+        this.startPage = data.page || 1;
+        this.loadedPages = new Set(data.page ? [data.page] : []);
 
         if (hash != "") {
           const selected = hash.replace("#", "").split(",");
@@ -384,6 +711,78 @@ class PhotoGallery {
     }, 500);
   }
 
+  resetItems() {
+    this.items = [];
+    this.postings = new Map();
+    this.postingsComplete = true;
+  }
+
+  resetWindow(measure = false) {
+    const imagelist = document.getElementById("imagelist");
+    if (!imagelist) return;
+    if (measure || !this.virtual) {
+      imagelist.innerHTML = "";
+      imagelist.classList.add("row", "virtual");
+      imagelist.classList.remove("centerload");
+      const container = document.createElement("div");
+      container.className = "row virtualwindow";
+      imagelist.appendChild(container);
+      // Cells are as wide as a column and as tall as their image at that
+      // width plus a single-line caption. A square probe column gives the
+      // image width and the height around it.
+      const probe = this.createColumn();
+      container.appendChild(probe);
+      probe.firstChild.lastChild.textContent = "probe";
+      const columns = Math.max(1, Math.round(container.clientWidth / probe.offsetWidth));
+      const width = probe.firstChild.firstChild.getBoundingClientRect().width;
+      const chrome = probe.getBoundingClientRect().height - width;
+      probe.remove();
+      this.virtual = { container: container, columns: columns, width: width, chrome: chrome, pool: [] };
+    }
+    this.virtual.first = -1;
+    this.virtual.last = -1;
+    this.virtual.tops = this.rowTops();
+    this.virtual.pool.forEach((column) => delete column.dataset.item);
+    imagelist.style.height = `${this.virtual.tops[this.virtual.tops.length - 1]}px`;
+    this.renderWindow();
+  }
+
+  rowAt(offset) {
+    // The last row starting at or above offset.
+    const tops = this.virtual.tops;
+    let low = 0;
+    let high = tops.length - 2;
+    while (low < high) {
+      const middle = (low + high + 1) >> 1;
+      if (tops[middle] <= offset) low = middle;
+      else high = middle - 1;
+    }
+    return low;
+  }
+
+  rowTops() {
+    // A row is as tall as its tallest image, taken from the aspect ratio in
+    // the metadata; images without dimensions are square.
+    const { columns, width, chrome } = this.virtual;
+    const rows = Math.ceil(this.shown.length / columns);
+    const tops = new Float64Array(rows + 1);
+    for (let row = 0; row < rows; row++) {
+      let ratio = 0;
+      const end = Math.min(this.shown.length, (row + 1) * columns);
+      for (let index = row * columns; index < end; index++) {
+        const item = this.shown[index];
+        ratio = Math.max(ratio, item.w && item.h ? item.h / item.w : 1);
+      }
+      tops[row + 1] = tops[row] + chrome + width * ratio;
+    }
+    return tops;
+  }
+
+  scheduleWindow() {
+    if (!this.virtual || this.virtualFrame) return;
+    this.virtualFrame = requestAnimationFrame(this.renderWindow);
+  }
+
   scrollFunction() {
     const totopbutton = document.getElementById("totop");
     if (!totopbutton) return;
@@ -414,6 +813,9 @@ class PhotoGallery {
     const totop = document.getElementById("totop");
     if (totop) totop.addEventListener("click", this.topFunction);
 
+    const exifButton = document.getElementById("exif-button");
+    if (exifButton) exifButton.addEventListener("click", () => this.showExif());
+
     const darkModeSwitch = document.getElementById("dark-mode-switch");
     if (darkModeSwitch) darkModeSwitch.addEventListener("click", this.darkModeToggle);
 
@@ -472,11 +874,23 @@ class PhotoGallery {
     });
   }
 
+  setupInfiniteScroll() {
+    const sentinel = document.getElementById("page-sentinel");
+    if (!sentinel || !("IntersectionObserver" in window)) return;
+    const observer = new IntersectionObserver(
+      (entries) => {
+        if (entries.some((entry) => entry.isIntersecting)) this.loadNextPage();
+      },
+      { rootMargin: "0px 0px 1000px 0px" },
+    );
+    observer.observe(sentinel);
+  }
+
   setupTagHandlers() {
     const tagContainer = document.getElementById("tagdropdown");
     if (!tagContainer) return;
 
-    const debouncedFilter = this.debounce(this.filter, 150);
+    const debouncedFilter = this.debounce(() => this.filter(), 150);
     tagContainer.addEventListener("change", debouncedFilter);
 
     tagContainer.addEventListener("click", (event) => {
@@ -489,13 +903,39 @@ class PhotoGallery {
     });
   }
 
+  async showExif(refresh = false) {
+    const panel = document.getElementById("exif-panel");
+    if (!panel || !this.gallery) return;
+    if (!panel.hidden && !refresh) {
+      panel.hidden = true;
+      return;
+    }
+    const item = this.gallery.currItem;
+    const exif = await this.getExif(item);
+    if (this.gallery?.currItem !== item) return;
+    let str = "";
+    for (const [key, value] of Object.entries(exif || {})) {
+      if (value === null || value === undefined) continue;
+      str += `<tr><th>${this.escapeHtml(key)}</th><td>${this.escapeHtml(value)}</td></tr>`;
+    }
+    panel.innerHTML = str ? `<table>${str}</table>` : "No EXIF data";
+    panel.hidden = false;
+  }
+
   showLoader() {
     const imagelist = document.getElementById("imagelist");
+    this.virtual = null;
+    imagelist.style.height = "";
+    imagelist.classList.remove("virtual");
     imagelist.innerHTML = '<span class="loader"></span>';
     imagelist.classList.add("centerload");
     imagelist.classList.remove("row");
   }
 
+  sortShown() {
+    this.shown.sort((a, b) => a.src.replace(a.name, "").localeCompare(b.src.replace(b.name, "")));
+  }
+
   toggleTag(tagid) {
     const tag = document.getElementById(tagid);
     const ol = tag?.closest(".tagentry")?.querySelector(".tagentryparent");
@@ -509,23 +949,26 @@ class PhotoGallery {
     window.scrollTo({ top: 0, behavior: "smooth" });
   }
 
-  updateImageList() {
-    this.showLoader();
+  updateImageList(quiet = false) {
+    if (!quiet) this.showLoader();
     const imagelist = document.getElementById("imagelist");
     if (!imagelist) return;
+    this.sortShown();
+    if (this.shown.length > PhotoGallery.VIRTUAL_THRESHOLD) {
+      this.resetWindow();
+      return;
+    }
+    this.virtual = null;
     let str = "";
-    this.shown.sort((a, b) => a.src.replace(a.name, "").localeCompare(b.src.replace(b.name, "")));
     this.shown.forEach((item, index) => {
-      let tags = this.parseHierarchicalTags(item.tags || []);
-      str += `<div class="column"><figure title="${this.renderTree(tags)}"><img src="${
-        item.msrc
-      }" data-index="${index}" /><figcaption class="caption">${item.name}`;
-      if (item.tiff) str += `&nbsp;<a href="${item.tiff}">TIFF</a>`;
-      if (item.raw) str += `&nbsp;<a href="${item.raw}">RAW</a>`;
-      str += "</figcaption></figure></div>";
+      const content = this.columnContent(item, index);
+      str += `<div class="column"><figure title="${content.title}"><img src="${content.src}" style="${
+        content.placeholder
+      }" data-index="${content.index}" /><figcaption class="caption">${content.caption}</figcaption></figure></div>`;
     });
+    imagelist.style.height = "";
     imagelist.classList.add("row");
-    imagelist.classList.remove("centerload");
+    imagelist.classList.remove("centerload", "virtual");
     imagelist.innerHTML = str;
   }
 
@@ -0,0 +1,119 @@
+import http.client
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+
+from staticgallerybuilder.main import Builder, __version__
+from staticgallerybuilder.modules.argumentparser import parse_arguments
+from staticgallerybuilder.modules.daemon import LOOPBACK_HOSTS, Daemon, Job, make_handler
+
+TOKEN = "secret"
+
+
+class GalleryTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.directory.name, "gallery")
+        for folder in ("a/b", "ab", "new", ".hidden/x"):
+            os.makedirs(os.path.join(self.root, folder))
+        for folder in ("", "a", "a/b", "ab"):
+            with open(os.path.join(self.root, folder, "index.html"), "w", encoding="utf-8") as f:
+                f.write("<html></html>")
+        with open(os.path.join(self.root, "a", "b", "image.jpg"), "wb") as f:
+            f.write(b"")
+        args = parse_arguments(__version__, ["-p", self.root, "-w", "https://example.com", "-t", "Gallery", "-n"])
+        self.daemon = Daemon(Builder(args, logo=""), __version__)
+        self.base = self.daemon.root
+
+    def tearDown(self) -> None:
+        self.daemon.stop()
+        self.directory.cleanup()
+
+
+class DaemonTest(GalleryTestCase):
+    def test_folder_of_paths(self) -> None:
+        self.assertEqual(self.daemon.folder("a/b/image.jpg"), self.base + "a/b")
+        self.assertEqual(self.daemon.folder("a/b/removed.jpg"), self.base + "a/b")
+        # folders without a page yet are linked from their parent
+        self.assertEqual(self.daemon.folder("new"), self.base)
+        self.assertEqual(self.daemon.folder("a/removed/image.jpg"), self.base + "a")
+        self.assertEqual(self.daemon.folder(""), self.base)
+
+    def test_folder_rejects_paths_outside_the_gallery(self) -> None:
+        for path in ("../outside", "a/../../outside", "/etc/passwd", ".hidden/x", ".hidden/x/image.jpg"):
+            with self.subTest(path=path), self.assertRaises(ValueError):
+                self.daemon.folder(path)
+
+    def test_merge_drops_nested_folders(self) -> None:
+        jobs = [Job([self.base + "a/b"]), Job([self.base + "a", self.base + "ab"]), Job([self.base + "a/b"])]
+        self.assertEqual(self.daemon.merge(jobs), [self.base + "a", self.base + "ab"])
+        self.assertEqual(self.daemon.merge([Job([self.base + "ab"]), Job([self.base + "a/b"])]), [self.base + "a/b", self.base + "ab"])
+        self.assertEqual(self.daemon.merge([Job([self.base + "a"]), Job([self.base])]), [self.base])
+
+
+class HandlerTest(GalleryTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(self.daemon, TOKEN, LOOPBACK_HOSTS))
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def request(self, method: str, path: str, body: object = None, headers: dict[str, str] | None = None) -> tuple[int, dict]:
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=10)
+        try:
+            data = None if body is None else json.dumps(body).encode()
+            headers = {"Authorization": f"Bearer {TOKEN}", "Content-Type": "application/json"} | (headers or {})
+            connection.request(method, path, data, {name: value for name, value in headers.items() if value is not None})
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            connection.close()
+
+    def test_status(self) -> None:
+        status, body = self.request("GET", "/status")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["state"], "idle")
+
+    def test_foreign_host_is_rejected(self) -> None:
+        status, _ = self.request("GET", "/status", headers={"Host": "attacker.example:8080"})
+        self.assertEqual(status, 403)
+        status, _ = self.request("POST", "/rebuild", {"wait": False}, headers={"Host": "attacker.example"})
+        self.assertEqual(status, 403)
+        self.assertTrue(self.daemon.jobs.empty())
+
+    def test_missing_or_wrong_token_is_rejected(self) -> None:
+        for authorization in (None, "Bearer wrong", f"Basic {TOKEN}", TOKEN):
+            with self.subTest(authorization=authorization):
+                status, _ = self.request("POST", "/rebuild", {"wait": False}, headers={"Authorization": authorization})
+                self.assertEqual(status, 401)
+        self.assertTrue(self.daemon.jobs.empty())
+
+    def test_simple_requests_are_rejected(self) -> None:
+        status, _ = self.request("POST", "/rebuild", {"wait": False}, headers={"Content-Type": "text/plain"})
+        self.assertEqual(status, 415)
+        self.assertTrue(self.daemon.jobs.empty())
+
+    def test_invalid_paths_are_rejected(self) -> None:
+        for paths in (["../outside"], ["a/../../outside"], [".hidden/x"], "a", [1]):
+            with self.subTest(paths=paths):
+                status, _ = self.request("POST", "/rebuild", {"paths": paths, "wait": False})
+                self.assertEqual(status, 400)
+        self.assertTrue(self.daemon.jobs.empty())
+
+    def test_rebuild_is_queued(self) -> None:
+        status, body = self.request("POST", "/rebuild", {"paths": ["a/b/image.jpg", "new"], "wait": False})
+        self.assertEqual(status, 202)
+        self.assertEqual(body["queued"], ["/", "a/b"])
+        self.assertEqual(self.daemon.jobs.get_nowait().folders, [self.base, self.base + "a/b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
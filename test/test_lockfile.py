@@ -0,0 +1,137 @@
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from staticgallerybuilder.modules import lockfile
+from staticgallerybuilder.modules.lockfile import LockInfo, acquire_lock, holds_lock, read_lock, release_lock, remove_if_stale, write_lock
+
+
+def dead_pid() -> int:
+    """
+    Returns the process ID of a process that has exited.
+    """
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def remove_concurrently(path: str, barrier, results) -> None:
+    barrier.wait()
+    removed, _ = remove_if_stale(path)
+    results.put(removed)
+
+
+def acquire_concurrently(path: str, barrier, results) -> None:
+    barrier.wait()
+    taken, _, _ = acquire_lock(path)
+    results.put(taken)
+    # hold the lock until every process has tried
+    time.sleep(0.5)
+    if taken:
+        release_lock(path)
+
+
+class LockFileTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, ".lock")
+
+    def tearDown(self) -> None:
+        release_lock(self.path)
+        self.directory.cleanup()
+
+    def write(self, pid: int, host: str | None = None, heartbeat: float | None = None) -> None:
+        now = time.time()
+        write_lock(self.path, LockInfo(pid=pid, host=host or socket.gethostname(), started=now, heartbeat=now if heartbeat is None else heartbeat))
+
+    def test_acquire_and_release(self) -> None:
+        taken, owner, replaced = acquire_lock(self.path)
+        self.assertEqual((taken, owner, replaced), (True, None, False))
+        self.assertTrue(holds_lock(self.path))
+        info = read_lock(self.path)
+        assert info is not None
+        self.assertEqual(info.pid, os.getpid())
+        release_lock(self.path)
+        self.assertFalse(holds_lock(self.path))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_live_lock_is_kept(self) -> None:
+        self.write(os.getppid())
+        taken, owner, replaced = acquire_lock(self.path)
+        self.assertFalse(taken)
+        self.assertFalse(replaced)
+        assert owner is not None
+        self.assertEqual(owner.pid, os.getppid())
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_lock_of_exited_process_is_replaced(self) -> None:
+        pid = dead_pid()
+        self.write(pid)
+        taken, owner, replaced = acquire_lock(self.path)
+        self.assertTrue(taken)
+        self.assertTrue(replaced)
+        assert owner is not None
+        self.assertEqual(owner.pid, pid)
+
+    def test_lock_of_other_host_is_kept_while_refreshed(self) -> None:
+        self.write(dead_pid(), host="other-host")
+        taken, _, _ = acquire_lock(self.path)
+        self.assertFalse(taken)
+
+    def test_lock_of_other_host_is_replaced_without_heartbeat(self) -> None:
+        self.write(dead_pid(), host="other-host", heartbeat=time.time() - lockfile.STALE_AFTER - 1)
+        taken, _, replaced = acquire_lock(self.path)
+        self.assertTrue(taken)
+        self.assertTrue(replaced)
+
+    def test_lock_without_owner_is_replaced_by_age(self) -> None:
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("12345")
+        self.assertEqual(remove_if_stale(self.path), (False, None))
+        old = time.time() - lockfile.STALE_AFTER - 1
+        os.utime(self.path, (old, old))
+        self.assertEqual(remove_if_stale(self.path), (True, None))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_concurrent_removal_removes_once(self) -> None:
+        context = multiprocessing.get_context("fork")
+        for _ in range(5):
+            self.write(dead_pid())
+            barrier, results = context.Barrier(8), context.Queue()
+            processes = [context.Process(target=remove_concurrently, args=(self.path, barrier, results)) for _ in range(8)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            removed = [results.get(timeout=10) for _ in processes]
+            self.assertEqual(removed.count(True), 1)
+            self.assertNotIn(False, removed)
+            self.assertFalse(os.path.exists(self.path))
+
+    def test_concurrent_replacement_has_one_winner(self) -> None:
+        context = multiprocessing.get_context("fork")
+        for _ in range(5):
+            self.write(dead_pid())
+            barrier, results = context.Barrier(8), context.Queue()
+            processes = [context.Process(target=acquire_concurrently, args=(self.path, barrier, results)) for _ in range(8)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            self.assertEqual([results.get(timeout=10) for _ in processes].count(True), 1)
+            self.assertFalse(os.path.exists(self.path))
+
+    def test_lock_file_is_json(self) -> None:
+        acquire_lock(self.path)
+        with open(self.path, encoding="utf-8") as f:
+            self.assertEqual(set(json.load(f)), {"pid", "host", "started", "heartbeat"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import struct
+import tempfile
+import unittest
+from io import BytesIO
+
+from PIL import Image
+
+from staticgallerybuilder.modules.rawpreview import JPEG_LENGTH, JPEG_OFFSET, MAX_IFDS, ORIENTATION, SUB_IFDS, Preview, find_previews
+
+HEADERS = {"<": b"II*\x00", ">": b"MM\x00*"}
+LONG = 4
+
+
+def jpeg(width: int, height: int) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), "red").save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def ifd(order: str, entries: list[tuple[int, int]], following: int) -> bytes:
+    """
+    Returns an IFD of LONG tags with their values stored inline.
+    """
+    data = struct.pack(order + "H", len(entries))
+    for tag, value in sorted(entries):
+        data += struct.pack(order + "HHII", tag, LONG, 1, value)
+    return data + struct.pack(order + "I", following)
+
+
+def ifd_size(entries: int) -> int:
+    return 2 + 12 * entries + 4
+
+
+class FindPreviewsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "image.nef")
+        self.preview = jpeg(40, 30)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def write(self, data: bytes) -> None:
+        with open(self.path, "wb") as f:
+            f.write(data)
+
+    def write_tiff(self, order: str, extra: list[tuple[int, int]], following: int | None = None) -> int:
+        """
+        Writes a file with one IFD at offset 8 pointing to the preview, returns the preview offset.
+        """
+        entries = [(JPEG_OFFSET, 0), (JPEG_LENGTH, len(self.preview))] + extra
+        offset = 8 + ifd_size(len(entries))
+        entries[0] = (JPEG_OFFSET, offset)
+        self.write(HEADERS[order] + struct.pack(order + "I", 8) + ifd(order, entries, following or 0) + self.preview)
+        return offset
+
+    def test_preview_is_found(self) -> None:
+        for order in HEADERS:
+            with self.subTest(order=order):
+                offset = self.write_tiff(order, [(ORIENTATION, 6)])
+                self.assertEqual(find_previews(self.path), ([Preview(offset, len(self.preview), 40, 30)], 6))
+
+    def test_looping_ifd_chain_terminates(self) -> None:
+        offset = self.write_tiff("<", [], following=8)
+        self.assertEqual(find_previews(self.path), ([Preview(offset, len(self.preview), 40, 30)], None))
+
+    def test_looping_sub_ifds_terminate(self) -> None:
+        offset = self.write_tiff("<", [(SUB_IFDS, 8)])
+        self.assertEqual(find_previews(self.path), ([Preview(offset, len(self.preview), 40, 30)], None))
+
+    def test_long_ifd_chain_stops(self) -> None:
+        count = MAX_IFDS * 2
+        size = ifd_size(2)
+        offset = 8 + count * size
+        chain = b"".join(ifd("<", [(JPEG_OFFSET, offset), (JPEG_LENGTH, len(self.preview))], 8 + (i + 1) * size) for i in range(count))
+        self.write(HEADERS["<"] + struct.pack("<I", 8) + chain + self.preview)
+        previews, _ = find_previews(self.path)
+        self.assertEqual(len(previews), MAX_IFDS)
+
+    def test_truncated_ifd(self) -> None:
+        self.write_tiff("<", [(ORIENTATION, 6)])
+        with open(self.path, "rb") as f:
+            data = f.read()
+        for end in (10, 20, 8 + ifd_size(3) - 2):
+            with self.subTest(end=end):
+                self.write(data[:end])
+                self.assertEqual(find_previews(self.path)[0], [])
+
+    def test_ifd_beyond_end_of_file(self) -> None:
+        self.write(HEADERS["<"] + struct.pack("<I", 1 << 20))
+        self.assertEqual(find_previews(self.path), ([], None))
+
+    def test_truncated_preview(self) -> None:
+        self.write_tiff("<", [])
+        with open(self.path, "rb") as f:
+            data = f.read()
+        self.write(data[: len(data) - len(self.preview) + 12])
+        self.assertEqual(find_previews(self.path), ([], None))
+
+    def test_short_header(self) -> None:
+        for data in (b"", b"II", HEADERS["<"], HEADERS["<"] + b"\x08\x00"):
+            with self.subTest(data=data):
+                self.write(data)
+                self.assertEqual(find_previews(self.path), ([], None))
+
+    def test_not_a_tiff(self) -> None:
+        self.write(self.preview)
+        self.assertEqual(find_previews(self.path), ([], None))
+
+
+if __name__ == "__main__":
+    unittest.main()